@@ -2,24 +2,39 @@ from .common_base import (
     SocketType,
     ProtocolType,
     FormatType,
+    LocalCallPolicy,
+    BalancePolicy,
     RoutingSocketOptions,
     RoutingMessage,
     ServerMessage,
+    RpcError,
+    DeadlineExceeded,
+    ServerOverloaded,
+    ConnectionLost,
     SocketMetadataInfo,
+    WebSocketInfo,
     ApplicationInfo,
+    ClientHistoryInfo,
+    QueueInfo,
+    CacheInfo,
+    EndpointInfo,
     SchemaInfo,
     DYNAMIC_OBJECT,
     g_all_types,
     g_all_services,
     rpcclass,
+    register_all,
     assign_values,
     construct_item,
     get_class_string,
     get_simple_type,
+    is_stream_type,
+    get_endpoint,
     init,
     CommandLine,
     find,
     find_all,
+    group_by,
     is_number,
     ctrl_handler,
 )
@@ -27,34 +42,58 @@ from .routing_socket import RoutingSocket
 from .service_client import ServiceClient
 from .server_socket import ServerSocket
 from .client_socket import ClientSocket
+from .publish_socket import PublishSocket, SubscribeSocket
+from .web_server import WebServer
+from .response_cache import ResponseCache
+from .endpoint_pool import EndpointPool
 
 __all__ = [
     SocketType,
     ProtocolType,
     FormatType,
+    LocalCallPolicy,
+    BalancePolicy,
     RoutingSocketOptions,
     RoutingMessage,
     ServerMessage,
+    RpcError,
+    DeadlineExceeded,
+    ServerOverloaded,
+    ConnectionLost,
     SocketMetadataInfo,
+    WebSocketInfo,
     ApplicationInfo,
+    ClientHistoryInfo,
+    QueueInfo,
+    CacheInfo,
+    EndpointInfo,
     SchemaInfo,
     DYNAMIC_OBJECT,
     g_all_types,
     g_all_services,
     rpcclass,
+    register_all,
     assign_values,
     construct_item,
     get_class_string,
     get_simple_type,
+    is_stream_type,
+    get_endpoint,
     init,
     CommandLine,
     find,
     find_all,
+    group_by,
     is_number,
     ctrl_handler,
 
     ServerSocket,
     ClientSocket,
+    PublishSocket,
+    SubscribeSocket,
+    WebServer,
+    ResponseCache,
+    EndpointPool,
     RoutingSocket,
     ServiceClient,
 ]
@@ -5,14 +5,27 @@
 #           __init__
 #           connect
 #           send_norm
+#           send_call
 #           recv_norm
 #           recv_rev
 #           send_rev
+#           next_call
+#           open_stream
+#           recv_stream
+#           has_stream_frames
+#           close_stream
+#           resume
+#           _resume_session
+#           _set_reconnect
 #           _validate_client
 #           _track_client
 #           _recv_norm_step
 #           _recv_rev_step
+#           _route_stream
+#           _is_call_response
 #           _get_buffer
+#           _is_same_host
+#           _get_peer_prefix
 #           add_metadata
 #           is_validated
 #           wait
@@ -25,9 +38,21 @@ import threading
 import zmq
 import zmq.utils.monitor
 import time
+import uuid
 import socket as _socket
 import struct
-from .common_base import ServerMessage, SocketMetadataInfo
+from collections import deque
+from typing import Dict
+from .common_base import (
+    ServerMessage,
+    SocketMetadataInfo,
+    RoutingSocketOptions,
+    ProtocolType,
+    split_call_headers,
+    get_endpoint,
+    g_process_token,
+)
+from .shared_buffer import SharedBufferPool, get_segment_prefix, get_missing_reply
 
 
 class ClientSocket:
@@ -35,6 +60,7 @@ class ClientSocket:
     ip_address: str
     port: int
     port_rev: int
+    protocol: ProtocolType
     socket_name: str
     server_signature: bytes
     server_signature_rev: bytes
@@ -44,6 +70,10 @@ class ClientSocket:
     is_connected: bool
     is_validated_: bool
     is_lost: bool
+    needs_resume: bool
+    reconnect_timeout: float
+    lost_deadline: float
+    resumed_count: int
     client_errors: str
     metadata: SocketMetadataInfo
     server_metadata: SocketMetadataInfo
@@ -53,14 +83,23 @@ class ClientSocket:
     zmq_monitor: zmq.Socket
     zmq_monitor_thread: threading.Thread
     request_lock: threading.Lock
+    pending_call_: list | None
     norm_messages_: list[bytes]
+    queued_norm_: deque[list[bytes]]
     rev_messages_: list[bytes]
-
-    def __init__(self, ip_address, port, port_rev, socket_name):
+    streams_: Dict[int, deque]
+    next_stream_id: int
+    next_call_id: int
+    send_hwm: int
+    recv_hwm: int
+    shared_buffers: SharedBufferPool
+
+    def __init__(self, ip_address, port, port_rev, socket_name, options: RoutingSocketOptions = None):
         self.client_id = 0
         self.ip_address = ip_address
         self.port = port
         self.port_rev = port_rev
+        self.protocol = options.protocol if options else ProtocolType.TCP
         self.socket_name = socket_name
         self.server_signature = b'server:0'
         self.server_signature_rev = b'rev:server:0'
@@ -70,6 +109,10 @@ class ClientSocket:
         self.is_connected = False
         self.is_validated_ = False
         self.is_lost = False
+        self.needs_resume = False
+        self.reconnect_timeout = options.reconnect_timeout if options else 0
+        self.lost_deadline = 0
+        self.resumed_count = 0
         self.client_errors = ''
         self.metadata = SocketMetadataInfo(
             client_id=None,
@@ -82,6 +125,7 @@ class ClientSocket:
             start_time=datetime.datetime.now().isoformat(),
             client_signature=None,
             client_signature_rev=None,
+            process_token=g_process_token,
         )
         self.server_metadata = None
         self.zmq_context = None
@@ -90,8 +134,19 @@ class ClientSocket:
         self.zmq_monitor = None
         self.zmq_monitor_thread = None
         self.request_lock = threading.Lock()
+        self.pending_call_ = None
         self.norm_messages_ = []
+        self.queued_norm_ = deque()
         self.rev_messages_ = []
+        self.streams_ = {}
+        self.next_stream_id = 0
+        self.next_call_id = 0
+        self.send_hwm = options.send_hwm if options else 1000
+        self.recv_hwm = options.recv_hwm if options else 1000
+        self.shared_buffers = SharedBufferPool(
+            options.shared_memory_threshold if options else 0,
+            options.shared_memory_ttl if options else 60.0,
+        )
 
     def connect(self):
         assert not self.is_validated_
@@ -99,14 +154,24 @@ class ClientSocket:
         self.zmq_context = zmq.Context.instance()
 
         zmq_client = self.zmq_context.socket(zmq.ROUTER)
-        zmq_client.connect(f'tcp://{self.ip_address}:{self.port}')
+        # Fixed identity, the server knows the socket again after ZMQ reconnects it
+        zmq_client.set(zmq.IDENTITY, f'client:{uuid.uuid4().hex}'.encode())
+        zmq_client.set(zmq.SNDHWM, self.send_hwm)
+        zmq_client.set(zmq.RCVHWM, self.recv_hwm)
+        self._set_reconnect(zmq_client)
 
         self.zmq_client = zmq_client
         self.zmq_client_rev = None
+        # Monitor is attached before connecting, otherwise the handshake event can be missed
         self.zmq_monitor = zmq_client.get_monitor_socket(zmq.Event.HANDSHAKE_SUCCEEDED | zmq.Event.DISCONNECTED)
         self.zmq_monitor_thread = threading.Thread(target=self._track_client)
         self.zmq_monitor_thread.start()
 
+        zmq_client.connect(get_endpoint(self.protocol, self.ip_address, self.port))
+        # No handshake events are reported for inproc pipes
+        if self.protocol == ProtocolType.INPROC:
+            self.is_connected = True
+
         while self.is_alive and not self.is_connected:
             time.sleep(0.1)
         if not self.is_alive:
@@ -144,7 +209,10 @@ class ClientSocket:
 
         zmq_client_rev = self.zmq_context.socket(zmq.ROUTER)
         zmq_client_rev.set(zmq.IDENTITY, self.client_signature_rev)
-        zmq_client_rev.connect(f'tcp://{self.ip_address}:{self.port_rev}')
+        zmq_client_rev.set(zmq.SNDHWM, self.send_hwm)
+        zmq_client_rev.set(zmq.RCVHWM, self.recv_hwm)
+        self._set_reconnect(zmq_client_rev)
+        zmq_client_rev.connect(get_endpoint(self.protocol, self.ip_address, self.port_rev))
 
         self.zmq_client_rev = zmq_client_rev
                 
@@ -170,29 +238,58 @@ class ClientSocket:
 
     def send_norm(self, request):
         assert self.zmq_client_rev is not None
+        name, buffer = self._get_buffer(request[0]), self._get_buffer(request[1])
+        if self._is_same_host():
+            name, buffer = self.shared_buffers.put(name, buffer)
         req = [
             self.server_signature,
-            self._get_buffer(request[0]),
-            self._get_buffer(request[1]),
+            name,
+            buffer,
         ]
         assert len(req) == 3
         self.zmq_client.send_multipart(req)
 
-    def recv_norm(self):
+    def send_call(self, request):
+        """send_norm for calls, the request is sent again when the session resumes before the response."""
+        self.pending_call_ = request
+        if not self.needs_resume:
+            self.send_norm(request)
+
+    def recv_norm(self, call_id=0, deadline=0):
+        """Response of a call as [name, payload], None when the deadline passes or the server is lost first.
+
+        Late responses of calls that already gave up are dropped here.
+        """
         # See also: resp = self.zmq_client.recv_multipart()
         resp = None
-        while self.is_alive:
-            resp = self._recv_norm_step()
+        while self.is_alive and not self.is_lost:
+            timeout_ms = 100
+            if deadline:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    self.pending_call_ = None
+                    return None
+                timeout_ms = min(timeout_ms, max(int(remaining * 1000), 1))
+            if self.needs_resume and not self._resume_session():
+                time.sleep(0.005)
+                continue
+            # Responses already read while resuming the session come first
+            resp = self.queued_norm_.popleft() if self.queued_norm_ else self._recv_norm_step(timeout_ms)
             if resp is None:
                 continue
+            if self._route_stream(resp):
+                continue
+            if not self._is_call_response(resp, call_id):
+                continue
             break
-        if not self.is_alive:
+        self.pending_call_ = None
+        if not (self.is_alive and not self.is_lost):
             return None
         assert len(resp) == 3
         assert resp[2] != b'null', 'Invalid null response'
         # TODO: getting empty buffer when client is lost
         assert resp[2][0] == b'{'[0] or resp[2][0] == b'['[0], f'Invalid json: {resp[2]}'
-        return resp[2]
+        return resp[1:3]
 
     def recv_rev(self, timeout_seconds=0):
         if not self.is_validated_:
@@ -225,13 +322,104 @@ class ClientSocket:
     def send_rev(self, response):
         assert self.zmq_client_rev is not None
         assert len(response) == 2
+        name, buffer = self._get_buffer(response[0]), self._get_buffer(response[1])
+        if self._is_same_host():
+            name, buffer = self.shared_buffers.put(name, buffer)
         resp = [
             self.server_signature_rev,
-            self._get_buffer(response[0]),
-            self._get_buffer(response[1])
+            name,
+            buffer
         ]
         self.zmq_client_rev.send_multipart(resp)
 
+    def next_call(self):
+        self.next_call_id += 1
+        return self.next_call_id
+
+    def open_stream(self):
+        self.next_stream_id += 1
+        self.streams_[self.next_stream_id] = deque()
+        return self.next_stream_id
+
+    def recv_stream(self, stream_id):
+        """Next frame of a stream, frames of other streams are queued into their own inboxes."""
+        inbox = self.streams_[stream_id]
+        while self.is_alive and not inbox:
+            resp = self._recv_norm_step()
+            if resp is None:
+                continue
+            if not self._route_stream(resp):
+                # print(f'Unexpected message on stream: {resp[1]}')
+                # Call response read by the stream reader, kept for the waiting call
+                self.queued_norm_.append(resp)
+        if not inbox:
+            return None
+        return inbox.popleft()
+
+    def has_stream_frames(self, stream_id):
+        return bool(self.streams_.get(stream_id))
+
+    def close_stream(self, stream_id):
+        self.streams_.pop(stream_id, None)
+
+    def resume(self):
+        """Resumes the session of an idle socket, calls in progress resume it themselves."""
+        if not self.needs_resume or not self.request_lock.acquire(blocking=False):
+            return
+        try:
+            self._resume_session()
+        finally:
+            self.request_lock.release()
+
+    def _resume_session(self):
+        """Asks the server for the session of this client id, True when resumed.
+
+        The caller holds the request lock. A call waiting for its response is sent again, unless
+        the response was already on its way when the connection dropped.
+        """
+        if not self.is_connected or not self.is_alive:
+            return False
+        self.needs_resume = False
+        self.zmq_client.send_multipart([
+            self.server_signature,
+            ServerMessage.ResumeClient,
+            json.dumps({'client_id': self.client_id}).encode()
+        ])
+        started = time.time()
+        pending_id = int(split_call_headers(self._get_buffer(self.pending_call_[0]).decode())[1].get('id', 0)) \
+            if self.pending_call_ else None
+        has_response = False
+        while self.is_alive and not self.needs_resume:
+            resp = self._recv_norm_step()
+            if resp is None:
+                if time.time() - started > 1.0:
+                    self.needs_resume = True
+                continue
+            if self._route_stream(resp):
+                continue
+            if resp[1] != ServerMessage.ClientResumed:
+                # Sent before the connection dropped, kept when the waiting call is answered
+                if pending_id is not None and resp[1].startswith((b'response:', b'error:')) and \
+                        self._is_call_response(resp, pending_id):
+                    self.queued_norm_.append(resp)
+                    has_response = True
+                continue
+            if json.loads(resp[2].decode())['client_id'] != self.client_id:
+                self.client_errors += '\nSession not resumed'
+                self.is_lost = True
+                return False
+            self.resumed_count += 1
+            if self.pending_call_ and not has_response:
+                self.send_norm(self.pending_call_)
+            return True
+        return False
+
+    def _set_reconnect(self, zmq_socket: zmq.Socket):
+        if self.reconnect_timeout > 0:
+            # Short first retry after a blip, backing off to one second while the server is down
+            zmq_socket.set(zmq.RECONNECT_IVL, 10)
+            zmq_socket.set(zmq.RECONNECT_IVL_MAX, 1000)
+
     def _validate_client(self, req):
         assert req[0] == self.server_signature_rev
         req2 = json.loads(req[2].decode())
@@ -249,6 +437,9 @@ class ClientSocket:
     def _track_client(self):
         time.sleep(0.1)
         while self.is_alive:
+            if self.needs_resume and not self.is_connected and time.time() > self.lost_deadline:
+                self.is_lost = True
+                self.client_errors += '\nClient not reconnected'
             parts = []
             try:
                 part = self.zmq_monitor.recv(zmq.DONTWAIT, copy=True, track=False)
@@ -256,7 +447,7 @@ class ClientSocket:
             except zmq.error.Again:
                 pass
             if not parts or not parts[0]:
-                time.sleep(0.1)
+                self.zmq_monitor.poll(100)
                 continue
             while self.zmq_monitor.getsockopt(zmq.RCVMORE):
                 part = self.zmq_monitor.recv(0, copy=True, track=False)
@@ -267,8 +458,15 @@ class ClientSocket:
             elif event_id == zmq.Event.HANDSHAKE_SUCCEEDED:
                 self.is_connected = True
             elif event_id == zmq.Event.DISCONNECTED:
-                self.is_lost = True
-                self.client_errors += '\nClient disconnected'
+                if self.reconnect_timeout > 0 and self.is_validated_ and not self.is_lost:
+                    # ZMQ reconnects on its own, the session is resumed by the next call
+                    self.is_connected = False
+                    self.lost_deadline = time.time() + self.reconnect_timeout
+                    self.needs_resume = True
+                    self.client_errors += '\nClient disconnected, reconnecting'
+                else:
+                    self.is_lost = True
+                    self.client_errors += '\nClient disconnected'
 
             # print(
             #     'MONITOR',
@@ -277,12 +475,12 @@ class ClientSocket:
             #     parts[1]
             # )
 
-    def _recv_norm_step(self):
+    def _recv_norm_step(self, timeout_ms=100):
         ready = False
         ready_timeout = False
 
         while self.is_alive:
-            self.zmq_client.setsockopt(zmq.RCVTIMEO, 100)
+            self.zmq_client.setsockopt(zmq.RCVTIMEO, timeout_ms)
             msg = None
             try:
                 msg = self.zmq_client.recv()
@@ -313,7 +511,11 @@ class ClientSocket:
         assert len(messages) == 3
         assert messages[0] == self.server_signature, \
             f'Recv_wait_norm signature mismatch: {messages[0]}, {self.server_signature}'
-        return messages
+        resp = self.shared_buffers.load(messages, self._get_peer_prefix())
+        if resp is None:
+            # The waiting call fails instead of running into its deadline
+            return [messages[0], *get_missing_reply(messages[1])]
+        return resp
     
     def _recv_rev_step(self):
         ready = False
@@ -351,7 +553,26 @@ class ClientSocket:
         assert len(messages) == 3
         assert messages[0] == self.server_signature_rev, \
             f'Recv_wait_rev signature mismatch: {messages[0]}, {self.server_signature_rev}'
-        return messages
+        resp = self.shared_buffers.load(messages, self._get_peer_prefix())
+        if resp is None:
+            self.send_rev(get_missing_reply(messages[1]))
+        return resp
+
+    def _route_stream(self, resp):
+        if resp[1] not in [ServerMessage.StreamData, ServerMessage.StreamCredit, ServerMessage.StreamEnd]:
+            return False
+        payload = json.loads(resp[2].decode())
+        inbox = self.streams_.get(payload['stream_id'])
+        if inbox is not None:
+            inbox.append([resp[1], payload])
+        return True
+
+    def _is_call_response(self, resp, call_id):
+        _, headers = split_call_headers(resp[1].decode())
+        is_match = int(headers.get('id', 0)) == call_id
+        # if not is_match:
+        #     print(f'Stale response dropped: {resp[1]}')
+        return is_match
 
     def _get_buffer(self, value):
         if isinstance(value, str):
@@ -363,6 +584,15 @@ class ClientSocket:
         else:
             return value
 
+    def _is_same_host(self):
+        return bool(self.server_metadata) and self.server_metadata.get('host') == self.metadata['host']
+
+    def _get_peer_prefix(self):
+        """Segment prefix of the server when it is on this host."""
+        if not self._is_same_host():
+            return None
+        return get_segment_prefix(self.server_metadata.get('process_token'))
+
     def add_metadata(self, obj: dict[str, any]):
         for key, value in obj.items():
             self.metadata[key] = value
@@ -402,4 +632,5 @@ class ClientSocket:
                 except:  # noqa
                     pass
 
+        self.shared_buffers.close()
         self.zmq_context = None
\ No newline at end of file
@@ -4,12 +4,18 @@
 #       SocketType
 #       ProtocolType
 #       FormatType
+#       LocalCallPolicy
+#       BalancePolicy
 #       RoutingSocketOptions
 #       ServerMessage
 #       RoutingMessage
 #       WebSocketInfo
 #       SocketMetadataInfo
 #       ClientInfo
+#       ClientHistoryInfo
+#       QueueInfo
+#       CacheInfo
+#       EndpointInfo
 #       ApplicationInfo
 #       SchemaInfo
 #       FieldType
@@ -20,10 +26,23 @@
 #       ClassInfo
 #       ServiceInfo
 #       ServerInfo
+#       DispatchInfo
+#       CallInfo
+#       StreamInfo
+#       RpcError
+#       DeadlineExceeded
+#       ServerOverloaded
+#       ConnectionLost
+#       ClassRegistry
 #
 #       g_all_types
 #       g_all_services
+#       g_pending_classes
+#       g_declared_classes
+#       g_process_token
 #       register_class
+#       register_pending
+#       register_all
 #       ClassManager
 #       rpcclass
 #       construct_item
@@ -32,22 +51,36 @@
 #       assign_values
 #       get_class_string
 #       get_simple_type
+#       is_stream_type
+#       split_call_headers
+#       join_call_headers
+#       get_call_deadline
+#       get_endpoint
+#       get_schema_hash
 #
 #       init
 #       CommandLine
 #       is_number
 #       find
 #       find_all
+#       group_by
 #       check_serializable
 #       ctrl_handler
 #
 import os
 import sys
+import time
+import tempfile
+import uuid
 import inspect
 import json
+import hashlib
 import datetime
+import queue
+import threading
+import collections.abc
 from dataclasses import dataclass, field
-from typing import Dict, TypedDict, Type, get_args
+from typing import Dict, TypedDict, Type, Iterator, get_args, get_origin
 from enum import Enum
 
 
@@ -60,6 +93,8 @@ class ProtocolType(Enum):
     TCP = 1
     WS = 2
     HTTP = 3
+    IPC = 4
+    INPROC = 5
 
 
 class FormatType(Enum):
@@ -67,6 +102,22 @@ class FormatType(Enum):
     JSON = 2
 
 
+class LocalCallPolicy(Enum):
+    """Opt-in direct calls to a server of the same process.
+
+    Handlers then run on the calling threads, without the work queue, response cache or
+    coalescing of the server.
+    """
+    DISABLED = 1
+    COPY = 2
+    SHARE = 3
+
+
+class BalancePolicy(Enum):
+    LEAST_OUTSTANDING = 1
+    LATENCY = 2
+
+
 @dataclass
 class RoutingSocketOptions:
     type: SocketType
@@ -75,6 +126,24 @@ class RoutingSocketOptions:
     types: list = field(default_factory=list)
     name: str = ''
     port: int = 0
+    liveness_interval: float = 1.0
+    lost_client_max_age: float = 300.0
+    lost_client_max_count: int = 1000
+    lost_client_max_memory: int = 16 * 1024 * 1024
+    client_history_size: int = 100
+    call_timeout: float = 0
+    send_hwm: int = 1000
+    recv_hwm: int = 1000
+    work_queue_size: int = 1000
+    max_streams: int = 64
+    local_call_policy: LocalCallPolicy = LocalCallPolicy.DISABLED
+    shared_memory_threshold: int = 0
+    shared_memory_ttl: float = 60.0
+    max_message_size: int = 64 * 1024 * 1024
+    client_cache_size: int = 0
+    balance_policy: BalancePolicy = BalancePolicy.LEAST_OUTSTANDING
+    reconnect_timeout: float = 0
+    enable_publish: bool = False
 
 
 class ServerMessage:
@@ -83,16 +152,32 @@ class ServerMessage:
     ValidateClient = b'ServerMessage.ValidateClient'
     ClientValidated = b'ServerMessage.ClientValidated'
     ForwardCall = b'ServerMessage.ForwardCall'
+    StreamOpen = b'ServerMessage.StreamOpen'
+    StreamData = b'ServerMessage.StreamData'
+    StreamCredit = b'ServerMessage.StreamCredit'
+    StreamEnd = b'ServerMessage.StreamEnd'
+    StreamCancel = b'ServerMessage.StreamCancel'
+    ResumeClient = b'ServerMessage.ResumeClient'
+    ClientResumed = b'ServerMessage.ClientResumed'
 
 
 class RoutingMessage:
     GetAppInfo = 'RoutingMessage.GetAppInfo'
     GetSchema = 'RoutingMessage.GetSchema'
     SetSchema = 'RoutingMessage.SetSchema'
+    InvalidateCache = 'RoutingMessage.InvalidateCache'
 
 
+@dataclass
 class WebSocketInfo:
-    pass
+    connection_id: int
+    remote_address: str
+    path: str
+    connect_time: datetime.datetime
+    received_count: int = 0
+    sent_count: int = 0
+    is_closed: bool = False
+    writer: any = None
 
 
 class SocketMetadataInfo(TypedDict):
@@ -109,6 +194,8 @@ class SocketMetadataInfo(TypedDict):
     client_signature_rev: str
     server_signature: str
     server_signature_rev: str
+    process_token: str
+    schema_hash: str
 
 
 @dataclass
@@ -120,6 +207,46 @@ class ClientInfo:
     connect_time: datetime.datetime
     is_validated: bool
     is_lost: bool
+    lost_time: float = 0
+    metadata_size: int = 0
+
+
+class ClientHistoryInfo(TypedDict):
+    client_id: int
+    socket_name: str
+    host: str
+    connect_time: str
+    lost_time: str
+
+
+class QueueInfo(TypedDict):
+    queue_size: int
+    queue_depth: int
+    max_depth: int
+    accepted: int
+    rejected: int
+    expired: int
+    coalesced: int
+
+
+class CacheInfo(TypedDict):
+    method_name: str
+    cache_size: int
+    cache_ttl: float
+    count: int
+    hits: int
+    misses: int
+
+
+class EndpointInfo(TypedDict):
+    ip_address: str
+    port: int
+    is_healthy: bool
+    outstanding: int
+    latency_ms: float
+    calls: int
+    errors: int
+    ejected: int
 
 
 class ApplicationInfo(TypedDict):
@@ -143,6 +270,9 @@ class ApplicationInfo(TypedDict):
     client_count: int
     clients: list[AppClientInfo]
     client_ids: list[int]
+    client_history: list[ClientHistoryInfo]
+    queue: QueueInfo
+    caches: list[CacheInfo]
     socket_name: str
     ip_address: str
     port: int
@@ -181,6 +311,9 @@ class SchemaInfo(TypedDict):
         response_type: str
         id_value: int
         local: bool
+        server_stream: bool
+        client_stream: bool
+        cache_ttl: float
         method_errors: str
 
     class SchemaClientInfo(TypedDict):
@@ -208,6 +341,9 @@ class SchemaInfo(TypedDict):
     clients: list[SchemaClientInfo]
     servers: list[SchemaServerInfo]
     socket_name: str
+    schema_hash: str
+    total_types: int
+    total_services: int
 
 
 class FieldType(Enum):
@@ -255,14 +391,26 @@ class MethodInfo:
     response_type: str
     id_value: int
     local: bool
+    server_stream: bool
+    client_stream: bool
+    cache_ttl: float
+    cache_size: int
+    coalesce: bool
     method_errors: str
 
-    def __init__(self, method_name, request_type, response_type, id_value, local):
+    def __init__(
+            self, method_name, request_type, response_type, id_value, local,
+            server_stream=False, client_stream=False, cache_ttl=0, cache_size=0, coalesce=False):
         self.method_name = method_name
         self.request_type = request_type
         self.response_type = response_type
         self.id_value = id_value
         self.local = local
+        self.server_stream = server_stream
+        self.client_stream = client_stream
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self.coalesce = coalesce
         self.method_errors = ''
 
 
@@ -313,8 +461,162 @@ class ServerInfo:
         self.server_errors = ''
 
 
-g_all_types: Dict[str, ClassInfo] = {}
-g_all_services: Dict[str, ServiceInfo] = {}
+class DispatchInfo:
+    """Ready to run 'Service.Method' of a server, built when the schema changes instead of per call.
+
+    Methods that cannot be invoked have no handler, they answer with 'empty_response'.
+    """
+    method_name: str
+    handler: any
+    request_type: str
+    response_type: str
+    request_clazz: type | None
+    response_list: bool
+    is_stream: bool
+    empty_response: dict | list | None
+
+    def __init__(
+            self, method_name, handler, request_type='', response_type='', request_clazz=None,
+            is_stream=False, empty_response=None):
+        self.method_name = method_name
+        self.handler = handler
+        self.request_type = request_type
+        self.response_type = response_type
+        self.request_clazz = request_clazz
+        self.response_list = response_type.endswith('[]')
+        self.is_stream = is_stream
+        self.empty_response = empty_response
+
+    def decode(self, request_data):
+        data_obj = self.request_clazz()
+        assign_values(self.request_type, data_obj, request_data, 0)
+        return data_obj
+
+    def encode(self, result_obj):
+        result_data = [] if self.response_list else {}
+        assign_values(self.response_type, result_obj, result_data, 1)
+        return result_data
+
+
+class CallInfo:
+    """Ready to call 'Service.Method' of the server, built once per schema version instead of per call.
+
+    Methods missing from the schema, RoutingMessage ones included, have no method info and are sent untyped.
+    """
+    method_name: str
+    method_info: MethodInfo | None
+    request_info: ClassInfo | None
+    response_info: ClassInfo | None
+    cache: any
+    schema_version: int
+
+    def __init__(self, method_name, method_info, request_info, response_info, cache, schema_version):
+        self.method_name = method_name
+        self.method_info = method_info
+        self.request_info = request_info
+        self.response_info = response_info
+        self.cache = cache
+        self.schema_version = schema_version
+
+
+class StreamInfo:
+    stream_id: int
+    client_id: int
+    method_name: str
+    response_type: str
+    generator: Iterator | None
+    credit: int
+    count: int
+    window: int
+    consumed: int
+    requests: queue.Queue | None
+    condition: threading.Condition
+    thread: threading.Thread | None
+    is_cancelled: bool
+
+    def __init__(self, stream_id, client_id, method_name, response_type, generator, credit):
+        self.stream_id = stream_id
+        self.client_id = client_id
+        self.method_name = method_name
+        self.response_type = response_type
+        self.generator = generator
+        self.credit = credit
+        self.count = 0
+        self.window = credit
+        self.consumed = 0
+        self.requests = None
+        self.condition = threading.Condition()
+        self.thread = None
+        self.is_cancelled = False
+
+
+class RpcError(Exception):
+    """Error reported by the remote side of a call or stream."""
+    pass
+
+
+class DeadlineExceeded(RpcError, TimeoutError):
+    """Call did not complete before its deadline."""
+    pass
+
+
+class ServerOverloaded(RpcError):
+    """Call was rejected because the server work queue is full."""
+    pass
+
+
+class ConnectionLost(RpcError, ConnectionError):
+    """Connection to the server was lost before the call completed."""
+    pass
+
+
+class ClassRegistry(dict):
+    """Registered types or services.
+
+    Classes declared with rpcclass are only inspected when they are first looked up, importing
+    a large model package registers nothing. Listing the registry registers all of them.
+    """
+    def __missing__(self, key):
+        if register_pending(key) and dict.__contains__(self, key):
+            return dict.__getitem__(self, key)
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return dict.__contains__(self, key) or \
+            (key in g_pending_classes and register_pending(key) and dict.__contains__(self, key))
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def __iter__(self):
+        register_all()
+        return dict.__iter__(self)
+
+    def __len__(self):
+        register_all()
+        return dict.__len__(self)
+
+    def keys(self):
+        register_all()
+        return dict.keys(self)
+
+    def values(self):
+        register_all()
+        return dict.values(self)
+
+    def items(self):
+        register_all()
+        return dict.items(self)
+
+
+g_all_types: Dict[str, ClassInfo] = ClassRegistry()
+g_all_services: Dict[str, ServiceInfo] = ClassRegistry()
+# Declared classes not registered yet, by name
+g_pending_classes: Dict[str, list] = {}
+# Every class declared with rpcclass, by name
+g_declared_classes: Dict[str, list] = {}
+g_register_lock = threading.RLock()
+g_process_token = f'{os.getpid()}:{uuid.uuid4().hex}'
 
 g_all_types[DYNAMIC_OBJECT] = ClassInfo(
     type_name=DYNAMIC_OBJECT,
@@ -370,7 +672,10 @@ def register_class(clazz: Type, pending_fields: dict):
         )
 
     else:
-        for key, id_value in pending_fields.items():
+        for key, method_value in pending_fields.items():
+            # Either the id or the method options, e.g. {'id': 1, 'cache_ttl': 5.0, 'coalesce': True}
+            method_options = method_value if isinstance(method_value, dict) else {'id': method_value}
+            assert 'id' in method_options, f'Missing method id! {type_name}.{key}'
             if key not in missing_methods:
                 assert key in missing_methods, f'Duplicate method description! {type_name}.{key}'
             missing_methods.remove(key)
@@ -379,10 +684,12 @@ def register_class(clazz: Type, pending_fields: dict):
             params = sig.parameters
             req_type = None
             ret_type = None
+            client_stream = False
             for param_name, param_info in params.items():
                 if param_name == 'self':
                     continue
                 req_type = get_simple_type(param_info.annotation)
+                client_stream = is_stream_type(param_info.annotation)
                 req_type_nl = req_type[0: len(req_type) - 2] if req_type.endswith('[]') else req_type
                 assert req_type_nl in g_all_types, \
                     f'Unknown parameter type! {req_type}'
@@ -395,8 +702,13 @@ def register_class(clazz: Type, pending_fields: dict):
                 method_name=key,
                 request_type=req_type,
                 response_type=ret_type,
-                id_value=id_value,
-                local=True
+                id_value=int(method_options['id']),
+                local=True,
+                server_stream=is_stream_type(sig.return_annotation),
+                client_stream=client_stream,
+                cache_ttl=float(method_options.get('cache_ttl', 0)),
+                cache_size=int(method_options.get('cache_size', 1000)),
+                coalesce=bool(method_options.get('coalesce', False)),
             )
 
         assert len(missing_methods) == 0, f'Undeclared methods! {type_name}, {missing_methods}'
@@ -409,13 +721,37 @@ def register_class(clazz: Type, pending_fields: dict):
         )
 
 
+def register_pending(type_name):
+    """Registers the declared class of that name, False when there is none."""
+    with g_register_lock:
+        pending = g_pending_classes.pop(type_name, None)
+        if pending is None:
+            return dict.__contains__(g_all_types, type_name) or dict.__contains__(g_all_services, type_name)
+        register_class(pending[0], pending[1])
+        return True
+
+
+def register_all():
+    """Registers every declared class, e.g. to report declaration errors at startup."""
+    while g_pending_classes:
+        with g_register_lock:
+            type_name = next(iter(g_pending_classes), None)
+            if type_name is not None:
+                register_pending(type_name)
+
+
 class ClassManager():
     def __init__(self, fields: Dict):
         self.pending_fields_ = fields
 
     def __call__(self, clazz):
         clazz = dataclass(clazz)
-        register_class(clazz, self.pending_fields_)
+        type_name = clazz.__name__
+        assert type_name not in g_pending_classes and \
+            not dict.__contains__(g_all_types, type_name) and \
+            not dict.__contains__(g_all_services, type_name), f'Duplicate type: {type_name}'
+        g_pending_classes[type_name] = [clazz, self.pending_fields_]
+        g_declared_classes[type_name] = g_pending_classes[type_name]
         return clazz
 
 
@@ -616,8 +952,10 @@ def get_class_string(type_name, obj_data):
 
 
 def get_simple_type(item):
-    """Converts 'list[X]' into 'X[]'."""
-    if item.__name__ == 'list' and \
+    """Converts 'list[X]' into 'X[]' and 'Iterator[X]' into 'X'."""
+    if is_stream_type(item):
+        return get_simple_type(get_args(item)[0])
+    elif item.__name__ == 'list' and \
             len(get_args(item)) == 1:
         return f'{get_args(item)[0].__name__}[]'
     elif item.__name__ == '_empty':
@@ -626,6 +964,70 @@ def get_simple_type(item):
         return item.__name__
 
 
+def is_stream_type(item):
+    """Streamed values are declared as 'Iterator[X]', 'Iterable[X]' or 'Generator[X, ...]'."""
+    return get_origin(item) in [
+        collections.abc.Iterator,
+        collections.abc.Iterable,
+        collections.abc.Generator,
+    ] and len(get_args(item)) > 0
+
+
+def split_call_headers(text: str):
+    """Splits 'Service.Method;id=1;timeout=250' into the method name and its headers."""
+    if ';' not in text:
+        return text, {}
+    parts = text.split(';')
+    headers = {}
+    for item in parts[1:]:
+        key, _, value = item.partition('=')
+        headers[key] = value
+    return parts[0], headers
+
+
+def join_call_headers(name: str, headers: dict):
+    if not headers:
+        return name
+    return name + ''.join(f';{key}={value}' for key, value in headers.items())
+
+
+def get_call_deadline(headers: dict, arrival_time: float):
+    """Absolute deadline of a received call, 0 when the caller did not set one."""
+    timeout = headers.get('timeout', '')
+    # Malformed values from a peer count as no deadline
+    if not timeout.isdigit():
+        return 0
+    return arrival_time + int(timeout) / 1000
+
+
+def get_endpoint(protocol: ProtocolType, ip_address: str, port: int):
+    """ZMQ endpoint of a channel, IPC and inproc endpoints are named after the port."""
+    if protocol == ProtocolType.IPC:
+        return f'ipc://{os.path.join(tempfile.gettempdir(), f"nrpc-{port}")}'
+    elif protocol == ProtocolType.INPROC:
+        return f'inproc://nrpc-{port}'
+    else:
+        return f'tcp://{ip_address}:{port}'
+
+
+def get_schema_hash(types: Dict[str, ClassInfo], services: Dict[str, ServiceInfo]):
+    """Fingerprint of everything the schema sync exchanges, equal on both sides when there is nothing to sync."""
+    schema = [
+        sorted(
+            [type_name, sorted([x.field_name, x.field_type, x.id_value] for x in type_info.fields.values())]
+            for type_name, type_info in types.items()
+        ),
+        sorted(
+            [service_name, sorted([
+                x.method_name, x.request_type, x.response_type, x.id_value,
+                x.server_stream, x.client_stream, x.cache_ttl
+            ] for x in service_info.methods.values())]
+            for service_name, service_info in services.items()
+        ),
+    ]
+    return hashlib.sha256(json.dumps(schema).encode()).hexdigest()
+
+
 def init():
     """Initialize NPRC library"""
     pass
@@ -693,6 +1095,14 @@ def find_all(iterable, function):
     return result
 
 
+def group_by(iterable, function):
+    """Items by key in one pass, lookups instead of a find_all per key."""
+    result = {}
+    for item in iterable:
+        result.setdefault(function(item), []).append(item)
+    return result
+
+
 def check_serializable(data):
     try:
         json.dumps(data)
@@ -0,0 +1,129 @@
+#
+#   Contents:
+#
+#       PoolEndpoint
+#           __init__
+#           is_healthy
+#
+#       EndpointPool
+#           __init__
+#           pick
+#           server_call
+#           get_endpoint_info
+#           close
+#
+import time
+import threading
+from typing import Any
+from .common_base import BalancePolicy, EndpointInfo, ConnectionLost
+
+
+class PoolEndpoint:
+    ip_address: str
+    port: int
+    socket: Any
+    outstanding: int
+    latency: float
+    call_count: int
+    error_count: int
+    ejected_count: int
+    was_healthy: bool
+
+    def __init__(self, ip_address, port, socket):
+        self.ip_address = ip_address
+        self.port = port
+        self.socket = socket
+        self.outstanding = 0
+        self.latency = 0.0
+        self.call_count = 0
+        self.error_count = 0
+        self.ejected_count = 0
+        self.was_healthy = False
+
+    def is_healthy(self):
+        """Validated and not reported as disconnected by the socket monitor, until the session resumes."""
+        client_socket = self.socket.client_socket
+        return self.socket.is_ready and client_socket is not None and \
+            not client_socket.is_lost and not client_socket.needs_resume
+
+
+class EndpointPool:
+    """Connections to every server of a stateless service, calls go to the best healthy one.
+
+    LEAST_OUTSTANDING picks the endpoint with the fewest calls in progress, LATENCY the one
+    with the lowest moving average of the call time. Endpoints the monitor reports lost are
+    skipped, calls that lose their endpoint are retried on the next one.
+    """
+    endpoints: list[PoolEndpoint]
+    balance_policy: BalancePolicy
+    latency_alpha: float
+    pool_lock: threading.Lock
+
+    def __init__(self, endpoints: list[PoolEndpoint], balance_policy=BalancePolicy.LEAST_OUTSTANDING, latency_alpha=0.2):
+        self.endpoints = endpoints
+        self.balance_policy = balance_policy
+        self.latency_alpha = latency_alpha
+        self.pool_lock = threading.Lock()
+
+    def pick(self, exclude=()):
+        """Healthy endpoint for the next call, None when all of them are down."""
+        with self.pool_lock:
+            healthy = []
+            for endpoint in self.endpoints:
+                is_healthy = endpoint.is_healthy()
+                if endpoint.was_healthy and not is_healthy:
+                    endpoint.ejected_count += 1
+                endpoint.was_healthy = is_healthy
+                if is_healthy and endpoint not in exclude:
+                    healthy.append(endpoint)
+            if not healthy:
+                return None
+            if self.balance_policy == BalancePolicy.LATENCY:
+                # Idle endpoints with no samples yet are tried first
+                endpoint = min(healthy, key=lambda x: (x.latency if x.call_count else 0.0, x.outstanding))
+            else:
+                endpoint = min(healthy, key=lambda x: (x.outstanding, x.latency))
+            endpoint.outstanding += 1
+            return endpoint
+
+    def server_call(self, method_name, params, timeout=None):
+        tried = []
+        while True:
+            endpoint = self.pick(tried)
+            if endpoint is None:
+                raise ConnectionLost(f'No healthy endpoint! {method_name}')
+            tried.append(endpoint)
+            started = time.time()
+            try:
+                res = endpoint.socket.server_call(method_name, params, timeout)
+            except ConnectionLost:
+                endpoint.error_count += 1
+                continue
+            except Exception:
+                endpoint.error_count += 1
+                raise
+            finally:
+                with self.pool_lock:
+                    endpoint.outstanding -= 1
+            elapsed = time.time() - started
+            with self.pool_lock:
+                endpoint.latency = elapsed if not endpoint.call_count else \
+                    endpoint.latency + self.latency_alpha * (elapsed - endpoint.latency)
+                endpoint.call_count += 1
+            return res
+
+    def get_endpoint_info(self) -> list[EndpointInfo]:
+        return [EndpointInfo(
+            ip_address=x.ip_address,
+            port=x.port,
+            is_healthy=x.is_healthy(),
+            outstanding=x.outstanding,
+            latency_ms=x.latency * 1000,
+            calls=x.call_count,
+            errors=x.error_count,
+            ejected=x.ejected_count,
+        ) for x in self.endpoints]
+
+    def close(self):
+        for endpoint in self.endpoints:
+            endpoint.socket.close()
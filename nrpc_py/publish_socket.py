@@ -0,0 +1,163 @@
+#
+#   Contents:
+#
+#       PublishSocket
+#           __init__
+#           bind
+#           publish
+#           close
+#
+#       SubscribeSocket
+#           __init__
+#           connect
+#           subscribe
+#           unsubscribe
+#           _recv_thread
+#           _dispatch
+#           close
+#
+import json
+import threading
+import zmq
+from typing import Callable, Dict
+from .common_base import RoutingSocketOptions, ProtocolType, get_endpoint
+
+
+class PublishSocket:
+    """One-way broadcast channel of the server, events are sent once to every subscriber."""
+    ip_address: str
+    port_pub: int
+    protocol: ProtocolType
+    published_count: int
+    zmq_context: zmq.Context
+    zmq_publisher: zmq.Socket
+    publish_lock: threading.Lock
+
+    def __init__(self, ip_address, port_pub, options: RoutingSocketOptions = None):
+        self.ip_address = ip_address
+        self.port_pub = port_pub
+        self.protocol = options.protocol if options else ProtocolType.TCP
+        self.published_count = 0
+        self.publish_lock = threading.Lock()
+
+        self.zmq_context = zmq.Context.instance()
+        self.zmq_publisher = self.zmq_context.socket(zmq.PUB)
+        self.zmq_publisher.set(zmq.SNDHWM, options.send_hwm if options else 1000)
+
+    def bind(self):
+        self.zmq_publisher.bind(get_endpoint(self.protocol, self.ip_address, self.port_pub))
+
+    def publish(self, topic: str, payload: dict):
+        """Fire and forget, slow subscribers above the HWM lose events."""
+        with self.publish_lock:
+            if not self.zmq_publisher:
+                return
+            self.zmq_publisher.send_multipart([topic.encode(), json.dumps(payload).encode()])
+            self.published_count += 1
+
+    def close(self):
+        with self.publish_lock:
+            zmq_publisher = self.zmq_publisher
+            self.zmq_publisher = None
+        if zmq_publisher:
+            zmq_publisher.close()
+        self.zmq_context = None
+
+
+class SubscribeSocket:
+    """Receives published events on its own thread and passes them to the handlers."""
+    ip_address: str
+    port_pub: int
+    protocol: ProtocolType
+    is_alive: bool
+    received_count: int
+    handlers: Dict[str, list[Callable[[str, dict], None]]]
+    zmq_context: zmq.Context
+    zmq_subscriber: zmq.Socket
+    zmq_subscriber_thread: threading.Thread
+    subscribe_lock: threading.Lock
+    topic_changes: list[tuple[int, bytes]]
+
+    def __init__(self, ip_address, port_pub, options: RoutingSocketOptions = None):
+        self.ip_address = ip_address
+        self.port_pub = port_pub
+        self.protocol = options.protocol if options else ProtocolType.TCP
+        self.is_alive = True
+        self.received_count = 0
+        self.handlers = {}
+        # ZMQ sockets are not thread safe, the receive thread applies the topic changes
+        self.subscribe_lock = threading.Lock()
+        self.topic_changes = []
+
+        self.zmq_context = zmq.Context.instance()
+        self.zmq_subscriber = self.zmq_context.socket(zmq.SUB)
+        self.zmq_subscriber.set(zmq.RCVHWM, options.recv_hwm if options else 1000)
+        self.zmq_subscriber_thread = None
+
+    def connect(self, endpoints: list[tuple[str, int]] = None):
+        """Subscribes to every publisher of 'endpoints', by default the one of this socket."""
+        for ip_address, port_pub in endpoints or [(self.ip_address, self.port_pub)]:
+            self.zmq_subscriber.connect(get_endpoint(self.protocol, ip_address, port_pub))
+        self.zmq_subscriber_thread = threading.Thread(target=self._recv_thread)
+        self.zmq_subscriber_thread.start()
+
+    def subscribe(self, topic: str, handler: Callable[[str, dict], None]):
+        """Topic 'Type' also receives the sub-topics 'Type/...'."""
+        with self.subscribe_lock:
+            if topic not in self.handlers:
+                self.handlers[topic] = []
+                self.topic_changes.append((zmq.SUBSCRIBE, topic.encode()))
+            self.handlers[topic] = self.handlers[topic] + [handler]
+
+    def unsubscribe(self, topic: str):
+        with self.subscribe_lock:
+            if self.handlers.pop(topic, None) is not None:
+                self.topic_changes.append((zmq.UNSUBSCRIBE, topic.encode()))
+
+    def _recv_thread(self):
+        poller = zmq.Poller()
+        poller.register(self.zmq_subscriber, zmq.POLLIN)
+
+        while self.is_alive:
+            with self.subscribe_lock:
+                topic_changes, self.topic_changes = self.topic_changes, []
+            for option, topic in topic_changes:
+                self.zmq_subscriber.setsockopt(option, topic)
+            ready = dict(poller.poll(100))
+            if not self.is_alive or self.zmq_subscriber not in ready:
+                continue
+            msg = self.zmq_subscriber.recv_multipart()
+            try:
+                assert len(msg) == 2
+                topic, payload = msg[0].decode(), json.loads(msg[1].decode())
+            except (AssertionError, ValueError):
+                # print(f'Malformed event: {msg}')
+                continue
+            self.received_count += 1
+            self._dispatch(topic, payload)
+
+    def _dispatch(self, topic: str, payload: dict):
+        # ZMQ filters by prefix, the topic has to match exactly or as a parent
+        handlers = []
+        with self.subscribe_lock:
+            for key, value in self.handlers.items():
+                if topic == key or topic.startswith(key + '/'):
+                    handlers.extend(value)
+        for handler in handlers:
+            try:
+                handler(topic, payload)
+            except Exception:
+                # A failing handler does not stop the other handlers or the later events
+                # print(f'Event handler failed: {topic}')
+                pass
+
+    def close(self):
+        zmq_subscriber_thread = self.zmq_subscriber_thread
+        self.is_alive = False
+        self.zmq_subscriber_thread = None
+        if zmq_subscriber_thread:
+            zmq_subscriber_thread.join()
+        if self.zmq_subscriber:
+            self.zmq_subscriber.close()
+            self.zmq_subscriber = None
+        self.zmq_context = None
@@ -0,0 +1,86 @@
+#
+#   Contents:
+#
+#       ResponseCache
+#           __init__
+#           get
+#           put
+#           clear
+#           get_info
+#       get_request_key
+#
+import json
+import time
+import threading
+from collections import OrderedDict
+from .common_base import CacheInfo
+
+
+def get_request_key(request) -> bytes:
+    """Canonical encoding of a decoded request, equal requests get the same key regardless of key order."""
+    return json.dumps(request, sort_keys=True, separators=(',', ':')).encode()
+
+
+class ResponseCache:
+    """Responses of one cacheable method, keyed by the canonical encoding of the request.
+
+    Servers keep each response decoded and encoded, clients only decoded. Entries expire 'cache_ttl'
+    seconds after they were stored, the least recently used entry is dropped when 'cache_size'
+    is reached.
+    """
+    method_name: str
+    cache_ttl: float
+    cache_size: int
+    hit_count: int
+    miss_count: int
+    generation: int
+    entries_: OrderedDict[bytes, list]
+    cache_lock: threading.Lock
+
+    def __init__(self, method_name, cache_ttl, cache_size=1000):
+        self.method_name = method_name
+        self.cache_ttl = cache_ttl
+        self.cache_size = max(cache_size, 1)
+        self.hit_count = 0
+        self.miss_count = 0
+        self.generation = 0
+        self.entries_ = OrderedDict()
+        self.cache_lock = threading.Lock()
+
+    def get(self, request: bytes):
+        """Cached response of the request, None when missing or expired."""
+        with self.cache_lock:
+            entry = self.entries_.get(request)
+            if entry is None or entry[0] < time.time():
+                if entry is not None:
+                    del self.entries_[request]
+                self.miss_count += 1
+                return None
+            self.entries_.move_to_end(request)
+            self.hit_count += 1
+            return entry[1]
+
+    def put(self, request: bytes, response, generation=None):
+        """Stores the response, unless the cache was cleared since 'generation' was read."""
+        with self.cache_lock:
+            if generation is not None and generation != self.generation:
+                return
+            self.entries_[request] = [time.time() + self.cache_ttl, response]
+            self.entries_.move_to_end(request)
+            while len(self.entries_) > self.cache_size:
+                self.entries_.popitem(last=False)
+
+    def clear(self):
+        with self.cache_lock:
+            self.entries_.clear()
+            self.generation += 1
+
+    def get_info(self) -> CacheInfo:
+        return CacheInfo(
+            method_name=self.method_name,
+            cache_size=self.cache_size,
+            cache_ttl=self.cache_ttl,
+            count=len(self.entries_),
+            hits=self.hit_count,
+            misses=self.miss_count,
+        )
@@ -5,29 +5,67 @@
 #           __init__
 #           bind
 #           connect
+#           connect_many
 #           cast
 #           server_thread
+#           worker_thread
+#           _dispatch
+#           _cached_call
+#           _join_call
+#           _leave_call
+#           _finish_call
 #           client_thread
 #           client_call
 #           forward_call
 #           server_call
+#           _get_call
+#           _server_call
+#           _get_local_dispatch
+#           _local_call
+#           publish
+#           subscribe
+#           unsubscribe
+#           invalidate_cache
+#           _clear_caches
+#           server_stream
+#           _get_deadline
+#           _check_response
+#           _stream_items
 #           _incoming_call
+#           _failed_call
+#           _open_stream
+#           _run_stream
+#           _stream_requests
+#           _stream_message
+#           _cancel_stream
+#           _close_streams
 #           _add_types
 #           _add_server
+#           _get_dispatch
+#           _update_dispatch
+#           _get_snapshot
 #           _get_app_info
 #           _get_schema
+#           _get_page
+#           _get_page_value
 #           _set_schema
 #           _assign_values
 #           _sync_with_server
 #           _sync_with_client
+#           _add_client_caches
+#           _get_schema_hash
+#           _find_local_server
 #           _find_new_fields
 #           _find_new_methods
 #           _find_missing_methods
 #           client_id
+#           _get_client_socket
 #           wait
 #           close
 #
 import time
+import copy
+import queue
 import threading
 import inspect
 import json
@@ -38,31 +76,59 @@ from .common_base import (
     SocketType,
     ProtocolType,
     FormatType,
+    LocalCallPolicy,
+    BalancePolicy,
     RoutingSocketOptions,
     ApplicationInfo,
+    ClientHistoryInfo,
     SchemaInfo,
     FieldInfo,
     MethodInfo,
     ClassInfo,
     ServiceInfo,
     ServerInfo,
+    DispatchInfo,
+    CallInfo,
+    StreamInfo,
+    RpcError,
+    DeadlineExceeded,
+    ServerOverloaded,
+    ConnectionLost,
     RoutingMessage,
     ServerMessage,
     DYNAMIC_OBJECT,
     g_all_types,
     g_all_services,
+    g_process_token,
     get_simple_type,
+    is_stream_type,
+    split_call_headers,
+    join_call_headers,
+    get_call_deadline,
+    get_endpoint,
+    get_schema_hash,
     assign_values,
-    find,
-    find_all,
+    group_by,
 )
 from .server_socket import ServerSocket
 from .client_socket import ClientSocket
+from .publish_socket import PublishSocket, SubscribeSocket
+from .web_server import WebServer
+from .response_cache import ResponseCache, get_request_key
+from .endpoint_pool import EndpointPool, PoolEndpoint
 from .service_client import ServiceClient
 X = TypeVar('X')
 
+# BIND sockets of this process by endpoint, colocated clients call their services directly
+g_local_servers: Dict[str, 'RoutingSocket'] = {}
+g_local_lock = threading.Lock()
+
+# End of a request stream, None may be a request item
+_STREAM_END = object()
+
 
 class RoutingSocket:
+    options: RoutingSocketOptions
     socket_type: SocketType
     protocol_type: ProtocolType
     format_type: FormatType
@@ -72,11 +138,30 @@ class RoutingSocket:
     is_alive: bool
     server_socket: ServerSocket | None
     client_socket: ClientSocket | None
+    publisher: PublishSocket | None
+    subscriber: SubscribeSocket | None
+    web_server: WebServer | None
+    endpoint_pool: EndpointPool | None
+    local_server: 'RoutingSocket | None'
     processor: threading.Thread
+    worker: threading.Thread | None
     known_types: Dict[str, ClassInfo]
     known_services: Dict[str, ServiceInfo]
     known_servers: Dict[str, ServerInfo]
+    dispatch_table: Dict[str, DispatchInfo]
+    call_table: Dict[str, CallInfo]
+    streams: Dict[tuple[int, int], StreamInfo]
+    response_caches: Dict[str, ResponseCache]
+    client_caches: Dict[str, ResponseCache]
+    snapshot_cache: ResponseCache
+    schema_version: int
+    coalesced_methods: set[str]
+    coalesced_calls: Dict[tuple[str, bytes], list[list]]
+    coalesce_lock: threading.Lock
+    stream_lock: threading.Lock
+    stream_count: int
     call_count: int
+    sync_count: int
     do_sync: bool
     is_ready: bool
 
@@ -88,6 +173,24 @@ class RoutingSocket:
             name: str = 'unknown',
             types: list = [],
             port: int = 0,
+            liveness_interval: float = 1.0,
+            lost_client_max_age: float = 300.0,
+            lost_client_max_count: int = 1000,
+            lost_client_max_memory: int = 16 * 1024 * 1024,
+            client_history_size: int = 100,
+            call_timeout: float = 0,
+            send_hwm: int = 1000,
+            recv_hwm: int = 1000,
+            work_queue_size: int = 1000,
+            max_streams: int = 64,
+            local_call_policy: LocalCallPolicy = LocalCallPolicy.DISABLED,
+            shared_memory_threshold: int = 0,
+            shared_memory_ttl: float = 60.0,
+            max_message_size: int = 64 * 1024 * 1024,
+            client_cache_size: int = 0,
+            balance_policy: BalancePolicy = BalancePolicy.LEAST_OUTSTANDING,
+            reconnect_timeout: float = 0,
+            enable_publish: bool = False,
     ):
         options = RoutingSocketOptions(
             type=type,
@@ -95,9 +198,28 @@ class RoutingSocket:
             format=format,
             name=name,
             types=types,
-            port=port
+            port=port,
+            liveness_interval=liveness_interval,
+            lost_client_max_age=lost_client_max_age,
+            lost_client_max_count=lost_client_max_count,
+            lost_client_max_memory=lost_client_max_memory,
+            client_history_size=client_history_size,
+            call_timeout=call_timeout,
+            send_hwm=send_hwm,
+            recv_hwm=recv_hwm,
+            work_queue_size=work_queue_size,
+            max_streams=max_streams,
+            local_call_policy=local_call_policy,
+            shared_memory_threshold=shared_memory_threshold,
+            shared_memory_ttl=shared_memory_ttl,
+            max_message_size=max_message_size,
+            client_cache_size=client_cache_size,
+            balance_policy=balance_policy,
+            reconnect_timeout=reconnect_timeout,
+            enable_publish=enable_publish,
         )
         assert not isinstance(type, RoutingSocketOptions)
+        self.options = options
         self.socket_type = options.type
         self.protocol_type = options.protocol
         self.format_type = options.format
@@ -107,11 +229,30 @@ class RoutingSocket:
         self.is_alive = True
         self.server_socket = None
         self.client_socket = None
+        self.publisher = None
+        self.subscriber = None
+        self.web_server = None
+        self.endpoint_pool = None
+        self.local_server = None
         self.processor = None
+        self.worker = None
         self.known_types = {}
         self.known_services = {}
         self.known_servers = {}
+        self.dispatch_table = {}
+        self.call_table = {}
+        self.streams = {}
+        self.response_caches = {}
+        self.client_caches = {}
+        self.snapshot_cache = ResponseCache('RoutingMessage', 60.0, 64)
+        self.schema_version = 0
+        self.coalesced_methods = set()
+        self.coalesced_calls = {}
+        self.coalesce_lock = threading.Lock()
+        self.stream_lock = threading.Lock()
+        self.stream_count = 0
         self.call_count = 0
+        self.sync_count = 0
         self.do_sync = False
         self.is_ready = False
 
@@ -126,17 +267,39 @@ class RoutingSocket:
 
         self.ip_address = ip_address
         self.port = port
-        self.server_socket = ServerSocket(ip_address, port, port + 10000, self.socket_name)
+
+        # Browser and HTTP clients, calls are served by the same services without the ZMQ sockets
+        if self.protocol_type in [ProtocolType.WS, ProtocolType.HTTP]:
+            self.web_server = WebServer(
+                ip_address, port, self._dispatch, self.options,
+                serve_http=self.protocol_type == ProtocolType.HTTP
+            )
+            self.web_server.start()
+            self.is_ready = True
+            return
+
+        self.server_socket = ServerSocket(ip_address, port, port + 10000, self.socket_name, self.options)
+        self.server_socket.lost_callback = self._close_streams
+        self.server_socket.add_metadata({'schema_hash': self._get_schema_hash()})
         self.server_socket.bind()
+        # Only sockets that publish take the port + 20000 of the broadcast channel
+        if self.options.enable_publish:
+            self.publisher = PublishSocket(ip_address, port + 20000, self.options)
+            self.publisher.bind()
+        with g_local_lock:
+            g_local_servers[get_endpoint(self.protocol_type, ip_address, port)] = self
         self.processor = threading.Thread(target=self.server_thread)
         self.processor.start()
+        self.worker = threading.Thread(target=self.worker_thread)
+        self.worker.start()
 
     def connect(self, ip_address='127.0.0.1', port=9000, wait=True, sync=True):
         assert self.socket_type == SocketType.CONNECT
 
         self.ip_address = ip_address
         self.port = port
-        self.client_socket = ClientSocket(ip_address, port, port + 10000, self.socket_name)
+        self.client_socket = ClientSocket(ip_address, port, port + 10000, self.socket_name, self.options)
+        self.client_socket.add_metadata({'schema_hash': self._get_schema_hash()})
         self.do_sync = sync
         self.processor = threading.Thread(target=self.client_thread)
         self.processor.start()
@@ -145,10 +308,33 @@ class RoutingSocket:
             while not self.is_ready:
                 time.sleep(0.1)
 
-    def cast(self, clazz: X, client_id=0) -> X:
-        return ServiceClient(self, clazz if isinstance(clazz, type) else clazz.__class__, client_id)
+    def connect_many(self, endpoints: list[tuple[str, int]], wait=True, sync=True):
+        """Connects to every server of a stateless service, calls are spread over the healthy ones.
+
+        Each endpoint has its own connecting socket with the options of this one, waiting
+        returns as soon as the first of them is ready.
+        """
+        assert self.socket_type == SocketType.CONNECT
+        assert endpoints
+
+        self.ip_address, self.port = endpoints[0]
+        pool_endpoints = []
+        for ip_address, port in endpoints:
+            socket = RoutingSocket(**vars(self.options))
+            socket.connect(ip_address, port, wait=False, sync=sync)
+            pool_endpoints.append(PoolEndpoint(ip_address, port, socket))
+        self.endpoint_pool = EndpointPool(pool_endpoints, self.options.balance_policy)
+        self.is_ready = True
+
+        if wait:
+            while not any(x.is_healthy() for x in pool_endpoints):
+                time.sleep(0.1)
+
+    def cast(self, clazz: X, client_id=0, timeout=None) -> X:
+        return ServiceClient(self, clazz if isinstance(clazz, type) else clazz.__class__, client_id, timeout)
 
     def server_thread(self):
+        """Receives calls and queues them for the worker, full queue rejects calls right away."""
         assert self.socket_type == SocketType.BIND
 
         self.is_ready = True
@@ -157,40 +343,138 @@ class RoutingSocket:
             client_id, req = self.server_socket.recv_norm()
             if not self.is_alive:
                 break
-            method_name = req[0].decode()
-            command_parameters = json.loads(req[1].decode())
+            if req[0] in [
+                    ServerMessage.StreamOpen,
+                    ServerMessage.StreamData,
+                    ServerMessage.StreamCredit,
+                    ServerMessage.StreamEnd,
+                    ServerMessage.StreamCancel]:
+                try:
+                    self._stream_message(client_id, req[0], json.loads(req[1].decode()))
+                except (ValueError, KeyError, TypeError, AttributeError):
+                    # print(f'Invalid stream message: {req[0]}')
+                    pass
+                continue
+            try:
+                method_name, headers = split_call_headers(req[0].decode())
+            except ValueError:
+                # print(f'Invalid call headers: {req[0]}')
+                continue
+            reply_headers = {'id': headers['id']} if 'id' in headers else {}
+            call_key = (method_name, req[1]) if method_name in self.coalesced_methods else None
+            if call_key and self._join_call(call_key, client_id, reply_headers):
+                continue
+            if not self.server_socket.push_work(client_id, req):
+                if call_key:
+                    self._finish_call(call_key)
+                self.server_socket.send_norm(client_id, [
+                    join_call_headers(f'error:{method_name}', reply_headers),
+                    {'error': 'Server overloaded', 'code': 'overloaded'}
+                ])
+
+    def worker_thread(self):
+        while self.is_alive:
+            work = self.server_socket.pop_work()
+            if work is None:
+                continue
+            arrival_time, client_id, req = work
+            method_name, headers = split_call_headers(req[0].decode())
+            reply_headers = {'id': headers['id']} if 'id' in headers else {}
+            deadline = get_call_deadline(headers, arrival_time)
+            call_key = (method_name, req[1]) if method_name in self.coalesced_methods else None
 
             # print(f"{Fore.BLUE}server{Fore.RESET} received request")
             # print(f"{Fore.BLUE}server{Fore.RESET} responding")
 
-            resp = None
-            if method_name == RoutingMessage.GetAppInfo:
-                resp = self._get_app_info(command_parameters)
-                self.server_socket.send_norm(
-                    client_id,
-                    [f'response:{method_name}', resp]
-                )
-
-            elif method_name == RoutingMessage.GetSchema:
-                resp = self._get_schema(command_parameters, active_client_id=client_id)
-                self.server_socket.send_norm(
-                    client_id,
-                    [f'response:{method_name}', resp]
-                )
+            # Caller already gave up while the call was queued, skipping the work
+            if deadline and time.time() >= deadline:
+                self.server_socket.expired_count += 1
+                self.server_socket.post_norm(client_id, [
+                    join_call_headers(f'error:{method_name}', reply_headers),
+                    {'error': 'Deadline exceeded', 'code': 'deadline'}
+                ])
+                # Callers that joined the coalesced call later may still be waiting for it
+                if not call_key or not self._leave_call(call_key, client_id, reply_headers):
+                    continue
 
-            elif method_name == RoutingMessage.SetSchema:
-                resp = self._set_schema(command_parameters)
-                self.server_socket.send_norm(
-                    client_id,
-                    [f'response:{method_name}', resp]
+            response_kind = 'response'
+            try:
+                resp = self._dispatch(method_name, json.loads(req[1].decode()), client_id, as_bytes=True)
+            except Exception as ex:
+                # Failed call is answered like any other, the worker keeps serving
+                response_kind = 'error'
+                resp = {'error': f'{type(ex).__name__}: {ex}', 'code': 'failed'}
+
+            # One result for every caller of a coalesced call, encoded once
+            waiters = self._finish_call(call_key) if call_key else [[client_id, reply_headers]]
+            if len(waiters) > 1 and not isinstance(resp, bytes):
+                resp = json.dumps(resp).encode()
+            for waiter_id, waiter_headers in waiters:
+                self.server_socket.post_norm(
+                    waiter_id,
+                    [join_call_headers(f'{response_kind}:{method_name}', waiter_headers), resp]
                 )
 
-            else:
-                resp = self._incoming_call(method_name, command_parameters)
-                self.server_socket.send_norm(
-                    client_id,
-                    [f'response:{method_name}', resp]
-                )
+    def _dispatch(self, method_name, command_parameters, client_id=0, as_bytes=False):
+        """Runs a received call, shared by all server transports.
+
+        With 'as_bytes' snapshots and cached responses are returned already encoded.
+        """
+        if method_name == RoutingMessage.GetAppInfo:
+            # Queue and cache counters change with every call, they are never cached
+            if command_parameters.get('with_queue') or command_parameters.get('with_caches'):
+                return self._get_app_info(command_parameters)
+            return self._get_snapshot(method_name, command_parameters, 0, as_bytes)
+        elif method_name == RoutingMessage.GetSchema:
+            return self._get_snapshot(method_name, command_parameters, client_id, as_bytes)
+        elif method_name == RoutingMessage.SetSchema:
+            return self._set_schema(command_parameters)
+        cache = self.response_caches.get(method_name)
+        if cache is not None:
+            return self._cached_call(cache, method_name, command_parameters, as_bytes)
+        return self._incoming_call(method_name, command_parameters)
+
+    def _cached_call(self, cache: ResponseCache, method_name, command_parameters, as_bytes):
+        """Response of a cacheable method, kept decoded and encoded like the snapshots.
+
+        The key is the canonical encoding of the decoded request and not the received bytes,
+        untyped callers may send equal requests with a different key order.
+        """
+        cache_key = get_request_key(command_parameters)
+        # Responses computed before an invalidation are not stored after it
+        cache_generation = cache.generation
+        entry = cache.get(cache_key)
+        if entry is None:
+            resp = self._incoming_call(method_name, command_parameters)
+            entry = [resp, json.dumps(resp).encode()]
+            cache.put(cache_key, entry, cache_generation)
+        return entry[1] if as_bytes else entry[0]
+
+    def _join_call(self, call_key, client_id, reply_headers):
+        """True when an identical call is already queued or running and the caller was added to it."""
+        with self.coalesce_lock:
+            waiters = self.coalesced_calls.get(call_key)
+            if waiters is None:
+                self.coalesced_calls[call_key] = [[client_id, reply_headers]]
+                return False
+            waiters.append([client_id, reply_headers])
+            self.server_socket.coalesced_count += 1
+            return True
+
+    def _leave_call(self, call_key, client_id, reply_headers):
+        """Removes an expired caller, False when nobody else waits for the call."""
+        with self.coalesce_lock:
+            waiters = self.coalesced_calls.get(call_key, [])
+            if [client_id, reply_headers] in waiters:
+                waiters.remove([client_id, reply_headers])
+            if not waiters:
+                self.coalesced_calls.pop(call_key, None)
+                return False
+            return True
+
+    def _finish_call(self, call_key):
+        with self.coalesce_lock:
+            return self.coalesced_calls.pop(call_key, [])
 
     def client_thread(self):
         assert self.socket_type == SocketType.CONNECT
@@ -198,52 +482,76 @@ class RoutingSocket:
 
         if self.do_sync:
             assert self.client_socket.is_validated
-            self._sync_with_server()
-            self._sync_with_client()
+            # Schemas with the same fingerprint have nothing to exchange, a client that only
+            # lacks what the server has is done after the first round trip
+            server_hash = (self.client_socket.server_metadata or {}).get('schema_hash')
+            if server_hash != self._get_schema_hash():
+                self._sync_with_server()
+                if server_hash != self._get_schema_hash():
+                    self._sync_with_client()
+            else:
+                self._add_client_caches(self._get_schema(None))
+        self._find_local_server()
 
         self.is_ready = True
 
         while self.is_alive:
-            req = self.client_socket.recv_rev()
+            req = self.client_socket.recv_rev(0.1)
             if not self.is_alive:
                 break
             if self.client_socket.is_lost:
                 # print('Lost client')
                 break
-            method_name = req[0].decode()
+            if req is None:
+                self.client_socket.resume()
+                continue
+            arrival_time = time.time()
+            method_name, headers = split_call_headers(req[0].decode())
+            reply_headers = {'id': headers['id']} if 'id' in headers else {}
+            deadline = get_call_deadline(headers, arrival_time)
             command_parameters = json.loads(req[1].decode())
 
             # Reverse client is bright red
             # print(f"{Fore.RED}client:{client_socket.client_id}{Fore.RESET} received request, {method_name}")
             # print(f"{Fore.RED}client:{client_socket.client_id}{Fore.RESET} responding")
 
-            if method_name == RoutingMessage.GetAppInfo:
+            if deadline and time.time() >= deadline:
+                self.client_socket.send_rev([
+                    join_call_headers(f'error:{method_name}', reply_headers),
+                    {'error': 'Deadline exceeded', 'code': 'deadline'}
+                ])
+
+            elif method_name == RoutingMessage.GetAppInfo:
                 resp = self._get_app_info(command_parameters)
                 self.client_socket.send_rev([
-                    f'response:{method_name}',
+                    join_call_headers(f'response:{method_name}', reply_headers),
                     resp
                 ])
 
             elif method_name == RoutingMessage.GetSchema:
                 resp = self._get_schema(command_parameters)
                 self.client_socket.send_rev([
-                    f'response:{method_name}',
+                    join_call_headers(f'response:{method_name}', reply_headers),
                     resp
                 ])
 
             elif method_name == RoutingMessage.SetSchema:
                 assert False
 
+            elif method_name == RoutingMessage.InvalidateCache:
+                # One way, the server does not wait for a response
+                self._clear_caches(self.client_caches, command_parameters.get('method_name', ''))
+
             else:
                 resp = self._incoming_call(method_name, command_parameters)
                 self.client_socket.send_rev([
-                    f'response:{method_name}',
+                    join_call_headers(f'response:{method_name}', reply_headers),
                     resp
                 ])
 
-    def client_call(self, client_id, method_name, params):
+    def client_call(self, client_id, method_name, params, timeout=None):
         assert self.socket_type == SocketType.BIND
-        assert client_id in self.server_socket.get_client_ids()
+        assert self.server_socket.is_client_alive(client_id), f'Unknown client: {client_id}'
         server_name = method_name.split('.')[0]
         method_name2 = method_name.split('.')[1]
         method_name3 = f'{server_name}.{method_name2}'
@@ -263,15 +571,24 @@ class RoutingSocket:
         # Server rev is dark red
         # print(f"{Style.DIM}{Fore.RED}server{Fore.RESET}{Style.NORMAL} sending request")
 
+        timeout, deadline = self._get_deadline(timeout)
         res = None
-        with self.server_socket.request_lock:
+        if not self.server_socket.request_lock.acquire(timeout=timeout if deadline else -1):
+            raise DeadlineExceeded(f'Deadline exceeded! {method_name3}')
+        try:
+            call_id = 0
+            headers = {}
+            if deadline:
+                call_id = self.server_socket.next_call()
+                headers = {'id': call_id, 'timeout': max(int((deadline - time.time()) * 1000), 0)}
             self.server_socket.send_rev(
                 client_id,
-                [method_name3, params]
+                [join_call_headers(method_name3, headers), params]
             )
-            res = self.server_socket.recv_rev(client_id)
-        if res:
-            res = json.loads(res.decode())
+            res = self.server_socket.recv_rev(client_id, call_id, deadline)
+        finally:
+            self.server_socket.request_lock.release()
+        res = self._check_response(res, method_name3, deadline)
 
         if not is_untyped:
             method_def = self.known_services[server_name].methods[method_name2]
@@ -287,7 +604,7 @@ class RoutingSocket:
 
         return res
 
-    def forward_call(self, client_id, method_name, params):
+    def forward_call(self, client_id, method_name, params, timeout=None):
         assert self.socket_type == SocketType.CONNECT
         return self.server_call(
             ServerMessage.ForwardCall.decode(),
@@ -295,60 +612,358 @@ class RoutingSocket:
                 'client_id': client_id,
                 'method_name': method_name,
                 'method_params': params
-            }
+            },
+            timeout
         )
 
-    def server_call(self, method_name, params):
+    def server_call(self, method_name, params, timeout=None):
         assert self.socket_type == SocketType.CONNECT
         assert isinstance(method_name, str)
+        return self._server_call(self._get_call(method_name), params, timeout)
+
+    def _get_call(self, method_name) -> CallInfo:
+        """Method, types and client cache of 'Service.Method', looked up once per schema version."""
+        call_info = self.call_table.get(method_name)
+        if call_info is None or call_info.schema_version != self.schema_version:
+            server_name = method_name.split('.')[0]
+            method_name2 = method_name.split('.')[1]
+            service_info = self.known_services.get(server_name)
+            method_info = service_info.methods.get(method_name2) if service_info else None
+            response_type = method_info.response_type if method_info else '[]'
+            call_info = CallInfo(
+                method_name=f'{server_name}.{method_name2}',
+                method_info=method_info,
+                request_info=self.known_types.get(method_info.request_type) if method_info else None,
+                response_info=None if response_type.endswith('[]') else self.known_types.get(response_type),
+                cache=self.client_caches.get(f'{server_name}.{method_name2}'),
+                schema_version=self.schema_version,
+            )
+            self.call_table[method_name] = call_info
+        return call_info
+
+    def _server_call(self, call_info: CallInfo, params, timeout=None):
+        if self.endpoint_pool:
+            return self.endpoint_pool.server_call(call_info.method_name, params, timeout)
 
         self.call_count += 1
-        # print(f'Calling {self.call_count}, {server_name}.{method_name}') #, {req_data}')
-        server_name = method_name.split('.')[0]
-        method_name2 = method_name.split('.')[1]
-        method_name3 = f'{server_name}.{method_name2}'
+        # print(f'Calling {self.call_count}, {call_info.method_name}') #, {req_data}')
+        method_name3 = call_info.method_name
         is_untyped = isinstance(params, dict)
+        timeout, deadline = self._get_deadline(timeout)
+
+        # Colocated server, calls with a deadline still go over the wire so they can be abandoned
+        dispatch = self._get_local_dispatch(method_name3) if self.local_server and not deadline else None
+        if dispatch and self.options.local_call_policy == LocalCallPolicy.SHARE and \
+                isinstance(params, dispatch.request_clazz):
+            return self._local_call(dispatch, params)
 
         # Using statically typed input/output claseses
         if not is_untyped:
-            method_def = self.known_services[server_name].methods[method_name2]
-            req_type = self.known_types[method_def.request_type]
-            assert req_type
+            req_type = call_info.request_info
+            assert req_type, f'Unknown method! {method_name3}'
             assert isinstance(params, req_type.clazz), f'Wrong request type! {params}, {req_type.clazz}'
             params2 = {}
-            self._assign_values(method_def.request_type, params, params2, 1)
+            self._assign_values(req_type.type_name, params, params2, 1)
             params, params2 = params2, params
-            
+
+        # Method declared cacheable by the server, answered here until it expires or is invalidated
+        cache = call_info.cache
+        if cache:
+            cache_key = get_request_key(params)
+            cache_generation = cache.generation
+            res = cache.get(cache_key)
+            if res is not None:
+                return res if self.options.local_call_policy == LocalCallPolicy.SHARE else copy.deepcopy(res)
+
         res = None
-        with self.client_socket.request_lock:
-            self.client_socket.send_norm(
-                [method_name3, params]
-            )
-            res = self.client_socket.recv_norm()
-        if res:
-            res = json.loads(res.decode())
+        if dispatch:
+            # Encoded and decoded as on the wire, neither side sees the objects of the other
+            res = self._local_call(dispatch, params)
+        else:
+            if not self.client_socket.request_lock.acquire(timeout=timeout if deadline else -1):
+                raise DeadlineExceeded(f'Deadline exceeded! {method_name3}')
+            try:
+                call_id = 0
+                headers = {}
+                if deadline:
+                    call_id = self.client_socket.next_call()
+                    headers = {'id': call_id, 'timeout': max(int((deadline - time.time()) * 1000), 0)}
+                self.client_socket.send_call(
+                    [join_call_headers(method_name3, headers), params]
+                )
+                res = self.client_socket.recv_norm(call_id, deadline)
+            finally:
+                self.client_socket.request_lock.release()
+            res = self._check_response(res, method_name3, deadline)
 
         if not is_untyped:
-            method_def = self.known_services[server_name].methods[method_name2]
+            method_def = call_info.method_info
             if method_def.response_type.endswith('[]'):
                 res2 = []
                 self._assign_values(method_def.response_type, res2, res, 0)
                 res = res2
             else:
-                ret_type = self.known_types[method_def.response_type]
-                res2 = ret_type.clazz()
+                res2 = call_info.response_info.clazz()
                 self._assign_values(method_def.response_type, res2, res, 0)
                 res = res2
 
+        if cache:
+            cache.put(
+                cache_key,
+                res if self.options.local_call_policy == LocalCallPolicy.SHARE else copy.deepcopy(res),
+                cache_generation
+            )
         return res
 
+    def _get_local_dispatch(self, method_name):
+        """Method of the colocated server, None when the call has to go over the wire."""
+        local_server = self.local_server
+        if not local_server.is_alive:
+            return None
+        dispatch = local_server.dispatch_table.get(method_name)
+        if dispatch is None or dispatch.handler is None or dispatch.is_stream:
+            return None
+        return dispatch
+
+    def _local_call(self, dispatch: DispatchInfo, params):
+        """Runs the handler on the calling thread.
+
+        COPY takes the encoded request and returns the encoded response, with the codecs of the wire.
+        SHARE passes the objects as is. Handler errors are raised as failed calls.
+        """
+        self.local_server.call_count += 1
+        try:
+            if self.options.local_call_policy == LocalCallPolicy.SHARE:
+                return dispatch.handler(params)
+            return dispatch.encode(dispatch.handler(dispatch.decode(params)))
+        except Exception as ex:
+            raise RpcError(f'Call failed! {dispatch.method_name}, {ex}') from ex
+
+    def publish(self, event, topic=''):
+        """Sends a typed event once to every subscribed client, there is no response."""
+        assert self.socket_type == SocketType.BIND
+        type_name = event.__class__.__name__
+        assert type_name in self.known_types, f'Unknown event type! {type_name}'
+        payload = {}
+        self._assign_values(type_name, event, payload, 1)
+        publisher = self.web_server or self.publisher
+        assert publisher, f'Publishing is not enabled! {type_name}'
+        publisher.publish(f'{type_name}/{topic}' if topic else type_name, payload)
+
+    def subscribe(self, clazz: Type[X], handler, topic=''):
+        """Handler is called with each published event, from the subscriber thread."""
+        assert self.socket_type == SocketType.CONNECT
+        type_name = clazz.__name__
+        assert type_name in self.known_types, f'Unknown event type! {type_name}'
+        if not self.subscriber:
+            self.subscriber = SubscribeSocket(self.ip_address, self.port + 20000, self.options)
+            # Events of every server of a pool
+            self.subscriber.connect([
+                (x.ip_address, x.port + 20000) for x in self.endpoint_pool.endpoints
+            ] if self.endpoint_pool else None)
+
+        def on_event(_, payload):
+            event = clazz()
+            self._assign_values(type_name, event, payload, 0)
+            handler(event)
+
+        self.subscriber.subscribe(f'{type_name}/{topic}' if topic else type_name, on_event)
+
+    def unsubscribe(self, clazz: Type[X], topic=''):
+        assert self.socket_type == SocketType.CONNECT
+        if self.subscriber:
+            self.subscriber.unsubscribe(f'{clazz.__name__}/{topic}' if topic else clazz.__name__)
+
+    def invalidate_cache(self, method_name=''):
+        """Drops cached responses of the method, or of all methods, on the server and on every client."""
+        assert self.socket_type == SocketType.BIND
+        self._clear_caches(self.response_caches, method_name)
+        if not self.server_socket:
+            return
+        # Fire and forget, a lost or slow client does not hold up the others
+        for client_id in self.server_socket.get_client_ids():
+            try:
+                with self.server_socket.request_lock:
+                    self.server_socket.send_rev(client_id, [RoutingMessage.InvalidateCache, {'method_name': method_name}])
+            except Exception:
+                # print(f'Invalidate failed: {client_id}')
+                pass
+
+    def _clear_caches(self, caches: Dict[str, ResponseCache], method_name):
+        for key, cache in list(caches.items()):
+            if not method_name or key == method_name:
+                cache.clear()
+
+    def server_stream(self, method_name, params, credit=16):
+        """Calls a streaming method, at most 'credit' items are in flight in each direction.
+
+        Server-streaming methods return an iterator of responses. Client-streaming methods take
+        an iterator of requests in 'params' and return the single response, bidirectional
+        methods take an iterator and return an iterator. Requests are pulled lazily, only when
+        the server has granted credit for them.
+        """
+        assert self.socket_type == SocketType.CONNECT
+        assert isinstance(method_name, str)
+        assert credit > 0
+
+        # Streams stay on the endpoint they were opened on
+        if self.endpoint_pool:
+            endpoint = self.endpoint_pool.pick()
+            if endpoint is None:
+                raise ConnectionLost(f'No healthy endpoint! {method_name}')
+            with self.endpoint_pool.pool_lock:
+                endpoint.outstanding -= 1
+            return endpoint.socket.server_stream(method_name, params, credit)
+
+        server_name = method_name.split('.')[0]
+        method_name2 = method_name.split('.')[1]
+        method_def = self.known_services[server_name].methods[method_name2]
+        assert method_def.server_stream or method_def.client_stream, f'Not a streaming method! {method_name}'
+
+        items = self._stream_items(method_def, f'{server_name}.{method_name2}', params, credit)
+        if method_def.server_stream:
+            return items
+        result = None
+        for item in items:
+            result = item
+        return result
+
+    def _get_deadline(self, timeout):
+        """Per-call timeout falls back to the socket default, zero means no deadline."""
+        if timeout is None:
+            timeout = self.options.call_timeout
+        if not timeout or timeout <= 0:
+            return 0, 0
+        return timeout, time.time() + timeout
+
+    def _check_response(self, res, method_name, deadline):
+        """Decoded response payload, errors reported by the remote side are raised."""
+        if res is None:
+            if deadline and time.time() >= deadline:
+                raise DeadlineExceeded(f'Deadline exceeded! {method_name}')
+            if self.client_socket and self.client_socket.is_lost:
+                raise ConnectionLost(f'Connection lost! {method_name}')
+            return None
+        payload = json.loads(res[1].decode())
+        if res[0].startswith(b'error:'):
+            if payload.get('code') == 'deadline':
+                raise DeadlineExceeded(f'Deadline exceeded! {method_name}')
+            if payload.get('code') == 'overloaded':
+                raise ServerOverloaded(f'Server overloaded! {method_name}')
+            raise RpcError(f'Call failed! {method_name}, {payload.get("error")}')
+        return payload
+
+    def _stream_items(self, method_def: MethodInfo, method_name, params, credit):
+        self.call_count += 1
+        requests = None
+        if method_def.client_stream:
+            requests = iter(params)
+            params = {}
+        elif not isinstance(params, dict):
+            req_type = self.known_types[method_def.request_type]
+            assert isinstance(params, req_type.clazz), f'Wrong request type! {params}, {req_type.clazz}'
+            params2 = {}
+            self._assign_values(method_def.request_type, params, params2, 1)
+            params = params2
+
+        with self.client_socket.request_lock:
+            stream_id = self.client_socket.open_stream()
+            self.client_socket.send_norm([
+                ServerMessage.StreamOpen,
+                {
+                    'stream_id': stream_id,
+                    'method_name': method_name,
+                    'method_params': params,
+                    'credit': credit,
+                }
+            ])
+
+        is_done = False
+        is_sent = requests is None
+        send_credit = credit if requests is not None else 0
+        pending_credit = 0
+        try:
+            while not is_done:
+                # Requests are only pulled when there is nothing to receive and the server has room
+                if not is_sent and send_credit > 0 and not self.client_socket.has_stream_frames(stream_id):
+                    request = next(requests, _STREAM_END)
+                    with self.client_socket.request_lock:
+                        if request is _STREAM_END:
+                            self.client_socket.send_norm([
+                                ServerMessage.StreamEnd,
+                                {'stream_id': stream_id}
+                            ])
+                            is_sent = True
+                        else:
+                            request_data = request
+                            if not isinstance(request, dict):
+                                request_data = {}
+                                self._assign_values(method_def.request_type, request, request_data, 1)
+                            self.client_socket.send_norm([
+                                ServerMessage.StreamData,
+                                {'stream_id': stream_id, 'item': request_data}
+                            ])
+                            send_credit -= 1
+                    continue
+
+                with self.client_socket.request_lock:
+                    if pending_credit >= max(credit // 2, 1):
+                        self.client_socket.send_norm([
+                            ServerMessage.StreamCredit,
+                            {'stream_id': stream_id, 'credit': pending_credit}
+                        ])
+                        pending_credit = 0
+                    resp = self.client_socket.recv_stream(stream_id)
+                if resp is None:
+                    break
+
+                if resp[0] == ServerMessage.StreamCredit:
+                    send_credit += resp[1]['credit']
+                    continue
+
+                if resp[0] == ServerMessage.StreamEnd:
+                    is_done = True
+                    if resp[1].get('error'):
+                        raise RpcError(f'Stream failed! {method_name}, {resp[1]["error"]}')
+                    break
+
+                item = resp[1]['item']
+                pending_credit += 1
+                if method_def.response_type != DYNAMIC_OBJECT:
+                    if method_def.response_type.endswith('[]'):
+                        item2 = []
+                    else:
+                        item2 = self.known_types[method_def.response_type].clazz()
+                    self._assign_values(method_def.response_type, item2, item, 0)
+                    item = item2
+                yield item
+
+        finally:
+            with self.client_socket.request_lock:
+                if not is_done and self.client_socket.is_alive:
+                    self.client_socket.send_norm([
+                        ServerMessage.StreamCancel,
+                        {'stream_id': stream_id}
+                    ])
+                self.client_socket.close_stream(stream_id)
+
     def _incoming_call(self, method_name, request_data):
         self.call_count += 1
         # print(f'Calling {self.call_count}, {self.socket_type}, {method_name}')
 
+        dispatch = self.dispatch_table.get(method_name) or self._failed_call(method_name)
+        if dispatch.handler is None:
+            return copy.deepcopy(dispatch.empty_response)
+        if dispatch.is_stream:
+            # Streaming methods are only invoked through ServerMessage.StreamOpen
+            return {}
+        return dispatch.encode(dispatch.handler(dispatch.decode(request_data)))
+
+    def _failed_call(self, method_name) -> DispatchInfo:
+        """Records the failed invokation, the empty response of a declared method is kept in the dispatch table."""
         parts = method_name.split('.')
         assert len(parts) == 2
-        assert isinstance(request_data, dict)
+        dispatch = DispatchInfo(method_name, None, empty_response={})
 
         if parts[0] not in self.known_servers or \
                 parts[0] not in self.known_services:
@@ -356,50 +971,180 @@ class RoutingSocket:
                 service_info = self.known_services[parts[0]]
                 if not service_info.service_errors:
                     service_info.service_errors += f'\nFailed invokation: {method_name}'
+                    self.schema_version += 1
                 
             elif parts[0] in g_all_services:
                 global_service_info = g_all_services[parts[0]]
                 if not global_service_info.service_errors:
                     global_service_info.service_errors += f'\nFailed invokation: {method_name}'
+                    self.schema_version += 1
             
             else:
                 # TODO log somewhere else
                 pass
 
-            return {}
-
-        server = self.known_servers[parts[0]]
-        service_info = self.known_services[parts[0]]
-
-        if not hasattr(server.instance, parts[1]) or \
-                parts[1] not in service_info.methods or \
-                service_info.methods[parts[1]].method_errors:
+        else:
+            service_info = self.known_services[parts[0]]
             if parts[1] in service_info.methods:
                 method1 = service_info.methods[parts[1]]
                 response_type = method1.response_type
                 result_obj = [] if response_type.endswith('[]') else self.known_types[response_type].clazz()
                 result_data = [] if response_type.endswith('[]') else {}
                 self._assign_values(response_type, result_obj, result_data, 1)
+                dispatch.empty_response = result_data
+                # Only declared methods are kept, unknown names cannot grow the table
+                self.dispatch_table[method_name] = dispatch
                 if not method1.method_errors:
                     method1.method_errors += f'\nFailed invokation: {method_name}'
-                return result_data
+                    self.schema_version += 1
             else:
                 if not service_info.service_errors:
                     service_info.service_errors += f'\nFailed invokation: {method_name}'
-                return {}
+                    self.schema_version += 1
 
-        method1 = service_info.methods[parts[1]]
-        method2 = getattr(server.instance, parts[1])
-        request_type = method1.request_type
-        response_type = method1.response_type
+        return dispatch
 
-        data_obj = self.known_types[request_type].clazz()
-        self._assign_values(request_type, data_obj, request_data, 0)
-        result_obj = method2(data_obj)
-        result_data = [] if response_type.endswith('[]') else {}
-        self._assign_values(response_type, result_obj, result_data, 1)
+    def _open_stream(self, client_id, request):
+        stream_id = request['stream_id']
+        method_name = request.get('method_name')
+        parts = method_name.split('.') if isinstance(method_name, str) else []
+        error = ''
+        dispatch = self.dispatch_table.get(method_name) if len(parts) == 2 else None
 
-        return result_data
+        if len(parts) != 2 or \
+                parts[0] not in self.known_servers or \
+                parts[0] not in self.known_services:
+            error = f'Unknown service: {method_name}'
+
+        elif dispatch is None or dispatch.handler is None or not dispatch.is_stream:
+            error = f'Unknown streaming method: {method_name}'
+
+        elif self.stream_count >= self.options.max_streams:
+            # Each stream holds a thread until it ends
+            error = f'Too many streams: {method_name}'
+
+        if error:
+            self.server_socket.send_norm(client_id, [
+                ServerMessage.StreamEnd,
+                {'stream_id': stream_id, 'count': 0, 'error': error}
+            ])
+            return
+
+        method_info = self.known_services[parts[0]].methods[parts[1]]
+        stream = StreamInfo(
+            stream_id=stream_id,
+            client_id=client_id,
+            method_name=method_name,
+            response_type=method_info.response_type,
+            generator=None,
+            credit=request['credit'],
+        )
+        if method_info.client_stream:
+            stream.requests = queue.Queue()
+        self.streams[(client_id, stream_id)] = stream
+        self.stream_count += 1
+
+        # Handlers and their generators run on the stream thread, never on the server thread
+        stream.thread = threading.Thread(
+            target=self._run_stream, args=(stream, method_info, dispatch, request.get('method_params')))
+        stream.thread.start()
+
+    def _run_stream(self, stream: StreamInfo, method_info: MethodInfo, dispatch: DispatchInfo, params):
+        error = ''
+        try:
+            if method_info.client_stream:
+                result = dispatch.handler(self._stream_requests(stream, method_info.request_type))
+            else:
+                result = dispatch.handler(dispatch.decode(params))
+            stream.generator = iter(result) if method_info.server_stream else iter([result])
+            while True:
+                # Items are produced only when the client has room for them
+                with stream.condition:
+                    while method_info.server_stream and stream.credit <= 0 and not stream.is_cancelled:
+                        stream.condition.wait()
+                    if stream.is_cancelled:
+                        break
+                    stream.credit -= 1
+                item = next(stream.generator, _STREAM_END)
+                if item is _STREAM_END:
+                    break
+                item_data = [] if stream.response_type.endswith('[]') else {}
+                self._assign_values(stream.response_type, item, item_data, 1)
+                self.server_socket.post_norm(stream.client_id, [
+                    ServerMessage.StreamData,
+                    {'stream_id': stream.stream_id, 'item': item_data}
+                ])
+                stream.count += 1
+        except Exception as ex:
+            error = f'{type(ex).__name__}: {ex}'
+        if hasattr(stream.generator, 'close'):
+            stream.generator.close()
+
+        with self.stream_lock:
+            self.streams.pop((stream.client_id, stream.stream_id), None)
+            self.stream_count -= 1
+        if not stream.is_cancelled:
+            self.server_socket.post_norm(stream.client_id, [
+                ServerMessage.StreamEnd,
+                {'stream_id': stream.stream_id, 'count': stream.count, 'error': error}
+            ])
+
+    def _stream_requests(self, stream: StreamInfo, request_type):
+        """Request iterator given to the handler, credit is returned to the client as requests are consumed."""
+        while not stream.is_cancelled:
+            request_data = stream.requests.get()
+            if request_data is _STREAM_END:
+                break
+            stream.consumed += 1
+            if stream.consumed >= max(stream.window // 2, 1):
+                self.server_socket.post_norm(stream.client_id, [
+                    ServerMessage.StreamCredit,
+                    {'stream_id': stream.stream_id, 'credit': stream.consumed}
+                ])
+                stream.consumed = 0
+            if request_type == DYNAMIC_OBJECT:
+                yield request_data
+            else:
+                request_obj = [] if request_type.endswith('[]') else self.known_types[request_type].clazz()
+                self._assign_values(request_type, request_obj, request_data, 0)
+                yield request_obj
+
+    def _stream_message(self, client_id, message, request):
+        with self.stream_lock:
+            if message == ServerMessage.StreamOpen:
+                self._open_stream(client_id, request)
+                return
+
+            stream = self.streams.get((client_id, request['stream_id']))
+            if not stream:
+                return
+
+            if message == ServerMessage.StreamCredit:
+                with stream.condition:
+                    stream.credit += request['credit']
+                    stream.condition.notify()
+
+            elif message == ServerMessage.StreamData and stream.requests:
+                stream.requests.put(request['item'])
+
+            elif message == ServerMessage.StreamEnd and stream.requests:
+                stream.requests.put(_STREAM_END)
+
+            elif message == ServerMessage.StreamCancel:
+                del self.streams[(client_id, stream.stream_id)]
+                self._cancel_stream(stream)
+
+    def _cancel_stream(self, stream: StreamInfo):
+        with stream.condition:
+            stream.is_cancelled = True
+            stream.condition.notify()
+        if stream.requests:
+            stream.requests.put(_STREAM_END)
+
+    def _close_streams(self, client_id):
+        with self.stream_lock:
+            for key in [x for x in self.streams.keys() if x[0] == client_id]:
+                self._cancel_stream(self.streams.pop(key))
 
     def _add_types(self, types):
         if isinstance(types, list) and \
@@ -451,6 +1196,8 @@ class RoutingSocket:
             else:
                 assert False, f'Missing metadata: {type_name}'
 
+        self.schema_version += 1
+
     def _add_server(self, server_type, server_instance):
         server_name = type(server_instance).__name__
         service_name = server_type.__name__
@@ -473,6 +1220,7 @@ class RoutingSocket:
                 server_sig = inspect.signature(handler)
             service_req_type = None
             server_req_type = None
+            server_req_stream = False
             for key, item3 in service_sig.parameters.items():
                 if key == 'self':
                     continue
@@ -482,6 +1230,7 @@ class RoutingSocket:
                 if key == 'self':
                     continue
                 server_req_type = get_simple_type(item3.annotation)
+                server_req_stream = is_stream_type(item3.annotation)
                 break
             service_res_type = get_simple_type(service_sig.return_annotation)
             server_res_type = get_simple_type(server_sig.return_annotation)
@@ -506,6 +1255,11 @@ class RoutingSocket:
                 method_info.method_errors += \
                     f'\nUnknown parameter type! {method_name}, {server_req_type}'
                 continue
+            elif is_stream_type(server_sig.return_annotation) != method_info.server_stream or \
+                    server_req_stream != method_info.client_stream:
+                method_info.method_errors += \
+                    f'\nServer signature mismatch in streaming! {server_name}, {method_name}'
+                continue
 
             assert server_res_type[0:-2] if server_res_type.endswith('[]') else server_res_type in self.known_types
             assert handler and handler.__name__ == method_name
@@ -515,8 +1269,18 @@ class RoutingSocket:
                 request_type=server_req_type,
                 response_type=server_res_type,
                 id_value=method_info.id_value,
-                local=True
+                local=True,
+                server_stream=method_info.server_stream,
+                client_stream=method_info.client_stream,
+                cache_ttl=method_info.cache_ttl,
+                cache_size=method_info.cache_size,
+                coalesce=method_info.coalesce,
             )
+            if method_info.coalesce and not method_info.server_stream and not method_info.client_stream:
+                self.coalesced_methods.add(f'{service_name}.{method_name}')
+            if method_info.cache_ttl > 0 and not method_info.server_stream and not method_info.client_stream:
+                full_name = f'{service_name}.{method_name}'
+                self.response_caches[full_name] = ResponseCache(full_name, method_info.cache_ttl, method_info.cache_size)
         server_info = ServerInfo(
             server_name=server_name,
             service_name=service_name,
@@ -524,17 +1288,72 @@ class RoutingSocket:
             instance=server_instance,
         )
         self.known_servers[service_name] = server_info
+        self.dispatch_table.update(self._get_dispatch(service_name))
+
+    def _get_dispatch(self, service_name) -> Dict[str, DispatchInfo]:
+        """Handlers and codecs of the methods of one server that can be invoked."""
+        server = self.known_servers[service_name]
+        service_info = self.known_services.get(service_name)
+        table: Dict[str, DispatchInfo] = {}
+        if service_info is None:
+            return table
+        for method_name, method_info in service_info.methods.items():
+            if method_info.method_errors or not hasattr(server.instance, method_name):
+                continue
+            type_info = self.known_types.get(method_info.request_type)
+            table[f'{service_name}.{method_name}'] = DispatchInfo(
+                method_name=f'{service_name}.{method_name}',
+                handler=getattr(server.instance, method_name),
+                request_type=method_info.request_type,
+                response_type=method_info.response_type,
+                request_clazz=type_info.clazz if type_info else None,
+                is_stream=method_info.server_stream or method_info.client_stream,
+            )
+        return table
+
+    def _update_dispatch(self):
+        """Rebuilds the dispatch table after a schema change, replaced at once for the worker threads."""
+        table: Dict[str, DispatchInfo] = {}
+        for service_name in self.known_servers.keys():
+            table.update(self._get_dispatch(service_name))
+        self.dispatch_table = table
+
+    def _get_snapshot(self, method_name, req, active_client_id=0, as_bytes=False):
+        """GetAppInfo or GetSchema response, rebuilt only when the schema, the metadata or the client set changes."""
+        server_socket = self.server_socket
+        key = json.dumps([
+            method_name,
+            self.schema_version,
+            server_socket.client_version if server_socket else 0,
+            server_socket.metadata_version if server_socket else 0,
+            active_client_id,
+            req,
+        ], sort_keys=True).encode()
+        snapshot = self.snapshot_cache.get(key)
+        if snapshot is None:
+            if method_name == RoutingMessage.GetAppInfo:
+                resp = self._get_app_info(req)
+            else:
+                resp = self._get_schema(req, active_client_id=active_client_id)
+            snapshot = [resp, json.dumps(resp).encode()]
+            self.snapshot_cache.put(key, snapshot)
+        return snapshot[1] if as_bytes else snapshot[0]
 
     def _get_app_info(self, req) -> ApplicationInfo:
+        client_socket = self._get_client_socket()
         this_socket = ''
         if self.socket_type == SocketType.BIND:
-            this_socket = f'{self.server_socket.port}'
-        else:
-            this_socket = f'{self.client_socket.port}:{self.client_socket.client_id}'
+            this_socket = f'{self.port}'
+        elif client_socket:
+            this_socket = f'{client_socket.port}:{client_socket.client_id}'
 
+        server_socket = self.server_socket
         clients: list[ApplicationInfo.AppClientInfo] = []
-        if self.socket_type == SocketType.BIND and req.get('with_clients', False):
-            for item in self.server_socket.clients:
+        if server_socket and req.get('with_clients', False):
+            for item in self._get_page(
+                    server_socket.get_client_full(),
+                    self._get_page_value(req, 'offset'),
+                    self._get_page_value(req, 'limit')):
                 clients.append(ApplicationInfo.AppClientInfo(
                     client_id=item.client_id,
                     is_validated=item.is_validated,
@@ -542,18 +1361,40 @@ class RoutingSocket:
                     socket_name=item.client_metadata['socket_name'],
                 ))
 
+        client_history: list[ClientHistoryInfo] = []
+        if server_socket and req.get('with_history', False):
+            client_history = self.server_socket.get_client_history()
+
+        queue = None
+        if server_socket and req.get('with_queue', False):
+            queue = self.server_socket.get_queue_info()
+
+        caches = []
+        if req.get('with_caches', False):
+            caches = [x.get_info() for x in list(self.response_caches.values()) + list(self.client_caches.values())]
+
+        client_count = 0
+        if server_socket:
+            client_count = len(server_socket.clients) + len(server_socket.lost_clients)
+        elif self.web_server:
+            client_count = len(self.web_server.get_connections())
+
         return ApplicationInfo(
             server_id=self.port,
-            client_id=0 if self.socket_type == SocketType.BIND else self.client_socket.client_id,
+            client_id=self.client_id,
             is_alive=self.is_alive,
             is_ready=self.is_ready,
             types=len(self.known_types),
             services=len(self.known_services),
             servers=len(self.known_servers),
-            metadata=self.client_socket.server_metadata if self.socket_type == SocketType.CONNECT else self.server_socket.metadata,
+            metadata=client_socket.server_metadata if client_socket else
+            server_socket.metadata if server_socket else None,
             this_socket=this_socket,
-            client_count=0 if self.socket_type == SocketType.CONNECT else len(self.server_socket.clients),
+            client_count=client_count,
             clients=clients,
+            client_history=client_history,
+            queue=queue,
+            caches=caches,
             socket_name=self.socket_name,
             ip_address=self.ip_address,
             port=self.port,
@@ -561,10 +1402,29 @@ class RoutingSocket:
         )
 
     def _get_schema(self, req, active_client_id=None) -> SchemaInfo:
+        """Schema of this socket.
+
+        Types and services can be filtered by a 'filter' substring of their names and paged
+        with 'type_offset', 'service_offset' and 'limit', fields and methods follow their type
+        or service. 'sections' limits the response to the named lists.
+        """
+        req = req or {}
+        name_filter = req.get('filter', '')
+        sections = req.get('sections') or ['types', 'fields', 'services', 'methods', 'clients', 'servers']
+        type_names = [
+            x for x in self.known_types.keys()
+            if x != DYNAMIC_OBJECT and name_filter in x
+        ]
+        service_names = [x for x in self.known_services.keys() if name_filter in x]
+        total_types = len(type_names)
+        total_services = len(service_names)
+        limit = self._get_page_value(req, 'limit')
+        type_names = self._get_page(type_names, self._get_page_value(req, 'type_offset'), limit)
+        service_names = self._get_page(service_names, self._get_page_value(req, 'service_offset'), limit)
+
         types: SchemaInfo.SchemaTypeInfo = []
-        for key, value in self.known_types.items():
-            if key == DYNAMIC_OBJECT:
-                continue
+        for key in type_names if 'types' in sections else []:
+            value = self.known_types[key]
             types.append(SchemaInfo.SchemaTypeInfo(
                 type_name=key,
                 size=-1,
@@ -574,8 +1434,8 @@ class RoutingSocket:
             ))
 
         fields: SchemaInfo.SchemaFieldInfo = []
-        for key, value in self.known_types.items():
-            for key2, field2 in value.fields.items():
+        for key in type_names if 'fields' in sections else []:
+            for key2, field2 in self.known_types[key].fields.items():
                 assert field2.field_type
                 fields.append(SchemaInfo.SchemaFieldInfo(
                     type_name=key,
@@ -590,7 +1450,8 @@ class RoutingSocket:
                 assert key2 == field2.field_name
 
         services: SchemaInfo.SchemaServiceInfo = []
-        for service_name, service_info in self.known_services.items():
+        for service_name in service_names if 'services' in sections else []:
+            service_info = self.known_services[service_name]
             services.append(SchemaInfo.SchemaServiceInfo(
                 service_name=service_info.service_name,
                 methods=len(service_info.methods),
@@ -601,7 +1462,8 @@ class RoutingSocket:
             assert service_name == service_info.service_name
 
         methods: SchemaInfo.SchemaMethodInfo = []
-        for service_name, service_info in self.known_services.items():
+        for service_name in service_names if 'methods' in sections else []:
+            service_info = self.known_services[service_name]
             for method_name, method_info in service_info.methods.items():
                 methods.append(SchemaInfo.SchemaMethodInfo(
                     service_name=service_info.service_name,
@@ -610,13 +1472,16 @@ class RoutingSocket:
                     response_type=method_info.response_type,
                     id_value=method_info.id_value,
                     local=method_info.local,
+                    server_stream=method_info.server_stream,
+                    client_stream=method_info.client_stream,
+                    cache_ttl=method_info.cache_ttl,
                     method_errors=method_info.method_errors,
                 ))
 
+        # Peer state is swept by the server thread, the client set is current
         clients: SchemaInfo.SchemaClientInfo = []
-        if self.socket_type == SocketType.BIND:
-            self.server_socket.update()
-            for item in self.server_socket.clients:
+        if self.server_socket and 'clients' in sections:
+            for item in self.server_socket.get_client_full():
                 clients.append(SchemaInfo.SchemaClientInfo(
                     main_port=self.server_socket.port,
                     client_id=item.client_id,
@@ -626,42 +1491,61 @@ class RoutingSocket:
                     client_metadata=item.client_metadata,
                 ))
 
+        client_socket = self._get_client_socket()
         servers: SchemaInfo.SchemaServerInfo = []
-        if self.socket_type == SocketType.CONNECT:
+        if client_socket and client_socket.server_metadata and 'servers' in sections:
             servers.append(SchemaInfo.SchemaServerInfo(
-                port=self.client_socket.port,
-                socket_name=self.client_socket.server_metadata['socket_name'],
-                server_metadata=self.client_socket.server_metadata,
+                port=client_socket.port,
+                socket_name=client_socket.server_metadata['socket_name'],
+                server_metadata=client_socket.server_metadata,
             ))
 
         this_socket = ''
         if self.socket_type == SocketType.BIND:
-            this_socket = f'{self.server_socket.port}'
-        else:
-            this_socket = f'{self.client_socket.port}:{self.client_socket.client_id}'
+            this_socket = f'{self.port}'
+        elif client_socket:
+            this_socket = f'{client_socket.port}:{client_socket.client_id}'
 
         return SchemaInfo(
             server_id=self.port,
-            client_id=0 if self.socket_type == SocketType.BIND else self.client_socket.client_id,
+            client_id=self.client_id,
             types=types,
             services=services,
             fields=fields,
             methods=methods,
-            metadata=self.server_socket.metadata if self.socket_type == SocketType.BIND else self.client_socket.metadata,
+            metadata=client_socket.metadata if client_socket else
+            self.server_socket.metadata if self.server_socket else None,
             active_client=active_client_id or 0,
             this_socket=this_socket,
             clients=clients,
             servers=servers,
             socket_name=self.socket_name,
+            schema_hash=self._get_schema_hash(),
+            total_types=total_types,
+            total_services=total_services,
         )
 
+    def _get_page(self, items: list, offset: int, limit: int):
+        return items[offset:offset + limit] if limit else items[offset:]
+
+    def _get_page_value(self, req: dict, key):
+        value = req.get(key, 0)
+        assert isinstance(value, int) and not isinstance(value, bool) and value >= 0, f'Invalid {key}: {value}'
+        return value
+
     def _set_schema(self, req) -> SchemaInfo:
         added1 = self._find_new_fields(req, True)
         added2 = self._find_new_methods(req, True)
+        # Sync may have recorded errors without adding anything, the snapshots are rebuilt anyway
+        self.schema_version += 1
+        # Sync may also have recorded method errors, those methods must not be invoked anymore
+        self._update_dispatch()
+        if self.server_socket and (added1 or added2):
+            self.server_socket.add_metadata({'schema_hash': self._get_schema_hash()})
 
         # print(f'Sync ready: 1, {len(added1)}, {len(added2)}')
 
-        return self._get_schema(req)
+        return self._get_schema(None)
 
     def _assign_values(self, type_name: str, obj_data: any, json_data: dict | list, target: int):
         assign_values(type_name, obj_data, json_data, target)
@@ -669,42 +1553,76 @@ class RoutingSocket:
     def _sync_with_server(self):
         res = self.server_call(RoutingMessage.GetSchema, {})
 
+        self.sync_count += 1
+
         self._find_missing_methods(res)
         added1 = self._find_new_fields(res, True)
         added2 = self._find_new_methods(res, True)
+        self.schema_version += 1
+        self._update_dispatch()
+        self._add_client_caches(res)
 
         # console.log(f'Sync ready: 2, {len(added1)}, {len(added2)}')
 
     def _sync_with_client(self):
         req = self._get_schema(None)
         res = self.server_call(RoutingMessage.SetSchema, req)
+        self.sync_count += 1
         added1 = self._find_new_fields(res, False)
         added2 = self._find_new_methods(res, False)
+        self.schema_version += 1
+        self._update_dispatch()
         assert len(added1) == 0
         assert len(added2) == 0
         # console.log(f'Sync ready: 3, {len(added1)}, {len(added2)}')
 
+    def _add_client_caches(self, schema: SchemaInfo):
+        """Client cache for the methods the server declared cacheable."""
+        if self.options.client_cache_size <= 0:
+            return
+        for item in schema['methods']:
+            if item.get('cache_ttl', 0) > 0 and not item['server_stream'] and not item['client_stream']:
+                full_name = f'{item["service_name"]}.{item["method_name"]}'
+                self.client_caches[full_name] = ResponseCache(
+                    full_name, item['cache_ttl'], self.options.client_cache_size)
+        # Calls looked up before hold the replaced caches
+        self.call_table = {}
+
+    def _get_schema_hash(self):
+        return get_schema_hash(self.known_types, self.known_services)
+
+    def _find_local_server(self):
+        if self.options.local_call_policy == LocalCallPolicy.DISABLED:
+            return
+        server_metadata = self.client_socket.server_metadata or {}
+        if server_metadata.get('process_token') != g_process_token:
+            return
+        with g_local_lock:
+            self.local_server = g_local_servers.get(get_endpoint(self.protocol_type, self.ip_address, self.port))
+
     def _find_new_fields(self, schema, do_add):
         to_add = []
+        schema_fields = group_by(schema['fields'], lambda x: x['type_name'])
         for server_type_info in schema['types']:
             type_name = server_type_info['type_name']
-            type_fields = find_all(schema['fields'], lambda x: x['type_name'] == type_name)
+            type_fields = schema_fields.get(type_name, [])
             assert type_name
             if type_name not in self.known_types:
                 pass
             else:
                 known_type = self.known_types[type_name]
+                known_ids = None
                 for field_info in type_fields:
                     field_name = field_info['field_name']
                     field_type = field_info['field_type']
                     assert field_name
                     assert 'id_value' in field_info
                     if field_name not in known_type.fields:
-                        for key2, item2 in known_type.fields.items():
-                            if item2.id_value == field_info['id_value']:
-                                item2.field_errors += \
-                                    f'\nDuplicate id! {type_name}.{field_name}, {key2}={item2.id_value}'
-                                continue
+                        if known_ids is None:
+                            known_ids = group_by(known_type.fields.items(), lambda x: x[1].id_value)
+                        for key2, item2 in known_ids.get(field_info['id_value'], []):
+                            item2.field_errors += \
+                                f'\nDuplicate id! {type_name}.{field_name}, {key2}={item2.id_value}'
                         to_add.append({
                             'type_name': type_name,
                             'field_name': field_name,
@@ -728,7 +1646,7 @@ class RoutingSocket:
                 assert known_fields
                 known_fields.fields[item['field_name']] = FieldInfo(
                     field_name=item['field_name'],
-                    field_type=item['type_name'],
+                    field_type=item['field_type'],
                     id_value=item['id_value'],
                     offset=-1,
                     size=-1,
@@ -739,30 +1657,32 @@ class RoutingSocket:
 
     def _find_new_methods(self, schema, do_add):
         to_add = []
+        schema_methods = group_by(schema['methods'], lambda x: x['service_name'])
         for service_info in schema['services']:
             service_name = service_info['service_name']
-            service_methods = find_all(schema['methods'], lambda x: x['service_name'] == service_name)
+            service_methods = schema_methods.get(service_name, [])
             if service_name not in self.known_services:
                 pass
             else:
                 my_service_info = self.known_services[service_name]
+                my_ids = None
                 for method_info in service_methods:
                     method_name = method_info['method_name']
                     assert method_info['id_value'] > 0
                     if method_name not in my_service_info.methods:
-                        for key2, item2 in my_service_info.methods.items():
-                            key3 = item2.method_name
-                            assert key2 == key3
-                            if item2.id_value == method_info['id_value']:
-                                item2.method_errors += \
-                                    f'\nDuplicate id! {service_name}.{method_name}, {item2.id_value}, {method_info["id_value"]}'
-                                continue
+                        if my_ids is None:
+                            my_ids = group_by(my_service_info.methods.values(), lambda x: x.id_value)
+                        for item2 in my_ids.get(method_info['id_value'], []):
+                            item2.method_errors += \
+                                f'\nDuplicate id! {service_name}.{method_name}, {item2.id_value}, {method_info["id_value"]}'
                         to_add.append({
                             'service_name': service_name,
                             'method_name': method_name,
                             'id_value': method_info['id_value'],
                             'request_type': method_info['request_type'],
                             'response_type': method_info['response_type'],
+                            'server_stream': method_info.get('server_stream', False),
+                            'client_stream': method_info.get('client_stream', False),
                         })
                     else:
                         my_method = my_service_info.methods[method_name]
@@ -782,34 +1702,51 @@ class RoutingSocket:
                         request_type=item['request_type'],
                         response_type=item['response_type'],
                         id_value=item['id_value'],
-                        local=False
+                        local=False,
+                        server_stream=item['server_stream'],
+                        client_stream=item['client_stream'],
                 )
 
         return to_add
 
     def _find_missing_methods(self, schema):
+        remote_services = set(x['service_name'] for x in schema['services'])
+        remote_methods = set((x['service_name'], x['method_name']) for x in schema['methods'])
         for service_name, my_service_info in self.known_services.items():
-            remote_service_info = find(schema['services'], lambda x: x['service_name'] == service_name)
-            remote_service_methods = find_all(schema['methods'], lambda x: x['service_name'] == service_name)
-            if not remote_service_info:
+            if service_name not in remote_services:
                 my_service_info.service_errors += \
                     f'\nMissing remote service! {service_name}'
                 continue
             for method_name, my_method_info in my_service_info.methods.items():
                 assert my_method_info.id_value > 0
-                if not find(remote_service_methods, lambda x: x['method_name'] == method_name):
+                if (service_name, method_name) not in remote_methods:
                     my_method_info.method_errors += \
                         f'\nMissing remote method! {service_name}.{method_name}'
                     continue
 
     @property
     def client_id(self):
-        return self.client_socket.client_id if self.socket_type == SocketType.CONNECT else 0
+        client_socket = self._get_client_socket()
+        return client_socket.client_id if client_socket else 0
+
+    def _get_client_socket(self) -> ClientSocket | None:
+        """Connection of a connecting socket, for a pool the one of a healthy endpoint."""
+        if self.endpoint_pool:
+            endpoints = self.endpoint_pool.endpoints
+            endpoint = next((x for x in endpoints if x.is_healthy()), endpoints[0])
+            return endpoint.socket.client_socket
+        return self.client_socket
 
     def wait(self):
         try:
-            if self.socket_type == SocketType.BIND:
+            if self.web_server:
+                while self.is_alive:
+                    time.sleep(0.1)
+            elif self.socket_type == SocketType.BIND:
                 self.server_socket.wait()
+            elif self.endpoint_pool:
+                while self.is_alive:
+                    time.sleep(0.1)
             else:
                 self.client_socket.wait()
         except KeyboardInterrupt:
@@ -819,14 +1756,35 @@ class RoutingSocket:
 
     def close(self):
         self.is_alive = False
+        self.local_server = None
         if self.socket_type == SocketType.BIND:
+            with g_local_lock:
+                endpoint = get_endpoint(self.protocol_type, self.ip_address, self.port)
+                if g_local_servers.get(endpoint) is self:
+                    del g_local_servers[endpoint]
+        if self.server_socket:
             self.server_socket.is_alive = False
-        else:
+        if self.client_socket:
             self.client_socket.is_alive = False
-        self.processor.join()
-        if self.socket_type == SocketType.BIND:
+        if self.processor:
+            self.processor.join()
+        if self.worker:
+            self.worker.join()
+        if self.web_server:
+            self.web_server.close()
+        if self.endpoint_pool:
+            self.endpoint_pool.close()
+        if self.publisher:
+            self.publisher.close()
+        if self.subscriber:
+            self.subscriber.close()
+        self.publisher = None
+        self.subscriber = None
+        self.web_server = None
+        self.endpoint_pool = None
+        if self.server_socket:
             self.server_socket.close()
-        else:
+        if self.client_socket:
             self.client_socket.close()
         self.server_socket = None
         self.client_socket = None
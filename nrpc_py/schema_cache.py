@@ -0,0 +1,184 @@
+#
+#   Contents:
+#
+#       SCHEMA_CACHE_VERSION
+#       get_declaration
+#       get_declaration_hash
+#       get_cache_path
+#       export_schema
+#       load_schema
+#       main
+#
+#   Usage:
+#
+#       python -m nrpc_py.schema_cache modules=app.models,app.services cache=/var/cache/app
+#
+import os
+import json
+import hashlib
+import inspect
+import importlib
+from .common_base import (
+    FieldInfo,
+    MethodInfo,
+    ClassInfo,
+    ServiceInfo,
+    CommandLine,
+    g_all_types,
+    g_all_services,
+    g_pending_classes,
+    g_declared_classes,
+    g_register_lock,
+    register_all,
+)
+
+SCHEMA_CACHE_VERSION = 1
+
+
+def get_declaration(clazz: type, pending_fields: dict):
+    """Fingerprint of what rpcclass was given, read from the class without instantiating or inspecting it."""
+    annotations = [x.__dict__['__annotations__'] for x in clazz.__mro__ if '__annotations__' in x.__dict__]
+    methods = [
+        getattr(clazz, x).__annotations__ for x in pending_fields.keys()
+        if inspect.isfunction(getattr(clazz, x, None))
+    ]
+    declaration = [clazz.__module__, clazz.__qualname__, pending_fields, annotations, methods]
+    return hashlib.sha256(repr(declaration).encode()).hexdigest()
+
+
+def get_declaration_hash():
+    """Fingerprint of all declared classes, changes with any declaration."""
+    declarations = sorted(
+        [type_name, get_declaration(clazz, pending_fields)]
+        for type_name, (clazz, pending_fields) in g_declared_classes.items()
+    )
+    return hashlib.sha256(json.dumps(declarations).encode()).hexdigest()
+
+
+def get_cache_path(path: str, schema_hash=None):
+    """Cache file of the current declarations when 'path' is a folder."""
+    if os.path.isdir(path):
+        return os.path.join(path, f'nrpc_schema_{(schema_hash or get_declaration_hash())[:32]}.json')
+    return path
+
+
+def export_schema(path: str):
+    """Writes the registered schema of all declared classes, returns the file name."""
+    register_all()
+    schema_hash = get_declaration_hash()
+    path = get_cache_path(path, schema_hash)
+    types = {}
+    services = {}
+    for type_name, (clazz, pending_fields) in g_declared_classes.items():
+        declaration = get_declaration(clazz, pending_fields)
+        if type_name in g_all_types:
+            types[type_name] = {
+                'declaration': declaration,
+                'fields': [
+                    [x.field_name, x.field_type, x.id_value]
+                    for x in g_all_types[type_name].fields.values()
+                ],
+            }
+        elif type_name in g_all_services:
+            services[type_name] = {
+                'declaration': declaration,
+                'methods': [
+                    [x.method_name, x.request_type, x.response_type, x.id_value, x.server_stream,
+                     x.client_stream, x.cache_ttl, x.cache_size, x.coalesce]
+                    for x in g_all_services[type_name].methods.values()
+                ],
+            }
+    schema = {
+        'version': SCHEMA_CACHE_VERSION,
+        'schema_hash': schema_hash,
+        'types': types,
+        'services': services,
+    }
+    # Workers may read the file while it is replaced
+    with open(f'{path}.tmp', 'w') as file:
+        json.dump(schema, file)
+    os.replace(f'{path}.tmp', path)
+    return path
+
+
+def load_schema(path: str):
+    """Registers the pending classes from a cache file, returns how many were loaded.
+
+    Classes whose declaration changed since the export are skipped, they are registered
+    from their declaration on first use. A missing or outdated file loads nothing.
+    """
+    schema_hash = get_declaration_hash() if os.path.isdir(path) else None
+    path = get_cache_path(path, schema_hash)
+    try:
+        with open(path) as file:
+            schema = json.load(file)
+    except (OSError, ValueError):
+        return 0
+    if schema.get('version') != SCHEMA_CACHE_VERSION:
+        return 0
+    # File of the current declarations, the classes need no checking one by one
+    is_current = schema_hash is not None and schema['schema_hash'] == schema_hash
+
+    count = 0
+    with g_register_lock:
+        for type_name, item in schema['types'].items():
+            pending = g_pending_classes.get(type_name)
+            if pending is None or \
+                    not is_current and get_declaration(pending[0], pending[1]) != item['declaration']:
+                continue
+            del g_pending_classes[type_name]
+            g_all_types[type_name] = ClassInfo(
+                type_name=type_name,
+                fields={
+                    x[0]: FieldInfo(field_name=x[0], field_type=x[1], id_value=x[2], offset=-1, size=-1, local=True)
+                    for x in item['fields']
+                },
+                size=-1,
+                clazz=pending[0],
+                local=True
+            )
+            count += 1
+
+        for service_name, item in schema['services'].items():
+            pending = g_pending_classes.get(service_name)
+            if pending is None or \
+                    not is_current and get_declaration(pending[0], pending[1]) != item['declaration']:
+                continue
+            del g_pending_classes[service_name]
+            g_all_services[service_name] = ServiceInfo(
+                service_name=service_name,
+                methods={
+                    x[0]: MethodInfo(
+                        method_name=x[0],
+                        request_type=x[1],
+                        response_type=x[2],
+                        id_value=x[3],
+                        local=True,
+                        server_stream=x[4],
+                        client_stream=x[5],
+                        cache_ttl=x[6],
+                        cache_size=x[7],
+                        coalesce=x[8],
+                    ) for x in item['methods']
+                },
+                local=True,
+                clazz=pending[0]
+            )
+            count += 1
+    return count
+
+
+def main():
+    cmd = CommandLine({
+        'modules': '',
+        'cache': '.',
+    })
+    for module_name in cmd['modules'].split(','):
+        if module_name:
+            importlib.import_module(module_name)
+    path = export_schema(cmd['cache'])
+    print(f'Exported {len(g_declared_classes)} classes: {path}')
+
+
+if __name__ == '__main__':
+    main()
@@ -7,17 +7,32 @@
 #           get_client_change
 #           recv_norm
 #           send_norm
+#           post_norm
+#           push_work
+#           pop_work
 #           send_rev
 #           recv_rev
+#           next_call
 #           _add_client
+#           _resume_client
 #           _track_client
 #           _recv_norm_step
 #           _recv_rev_step
+#           _flush_norm
+#           _set_client_lost
+#           _probe_client
+#           _sweep_clients
+#           _evict_clients
 #           _get_buffer
+#           _is_same_host
+#           _get_peer_prefix
 #           _forward_call
 #           get_client_ids
 #           get_client_full
 #           get_client_info
+#           get_client_history
+#           get_queue_info
+#           is_client_alive
 #           add_metadata
 #           update
 #           wait
@@ -30,7 +45,28 @@ import threading
 import zmq
 import time
 import socket as _socket
-from .common_base import ClientInfo, ServerMessage, find, SocketMetadataInfo
+import struct
+import itertools
+from collections import deque
+from typing import Dict, Callable
+from .common_base import (
+    ClientInfo,
+    ClientHistoryInfo,
+    QueueInfo,
+    ServerMessage,
+    SocketMetadataInfo,
+    RoutingSocketOptions,
+    split_call_headers,
+    join_call_headers,
+    get_call_deadline,
+    get_endpoint,
+    ProtocolType,
+    g_process_token,
+)
+from .shared_buffer import SharedBufferPool, SHARED_HEADER, get_segment_prefix, get_missing_reply
+
+# Notify endpoints are unique for the process, ids of collected sockets are reused
+g_notify_ids = itertools.count(1)
 
 
 class ServerSocket:
@@ -38,32 +74,75 @@ class ServerSocket:
     ip_address: str
     port: int
     port_rev: int
+    protocol: ProtocolType
     socket_name: str
     next_index: int
+    next_call_id: int
     server_signature: bytes
     server_signature_rev: bytes
-    clients: list[ClientInfo]
+    clients: Dict[int, ClientInfo]
+    clients_by_signature: Dict[bytes, ClientInfo]
+    lost_clients: Dict[int, ClientInfo]
+    lost_clients_memory: int
+    client_history: deque[ClientHistoryInfo]
+    evicted_count: int
+    resumed_count: int
+    client_version: int
+    metadata_version: int
     metadata: SocketMetadataInfo
     zmq_context: zmq.Context
     zmq_server: zmq.Socket
     zmq_server_rev: zmq.Socket
     zmq_monitor: zmq.Socket
+    zmq_monitor_rev: zmq.Socket
     zmq_monitor_thread: threading.Thread
+    zmq_notify: zmq.Socket
+    zmq_notify_recv: zmq.Socket
+    zmq_poller: zmq.Poller
     request_lock: threading.Lock
+    notify_lock: threading.Lock
+    clients_lock: threading.Lock
+    work_condition: threading.Condition
     is_alive: bool
+    liveness_interval: float
+    lost_client_max_age: float
+    lost_client_max_count: int
+    lost_client_max_memory: int
+    work_queue_size: int
+    accepted_count: int
+    rejected_count: int
+    expired_count: int
+    coalesced_count: int
+    max_queue_depth: int
+    next_sweep: float
+    sweep_pending: bool
+    lost_callback: Callable[[int], None] | None
     norm_messages_: list[bytes]
     rev_messages_: list[bytes]
+    shared_buffers: SharedBufferPool
+    outgoing_norm_: deque[list]
+    work_queue_: deque[list]
 
-    def __init__(self, ip_address, port, port_rev, socket_name):
+    def __init__(self, ip_address, port, port_rev, socket_name, options: RoutingSocketOptions = None):
         self.server_id = 0
         self.ip_address = ip_address
         self.port = port
         self.port_rev = port_rev
+        self.protocol = options.protocol if options else ProtocolType.TCP
         self.socket_name = socket_name
         self.next_index = 0
+        self.next_call_id = 0
         self.server_signature = b'server:0'
         self.server_signature_rev = b'rev:server:0'
-        self.clients = []
+        self.clients = {}
+        self.clients_by_signature = {}
+        self.lost_clients = {}
+        self.lost_clients_memory = 0
+        self.client_history = deque(maxlen=options.client_history_size if options else 100)
+        self.evicted_count = 0
+        self.resumed_count = 0
+        self.client_version = 0
+        self.metadata_version = 0
         self.metadata = SocketMetadataInfo(
             server_id=0,
             lang='python',
@@ -75,18 +154,46 @@ class ServerSocket:
             start_time=datetime.datetime.now().isoformat(),
             server_signature=base64.b64encode(self.server_signature).decode('ascii'),
             server_signature_rev=base64.b64encode(self.server_signature_rev).decode('ascii'),
+            process_token=g_process_token,
         )
 
         self.request_lock = threading.Lock()
+        self.notify_lock = threading.Lock()
+        # Client tables change on the server thread and are listed from the others
+        self.clients_lock = threading.Lock()
+        self.work_condition = threading.Condition()
         self.is_alive = True
+        self.liveness_interval = options.liveness_interval if options else 1.0
+        self.lost_client_max_age = options.lost_client_max_age if options else 300.0
+        self.lost_client_max_count = options.lost_client_max_count if options else 1000
+        self.lost_client_max_memory = options.lost_client_max_memory if options else 16 * 1024 * 1024
+        self.work_queue_size = options.work_queue_size if options else 1000
+        self.accepted_count = 0
+        self.rejected_count = 0
+        self.expired_count = 0
+        self.coalesced_count = 0
+        self.max_queue_depth = 0
+        self.next_sweep = 0
+        self.sweep_pending = False
+        self.lost_callback = None
         self.norm_messages_ = []
         self.rev_messages_ = []
+        self.shared_buffers = SharedBufferPool(
+            options.shared_memory_threshold if options else 0,
+            options.shared_memory_ttl if options else 60.0,
+        )
+        self.outgoing_norm_ = deque()
+        self.work_queue_ = deque()
 
         self.zmq_context = None
         self.zmq_server = None
         self.zmq_server_rev = None
         self.zmq_monitor = None
+        self.zmq_monitor_rev = None
         self.zmq_monitor_thread = None
+        self.zmq_notify = None
+        self.zmq_notify_recv = None
+        self.zmq_poller = None
 
         self.zmq_context = zmq.Context.instance()
 
@@ -96,16 +203,34 @@ class ServerSocket:
         zmq_server_rev = self.zmq_context.socket(zmq.ROUTER)
         zmq_server_rev.set(zmq.IDENTITY, self.server_signature_rev)
 
+        for item in [zmq_server, zmq_server_rev]:
+            item.set(zmq.SNDHWM, options.send_hwm if options else 1000)
+            item.set(zmq.RCVHWM, options.recv_hwm if options else 1000)
+            # Reconnected clients take over the identity of their dropped connection
+            item.set(zmq.ROUTER_HANDOVER, 1)
+
         self.zmq_server = zmq_server
         self.zmq_server_rev = zmq_server_rev
 
-        # self.zmq_monitor = zmq_server.get_monitor_socket(zmq.Event.ALL)
-        # self.zmq_monitor_thread = threading.Thread(target=self._track_client)
-        # self.zmq_monitor_thread.start()
+        # Wakes up the server thread when other threads post messages, see post_norm
+        notify_address = f'inproc://nrpc-notify-{next(g_notify_ids)}'
+        self.zmq_notify_recv = self.zmq_context.socket(zmq.PAIR)
+        self.zmq_notify_recv.bind(notify_address)
+        self.zmq_notify = self.zmq_context.socket(zmq.PAIR)
+        self.zmq_notify.connect(notify_address)
+        self.zmq_poller = zmq.Poller()
+        self.zmq_poller.register(self.zmq_server, zmq.POLLIN)
+        self.zmq_poller.register(self.zmq_notify_recv, zmq.POLLIN)
+
+        # Disconnects only schedule a sweep, peer state is probed from the server thread
+        self.zmq_monitor = zmq_server.get_monitor_socket(zmq.Event.DISCONNECTED)
+        self.zmq_monitor_rev = zmq_server_rev.get_monitor_socket(zmq.Event.DISCONNECTED)
+        self.zmq_monitor_thread = threading.Thread(target=self._track_client)
+        self.zmq_monitor_thread.start()
 
     def bind(self):
-        self.zmq_server.bind(f'tcp://{self.ip_address}:{self.port}')
-        self.zmq_server_rev.bind(f'tcp://{self.ip_address}:{self.port_rev}')
+        self.zmq_server.bind(get_endpoint(self.protocol, self.ip_address, self.port))
+        self.zmq_server_rev.bind(get_endpoint(self.protocol, self.ip_address, self.port_rev))
 
     def get_client_change(self, timeout_seconds, expected_clients):
         """New clients are first added to self.clients, later they show up in self.get_client_ids()."""
@@ -123,6 +248,7 @@ class ServerSocket:
 
     def recv_norm(self):
         while self.is_alive:
+            self.update()
             req = self._recv_norm_step()
             if req is None:
                 continue
@@ -130,11 +256,14 @@ class ServerSocket:
             if req[1] == ServerMessage.AddClient:
                 self._add_client(req)
 
-            elif req[1] == ServerMessage.ForwardCall:
+            elif req[1] == ServerMessage.ResumeClient:
+                self._resume_client(req)
+
+            elif req[1].split(b';')[0] == ServerMessage.ForwardCall:
                 self._forward_call(req)
 
             else:
-                client = find(self.clients, lambda x: x.client_signature == req[0])
+                client = self.clients_by_signature.get(req[0])
                 if not client:
                     # print(f'Unknown client: {req[0]}')
                     continue
@@ -143,42 +272,71 @@ class ServerSocket:
         return 0, None
 
     def send_norm(self, client_id, response):
-        client = find(self.clients, lambda x: x.client_id == client_id)
+        client = self.get_client_info(client_id)
         assert client
         assert len(response) == 2
+        name, buffer = self._get_buffer(response[0]), self._get_buffer(response[1])
+        if self._is_same_host(client):
+            name, buffer = self.shared_buffers.put(name, buffer)
         resp = [
             client.client_signature,
-            self._get_buffer(response[0]),
-            self._get_buffer(response[1]),
+            name,
+            buffer,
         ]
         self.zmq_server.send_multipart(resp)
 
+    def post_norm(self, client_id, response):
+        """Thread-safe variant of send_norm, the message is sent from the server thread."""
+        self.outgoing_norm_.append([client_id, response])
+        with self.notify_lock:
+            try:
+                self.zmq_notify.send(b'', zmq.DONTWAIT)
+            except zmq.error.Again:
+                pass
+
+    def push_work(self, client_id, request):
+        """Queues a call for the worker thread, False when the queue is full and the call is rejected."""
+        with self.work_condition:
+            if len(self.work_queue_) >= self.work_queue_size:
+                self.rejected_count += 1
+                return False
+            self.work_queue_.append([time.time(), client_id, request])
+            self.accepted_count += 1
+            self.max_queue_depth = max(self.max_queue_depth, len(self.work_queue_))
+            self.work_condition.notify()
+        return True
+
+    def pop_work(self, timeout=0.1):
+        """Oldest queued call as [arrival_time, client_id, request], None when idle."""
+        with self.work_condition:
+            if not self.work_queue_:
+                self.work_condition.wait(timeout)
+            if not self.work_queue_:
+                return None
+            return self.work_queue_.popleft()
+
     def send_rev(self, client_id, request):
         assert len(request) == 2
-        client = find(self.clients, lambda x: x.client_id == client_id)
+        client = self.get_client_info(client_id)
         assert client, f'Unknown client: {client_id}'
 
         if client.is_lost:
             # print(f'Old client: {client_id}')
             return
 
+        name, buffer = self._get_buffer(request[0]), self._get_buffer(request[1])
+        if self._is_same_host(client):
+            name, buffer = self.shared_buffers.put(name, buffer)
         req = [
             client.client_signature_rev,
-            self._get_buffer(request[0]),
-            self._get_buffer(request[1]),
+            name,
+            buffer,
         ]
-
-        peer_state = zmq.backend.cython._zmq._zmq_socket_get_peer_state(self.zmq_server, client.client_signature) + 1
-        peer_state_rev = zmq.backend.cython._zmq._zmq_socket_get_peer_state(
-            self.zmq_server_rev, client.client_signature_rev) + 1
-        if peer_state == 0 or peer_state_rev == 0:
-            client.is_lost = True
-            # print(f'Lost client: {client_id}')
-            return
         self.zmq_server_rev.send_multipart(req)
 
-    def recv_rev(self, client_id):
-        client = find(self.clients, lambda x: x.client_id == client_id)
+    def recv_rev(self, client_id, call_id=0, deadline=0):
+        """Response of a reverse call as [name, payload], None when the deadline passes first."""
+        client = self.get_client_info(client_id)
         assert client, f'Unknown client: {client_id}'
         if client.is_lost:
             # print(f'Old client: {client_id}')
@@ -186,12 +344,30 @@ class ServerSocket:
         
         resp = None
         while self.is_alive and not client.is_lost:
-            resp = self._recv_rev_step(client)
+            timeout_ms = 100
+            if deadline:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return None
+                timeout_ms = min(timeout_ms, max(int(remaining * 1000), 1))
+            resp = self._recv_rev_step(client, timeout_ms)
             if resp is None:
                 continue
+            # Late responses of expired calls, possibly from another client
+            if resp[0] != client.client_signature_rev:
+                resp = None
+                continue
+            _, headers = split_call_headers(resp[1].decode())
+            if int(headers.get('id', 0)) != call_id:
+                resp = None
+                continue
             break
         
-        return resp[2] if resp else None
+        return resp[1:3] if resp else None
+
+    def next_call(self):
+        self.next_call_id += 1
+        return self.next_call_id
 
     def _add_client(self, req):
         self.next_index += 1
@@ -204,8 +380,12 @@ class ServerSocket:
             connect_time=datetime.datetime.now(),
             is_validated=False,
             is_lost=False,
+            metadata_size=len(req[2]),
         )
-        self.clients.append(client)
+        with self.clients_lock:
+            self.clients[client.client_id] = client
+            self.clients_by_signature[client.client_signature] = client
+            self.client_version += 1
 
         resp = {
             'client_id': client.client_id,
@@ -243,24 +423,49 @@ class ServerSocket:
             assert base64.b64decode(resp3['client_signature']) == client.client_signature
             # print(f'client validated: {Fore.MAGENTA}server{Fore.RESET} <-> {Fore.MAGENTA}client:{client.client_id}{Fore.RESET}')
             client.is_validated = True
+            self.client_version += 1
+
+    def _resume_client(self, req):
+        """Restores the session of a reconnected client, id, signatures and metadata are unchanged.
+
+        Replies with client id 0 when the session is unknown, e.g. already evicted.
+        """
+        client_id = json.loads(req[2].decode())['client_id']
+        client = self.clients.get(client_id) or self.lost_clients.get(client_id)
+        if not client or client.client_signature != req[0] or not client.is_validated:
+            self.zmq_server.send_multipart([req[0], ServerMessage.ClientResumed, b'{"client_id": 0}'])
+            return
+
+        with self.clients_lock:
+            if self.lost_clients.pop(client_id, None):
+                self.lost_clients_memory -= client.metadata_size
+                client.is_lost = False
+                client.lost_time = 0
+                self.clients[client_id] = client
+                self.clients_by_signature[client.client_signature] = client
+                self.client_version += 1
+        self.resumed_count += 1
+        self.zmq_server.send_multipart([
+            client.client_signature,
+            ServerMessage.ClientResumed,
+            json.dumps({'client_id': client_id}).encode()
+        ])
 
     def _track_client(self):
-        while self.is_alive:
-            parts = []
-            try:
-                part = self.zmq_monitor.recv(zmq.DONTWAIT, copy=True, track=False)
-                parts.append(part)
-            except zmq.error.Again:
-                pass
-            if not parts or not parts[0]:
-                time.sleep(0.1)
-                continue
+        poller = zmq.Poller()
+        poller.register(self.zmq_monitor, zmq.POLLIN)
+        poller.register(self.zmq_monitor_rev, zmq.POLLIN)
 
-            while self.zmq_monitor.getsockopt(zmq.RCVMORE):
-                part = self.zmq_monitor.recv(0, copy=True, track=False)
-                parts.append(part)
+        while self.is_alive:
+            ready = dict(poller.poll(100))
+            if not self.is_alive:
+                break
+            for monitor in ready:
+                parts = monitor.recv_multipart()
+                event_id, value = struct.unpack("=hi", parts[0])
+                if event_id == zmq.Event.DISCONNECTED:
+                    self.sweep_pending = True
 
-            # event_id, value = struct.unpack("=hi", parts[0])
             # print(
             #     'MONITOR',
             #     zmq.Event(event_id),
@@ -270,23 +475,20 @@ class ServerSocket:
 
     def _recv_norm_step(self):
         ready = False
-        ready_timeout = False
 
         while self.is_alive:
-            self.zmq_server.setsockopt(zmq.RCVTIMEO, 100)
-            msg = None
-            try:
-                msg = self.zmq_server.recv()
-            except zmq.error.Again:
-                ready_timeout = True
-            finally:
-                if not self.is_alive:
-                    break
-                self.zmq_server.setsockopt(zmq.RCVTIMEO, -1)
-
+            events = dict(self.zmq_poller.poll(100))
             if not self.is_alive:
                 break
-            if ready_timeout:
+            if self.zmq_notify_recv in events:
+                self._flush_norm()
+            if self.zmq_server not in events:
+                if events:
+                    continue
+                break
+
+            msg = self.zmq_server.recv()
+            if not self.is_alive:
                 break
 
             assert msg
@@ -302,14 +504,20 @@ class ServerSocket:
         while self.norm_messages_:
             self.norm_messages_.pop()
         assert len(messages) == 3
-        return messages
+        if SHARED_HEADER not in messages[1]:
+            return messages
+        resp = self.shared_buffers.load(messages, self._get_peer_prefix(self.clients_by_signature.get(messages[0])))
+        # Calls whose payload is not readable are answered, stream frames have nobody waiting
+        if resp is None and not messages[1].startswith(b'ServerMessage.Stream'):
+            self.zmq_server.send_multipart([messages[0], *get_missing_reply(messages[1])])
+        return resp
     
-    def _recv_rev_step(self, client):
+    def _recv_rev_step(self, client, timeout_ms=100):
         ready = False
         ready_timeout = False
 
         while self.is_alive and not client.is_lost:
-            self.zmq_server_rev.setsockopt(zmq.RCVTIMEO, 100)
+            self.zmq_server_rev.setsockopt(zmq.RCVTIMEO, timeout_ms)
             msg = None
             try:
                 msg = self.zmq_server_rev.recv()
@@ -323,10 +531,8 @@ class ServerSocket:
             if not (self.is_alive and not client.is_lost):
                 break
             if ready_timeout:
-                peer_state = zmq.backend.cython._zmq._zmq_socket_get_peer_state(self.zmq_server, client.client_signature) + 1
-                peer_state_rev = zmq.backend.cython._zmq._zmq_socket_get_peer_state(self.zmq_server_rev, client.client_signature_rev) + 1
-                if peer_state == 0 or peer_state_rev == 0:
-                    client.is_lost = True
+                if not self._probe_client(client):
+                    self._set_client_lost(client)
                     # print(f'Lost client: {client_id}')
                     break
                 break
@@ -344,9 +550,80 @@ class ServerSocket:
         while self.rev_messages_:
             self.rev_messages_.pop()
         assert len(messages) == 3
-        assert messages[0] == client.client_signature_rev, \
-            f'Recv_wait_rev signature mismatch: {messages[0]}, {client.client_signature_rev}'
-        return messages
+        resp = self.shared_buffers.load(messages, self._get_peer_prefix(client))
+        if resp is None:
+            # The waiting reverse call fails instead of running into its deadline
+            return [messages[0], *get_missing_reply(messages[1])]
+        return resp
+
+    def _flush_norm(self):
+        while True:
+            try:
+                self.zmq_notify_recv.recv(zmq.DONTWAIT)
+            except zmq.error.Again:
+                break
+        while self.outgoing_norm_:
+            client_id, response = self.outgoing_norm_.popleft()
+            client = self.clients.get(client_id)
+            if client:
+                self.send_norm(client_id, response)
+
+    def _set_client_lost(self, client: ClientInfo):
+        """Moves a client out of the live indexes, lost clients are kept for diagnostics only."""
+        with self.clients_lock:
+            client.is_lost = True
+            client.lost_time = time.time()
+            self.client_version += 1
+            is_moved = self.clients.pop(client.client_id, None) is not None
+            if is_moved:
+                self.lost_clients[client.client_id] = client
+                self.lost_clients_memory += client.metadata_size
+            if self.clients_by_signature.get(client.client_signature) is client:
+                del self.clients_by_signature[client.client_signature]
+        if is_moved and self.lost_callback:
+            self.lost_callback(client.client_id)
+        self._evict_clients()
+
+    def _probe_client(self, client: ClientInfo):
+        peer_state = zmq.backend.cython._zmq._zmq_socket_get_peer_state(
+            self.zmq_server, client.client_signature) + 1
+        peer_state_rev = zmq.backend.cython._zmq._zmq_socket_get_peer_state(
+            self.zmq_server_rev, client.client_signature_rev) + 1
+        return peer_state != 0 and peer_state_rev != 0
+
+    def _sweep_clients(self):
+        self.sweep_pending = False
+        self.next_sweep = time.time() + self.liveness_interval
+        for client in list(self.clients.values()):
+            if not self._probe_client(client):
+                self._set_client_lost(client)
+                # print(f'Lost client: {client_id}')
+        self._evict_clients()
+
+    def _evict_clients(self):
+        """Drops the oldest lost clients by age, count and metadata size, keeps a short summary of each."""
+        min_lost_time = time.time() - self.lost_client_max_age
+        evicted = []
+        with self.clients_lock:
+            while self.lost_clients:
+                client = next(iter(self.lost_clients.values()))
+                if client.lost_time >= min_lost_time and \
+                        len(self.lost_clients) <= self.lost_client_max_count and \
+                        self.lost_clients_memory <= self.lost_client_max_memory:
+                    break
+                del self.lost_clients[client.client_id]
+                self.lost_clients_memory -= client.metadata_size
+                self.evicted_count += 1
+                self.client_version += 1
+                evicted.append(client)
+        for client in evicted:
+            self.client_history.append(ClientHistoryInfo(
+                client_id=client.client_id,
+                socket_name=client.client_metadata.get('socket_name', ''),
+                host=client.client_metadata.get('host', ''),
+                connect_time=client.connect_time.isoformat(),
+                lost_time=datetime.datetime.fromtimestamp(client.lost_time).isoformat(),
+            ))
 
     def _get_buffer(self, value):
         if isinstance(value, str):
@@ -358,73 +635,113 @@ class ServerSocket:
         else:
             return value
 
+    def _is_same_host(self, client: ClientInfo):
+        return client.client_metadata.get('host') == self.metadata['host']
+
+    def _get_peer_prefix(self, client: ClientInfo | None):
+        """Segment prefix of a client on this host, shared segments of other clients are never read."""
+        if client is None or not self._is_same_host(client):
+            return None
+        return get_segment_prefix(client.client_metadata.get('process_token'))
+
     def _forward_call(self, req):
+        arrival_time = time.time()
+        _, headers = split_call_headers(req[1].decode())
+        deadline = get_call_deadline(headers, arrival_time)
+        reply_headers = {'id': headers['id']} if 'id' in headers else {}
         req2 = json.loads(req[2].decode())
         assert 'client_id' in req2
         client_id = req2['client_id']
         method_name = req2['method_name']
         method_params = req2['method_params']
-        client1 = find(self.clients, lambda x: x.client_signature == req[0])
-        client2 = find(self.clients, lambda x: x.client_id == client_id)
-        assert client2
+        client1 = self.clients_by_signature.get(req[0])
+        client2 = self.clients.get(client_id)
+        if client2 is None:
+            # Lost or already evicted, the caller gets an error instead of a wait for the deadline
+            self.zmq_server.send_multipart([
+                client1.client_signature,
+                join_call_headers(f'error:{method_name}', reply_headers).encode(),
+                json.dumps({'error': f'Client not found: {client_id}', 'code': 'failed'}).encode()
+            ])
+            return
 
         res = None
         with self.request_lock:
-            self.send_rev(client_id, [method_name, method_params])
-            res = self.recv_rev(client_id)
-        if res:
-            res = json.loads(res.decode())
+            call_id = 0
+            call_headers = {}
+            if deadline:
+                call_id = self.next_call()
+                call_headers = {'id': call_id, 'timeout': max(int((deadline - time.time()) * 1000), 0)}
+            self.send_rev(client_id, [join_call_headers(method_name, call_headers), method_params])
+            res = self.recv_rev(client_id, call_id, deadline)
 
         # print(f'call forwarded: {Fore.MAGENTA}client:{client1.client_id}{Fore.RESET} <-> {Fore.MAGENTA}server{Fore.RESET} <-> {Fore.MAGENTA}client:{client2.client_id}{Fore.RESET}')
 
+        if res is None and deadline and time.time() >= deadline:
+            self.zmq_server.send_multipart([
+                client1.client_signature,
+                join_call_headers(f'error:{method_name}', reply_headers).encode(),
+                json.dumps({'error': 'Deadline exceeded', 'code': 'deadline'}).encode()
+            ])
+            return
+
+        response_kind = 'fwd_response'
+        if res:
+            if res[0].startswith(b'error:'):
+                response_kind = 'error'
+            res = json.loads(res[1].decode())
         self.zmq_server.send_multipart([
             client1.client_signature,
-            f'fwd_response:{method_name}'.encode(),
+            join_call_headers(f'{response_kind}:{method_name}', reply_headers).encode(),
             json.dumps(res).encode()
         ])
 
     def get_client_ids(self):
-        result = []
-        for client in self.clients:
-            if client.is_lost:
-                continue
-            if client.client_signature_rev is None:
-                continue
-            if not client.is_validated:
-                continue
-            peer_state = zmq.backend.cython._zmq._zmq_socket_get_peer_state(
-                self.zmq_server, client.client_signature) + 1
-            peer_state_rev = zmq.backend.cython._zmq._zmq_socket_get_peer_state(
-                self.zmq_server_rev, client.client_signature_rev) + 1
-            if peer_state == 0 or peer_state_rev == 0:
-                client.is_lost = True
-                # print(f'Lost client: {client_id}')
-                continue
-            result.append(client.client_id)
-        return result
+        """Live and validated clients, liveness comes from the cached client table."""
+        with self.clients_lock:
+            clients = list(self.clients.values())
+        return [x.client_id for x in clients if x.is_validated]
 
     def get_client_full(self) -> list[ClientInfo]:
-        return self.clients
+        """Live and lost clients in connection order."""
+        with self.clients_lock:
+            clients = [*self.clients.values(), *self.lost_clients.values()]
+        return sorted(clients, key=lambda x: x.client_id)
+
+    def get_client_info(self, client_id) -> ClientInfo | None:
+        with self.clients_lock:
+            client = self.clients.get(client_id)
+            if client is None:
+                client = self.lost_clients.get(client_id)
+            return client
+
+    def get_client_history(self) -> list[ClientHistoryInfo]:
+        return list(self.client_history)
+
+    def get_queue_info(self) -> QueueInfo:
+        return QueueInfo(
+            queue_size=self.work_queue_size,
+            queue_depth=len(self.work_queue_),
+            max_depth=self.max_queue_depth,
+            accepted=self.accepted_count,
+            rejected=self.rejected_count,
+            expired=self.expired_count,
+            coalesced=self.coalesced_count,
+        )
 
-    def get_client_info(self, client_id):
-        client = find(self.clients, lambda x: x.client_id == client_id)
-        return client
+    def is_client_alive(self, client_id):
+        client = self.clients.get(client_id)
+        return client is not None and client.is_validated
 
     def add_metadata(self, obj: dict[str, any]):
         for key, value in obj.items():
             self.metadata[key] = value
+        self.metadata_version += 1
 
-    def update(self):
-        for client in self.clients:
-            if client.is_lost:
-                continue
-            peer_state = zmq.backend.cython._zmq._zmq_socket_get_peer_state(
-                self.zmq_server, client.client_signature) + 1
-            peer_state_rev = zmq.backend.cython._zmq._zmq_socket_get_peer_state(
-                self.zmq_server_rev, client.client_signature_rev) + 1
-            if peer_state == 0 or peer_state_rev == 0:
-                client.is_lost = True
-                # print(f'Lost client: {client_id}')
+    def update(self, force=False):
+        """Sweeps peer state when a disconnect was reported or the liveness interval has passed."""
+        if force or self.sweep_pending or time.time() >= self.next_sweep:
+            self._sweep_clients()
 
     def wait(self):
         while self.zmq_server.poll(0):
@@ -433,19 +750,36 @@ class ServerSocket:
             time.sleep(0.1)
 
     def close(self):
-        sockets = [self.zmq_monitor, self.zmq_server, self.zmq_server_rev]
+        zmq_server = self.zmq_server
+        zmq_server_rev = self.zmq_server_rev
+        sockets = [
+            self.zmq_monitor,
+            self.zmq_monitor_rev,
+            self.zmq_server,
+            self.zmq_server_rev,
+            self.zmq_notify,
+            self.zmq_notify_recv,
+        ]
         zmq_monitor_thread = self.zmq_monitor_thread
 
         self.is_alive = False
         self.zmq_server = None
         self.zmq_server_rev = None
         self.zmq_monitor = None
+        self.zmq_monitor_rev = None
         self.zmq_monitor_thread = None
+        self.zmq_notify = None
+        self.zmq_notify_recv = None
+        self.zmq_poller = None
 
         if zmq_monitor_thread:
             zmq_monitor_thread.join()
             zmq_monitor_thread = None
 
+        for item in [zmq_server, zmq_server_rev]:
+            if item:
+                item.disable_monitor()
+
         for item in sockets:
             if item:
                 try:
@@ -453,4 +787,5 @@ class ServerSocket:
                 except:  # noqa
                     pass
 
+        self.shared_buffers.close()
         self.zmq_context = None
\ No newline at end of file
@@ -2,44 +2,98 @@
 #   Contents:
 #
 #       ServiceClient
+#           __new__
 #           __init__
 #           dynamic_call
+#           dynamic_stream
+#           _server_call
+#           _missing_client
+#       get_stub_class
+#       _stub_call
+#       _stub_stream
 #
-from typing import TypeVar, Generic, Type, Any
-from .common_base import SocketType
+import functools
+from typing import TypeVar, Generic, Type, Any, Dict
+from .common_base import SocketType, ServiceInfo
 
 X = TypeVar('X')
 
+# Generated stub classes by service class and method set
+g_stub_classes: Dict[tuple, type] = {}
+
 
 class ServiceClient(Generic[X]):
-    def __init__(self, socket: Any, clazz: Type[X], client_id=0):
+    """Calls the methods of a service through a socket.
+
+    Instances are of a stub class generated once per service, each method has its own call path
+    with the full method name already built.
+    """
+    def __new__(cls, socket: Any, clazz: Type[X], client_id=0, timeout=None):
+        if cls is ServiceClient:
+            cls = get_stub_class(clazz, socket.known_services[clazz.__name__])
+        return super().__new__(cls)
+
+    def __init__(self, socket: Any, clazz: Type[X], client_id=0, timeout=None):
         super().__init__()
 
         self.socket = socket
         self.clazz = clazz
         self.client_id = client_id
+        self.timeout = timeout
         self.service_name = self.clazz.__name__
         self.service_info = self.socket.known_services[self.service_name]
 
-        for method_name in self.service_info.methods.keys():
-            full_name = f'{self.service_name}.{method_name}'
-            setattr(
-                self.__class__,
-                method_name,
-                lambda _, params, full_name=full_name:
-                    self.dynamic_call(params, full_name)
-            )
-
-    def dynamic_call(self, params, full_name):
+        # Socket type is fixed, the call target is chosen once
         if self.socket.socket_type == SocketType.BIND:
-            assert self.client_id > 0
-            return self.socket.client_call(
-                self.client_id,
-                full_name,
-                params
-            )
+            self.call_ = functools.partial(self.socket.client_call, self.client_id) \
+                if self.client_id > 0 else self._missing_client
         else:
-            return self.socket.server_call(
-                full_name,
-                params
-            )
+            self.call_ = self._server_call
+
+    def dynamic_call(self, params, full_name, timeout=None):
+        return self.call_(full_name, params, self.timeout if timeout is None else timeout)
+
+    def dynamic_stream(self, params, full_name):
+        assert self.socket.socket_type == SocketType.CONNECT, 'Streams are opened by the connecting side'
+        return self.socket.server_stream(
+            full_name,
+            params
+        )
+
+    def _server_call(self, full_name, params, timeout=None):
+        # Method, types and cache are resolved once per schema version, not on every call
+        return self.socket._server_call(self.socket._get_call(full_name), params, timeout)
+
+    def _missing_client(self, full_name, params, timeout=None):
+        assert self.client_id > 0, f'Missing client id! {full_name}'
+
+
+def get_stub_class(clazz: type, service_info: ServiceInfo) -> type:
+    """ServiceClient subclass with one method per service method, generated on first use."""
+    methods = tuple(
+        (method_name, method_info.server_stream or method_info.client_stream)
+        for method_name, method_info in service_info.methods.items()
+    )
+    key = (clazz, methods)
+    stub_class = g_stub_classes.get(key)
+    if stub_class is None:
+        attributes = {}
+        for method_name, is_stream in methods:
+            full_name = f'{service_info.service_name}.{method_name}'
+            attributes[method_name] = _stub_stream(full_name) if is_stream else _stub_call(full_name)
+            attributes[method_name].__name__ = method_name
+        stub_class = type(f'{service_info.service_name}Client', (ServiceClient,), attributes)
+        g_stub_classes[key] = stub_class
+    return stub_class
+
+
+def _stub_call(full_name):
+    def call(self, params, timeout=None):
+        return self.call_(full_name, params, self.timeout if timeout is None else timeout)
+    return call
+
+
+def _stub_stream(full_name):
+    def stream(self, params):
+        return self.dynamic_stream(params, full_name)
+    return stream
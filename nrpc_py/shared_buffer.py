@@ -0,0 +1,143 @@
+#
+#   Contents:
+#
+#       SharedBufferPool
+#           __init__
+#           put
+#           load
+#           cleanup
+#           close
+#       get_segment_prefix
+#       get_missing_reply
+#       _unregister
+#
+import os
+import json
+import time
+import itertools
+import threading
+from collections import deque
+from multiprocessing import shared_memory, resource_tracker
+from .common_base import g_process_token
+
+SHARED_HEADER = b';shm='
+
+# Segment names are unique across all pools of the process
+g_segment_ids = itertools.count(1)
+
+
+def get_segment_prefix(process_token: str):
+    """Start of the segment names created by the process with this token, None for an unknown peer."""
+    if not process_token:
+        return None
+    pid, _, key = process_token.partition(':')
+    return f'nrpc{pid}_{key[:12]}_'
+
+
+def get_missing_reply(name: bytes):
+    """Error frames answering a message whose segment could not be read, [name, payload]."""
+    name = name.rpartition(SHARED_HEADER)[0]
+    # Responses carry their kind before the method name, calls do not
+    if b':' in name.split(b';')[0]:
+        name = name.partition(b':')[2]
+    return [b'error:' + name, json.dumps({'error': 'Shared memory segment not available', 'code': 'failed'}).encode()]
+
+
+def _unregister(segment: shared_memory.SharedMemory):
+    # Sent segments are unlinked by the receiver or the pool, not by the resource tracker of the sender
+    try:
+        resource_tracker.unregister(segment._name, 'shared_memory')
+    except Exception:  # noqa
+        pass
+
+
+class SharedBufferPool:
+    """Moves large payloads between processes of one host through shared memory segments.
+
+    The sender writes the payload into a new segment and sends only its name and size on the
+    method frame. The receiver copies it out and unlinks the segment. Segments that are never
+    received, e.g. responses of expired calls, are unlinked by the sender after 'ttl' seconds.
+    """
+    threshold: int
+    ttl: float
+    prefix: str
+    sent_count: int
+    received_count: int
+    pending_: deque[list]
+    pending_lock: threading.Lock
+
+    def __init__(self, threshold, ttl=60.0):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.prefix = get_segment_prefix(g_process_token)
+        self.sent_count = 0
+        self.received_count = 0
+        self.pending_ = deque()
+        self.pending_lock = threading.Lock()
+
+    def put(self, name: bytes, buffer: bytes):
+        """Frames to send instead of [name, buffer], unchanged when shared memory is not available."""
+        if not self.threshold or len(buffer) < self.threshold:
+            return name, buffer
+        self.cleanup()
+
+        segment_name = f'{self.prefix}{next(g_segment_ids)}'
+        try:
+            segment = shared_memory.SharedMemory(name=segment_name, create=True, size=len(buffer))
+        except OSError:
+            # print(f'Shared memory not available: {len(buffer)}')
+            return name, buffer
+        _unregister(segment)
+        segment.buf[:len(buffer)] = buffer
+
+        # Windows drops the segment with its last handle, it is kept open until received or expired
+        with self.pending_lock:
+            self.pending_.append([time.time(), segment_name, segment if os.name == 'nt' else None])
+        if os.name != 'nt':
+            segment.close()
+        self.sent_count += 1
+        return name + SHARED_HEADER + f'{segment_name}:{len(buffer)}'.encode(), b'{}'
+
+    def load(self, frames: list[bytes], prefix: str | None):
+        """Replaces the payload of a received message with the shared segment it refers to.
+
+        'prefix' is the segment prefix of the sender, None when it is not on this host. None is
+        returned when the segment is gone or was not created by the sender, see get_missing_reply.
+        """
+        if SHARED_HEADER not in frames[1]:
+            return frames
+        name, _, spec = frames[1].rpartition(SHARED_HEADER)
+        segment_name, _, size = spec.decode(errors='replace').rpartition(':')
+        # Names come from the peer, only the segments of its own pool are opened and unlinked
+        if not prefix or not segment_name.startswith(prefix) or \
+                not segment_name[len(prefix):].isdigit() or not size.isdigit():
+            return None
+        try:
+            segment = shared_memory.SharedMemory(name=segment_name)
+        except (FileNotFoundError, ValueError):
+            return None
+        try:
+            payload = bytes(segment.buf[:int(size)])
+        finally:
+            segment.close()
+            segment.unlink()
+        self.received_count += 1
+        return [frames[0], name, payload]
+
+    def cleanup(self, force=False):
+        expired = []
+        with self.pending_lock:
+            while self.pending_ and (force or self.pending_[0][0] + self.ttl < time.time()):
+                expired.append(self.pending_.popleft())
+        for _, segment_name, segment in expired:
+            if segment:
+                segment.close()
+            try:
+                segment = shared_memory.SharedMemory(name=segment_name)
+                segment.close()
+                segment.unlink()
+            except FileNotFoundError:
+                pass
+
+    def close(self):
+        self.cleanup(force=True)
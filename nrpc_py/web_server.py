@@ -0,0 +1,408 @@
+#
+#   Contents:
+#
+#       WebServer
+#           __init__
+#           start
+#           publish
+#           get_connections
+#           close
+#           _run
+#           _handle_connection
+#           _read_request
+#           _serve_http
+#           _send_http
+#           _dispatch_batch
+#           _serve_websocket
+#           _accept_websocket
+#           _read_message
+#           _read_frame
+#           _handle_message
+#           _send
+#           _broadcast
+#       encode_frame
+#       unmask_payload
+#
+import json
+import base64
+import hashlib
+import asyncio
+import datetime
+import threading
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict
+from .common_base import RoutingSocketOptions, WebSocketInfo
+
+WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC11B65'
+OPCODE_CONTINUATION = 0x0
+OPCODE_TEXT = 0x1
+OPCODE_BINARY = 0x2
+OPCODE_CLOSE = 0x8
+OPCODE_PING = 0x9
+OPCODE_PONG = 0xA
+HTTP_REASONS = {
+    200: 'OK',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    413: 'Payload Too Large',
+    426: 'Upgrade Required',
+    500: 'Internal Server Error',
+    501: 'Not Implemented',
+}
+
+
+def encode_frame(opcode: int, payload: bytes):
+    """Single unmasked frame, as sent by servers."""
+    length = len(payload)
+    if length < 126:
+        header = struct.pack('!BB', 0x80 | opcode, length)
+    elif length < 65536:
+        header = struct.pack('!BBH', 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack('!BBQ', 0x80 | opcode, 127, length)
+    return header + payload
+
+
+def unmask_payload(payload: bytes, mask: bytes):
+    length = len(payload)
+    if not length:
+        return payload
+    key = (mask * (length // 4 + 1))[:length]
+    return (int.from_bytes(payload, 'big') ^ int.from_bytes(key, 'big')).to_bytes(length, 'big')
+
+
+class WebServer:
+    """WebSocket (RFC 6455) and HTTP/1.1 transport on an asyncio event loop of its own.
+
+    WebSocket requests are JSON text messages {"id": 1, "method": "Service.Method", "params": {...}},
+    responses are {"id": 1, "result": {...}} or {"id": 1, "error": "...", "code": "..."}.
+    Published events are sent to every connection as {"event": "Type/topic", "data": {...}}.
+
+    With 'serve_http', 'POST /Service.Method' takes the params as the JSON body and returns the
+    result, 'POST /batch' takes a list of WebSocket style requests and returns their responses.
+    Connections are kept alive between requests. Handlers run one at a time on a worker thread,
+    like the calls of the ZMQ transport. A WebSocket connection stops being read while it has
+    'max_in_flight' messages waiting for their response.
+    """
+    ip_address: str
+    port: int
+    is_alive: bool
+    serve_http: bool
+    keep_alive_timeout: float
+    max_in_flight: int
+    max_message_size: int
+    next_connection_id: int
+    connections: Dict[int, WebSocketInfo]
+    dispatch: Callable[[str, dict, int], dict]
+    loop: asyncio.AbstractEventLoop
+    server: asyncio.AbstractServer
+    server_thread: threading.Thread
+    executor: ThreadPoolExecutor
+    started: threading.Event
+    http_connection_count: int
+    http_request_count: int
+    server_errors: str
+
+    def __init__(self, ip_address, port, dispatch, options: RoutingSocketOptions = None, serve_http=False):
+        self.ip_address = ip_address
+        self.port = port
+        self.is_alive = True
+        self.serve_http = serve_http
+        self.keep_alive_timeout = 60.0
+        self.max_in_flight = 64
+        self.max_message_size = options.max_message_size if options else 64 * 1024 * 1024
+        self.next_connection_id = 0
+        self.connections = {}
+        self.dispatch = dispatch
+        self.loop = None
+        self.server = None
+        self.server_thread = None
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.started = threading.Event()
+        self.http_connection_count = 0
+        self.http_request_count = 0
+        self.server_errors = ''
+
+    def start(self):
+        self.server_thread = threading.Thread(target=self._run)
+        self.server_thread.start()
+        self.started.wait()
+        assert not self.server_errors, self.server_errors
+
+    def publish(self, topic: str, payload: dict):
+        frame = encode_frame(OPCODE_TEXT, json.dumps({'event': topic, 'data': payload}).encode())
+        if self.loop and self.is_alive:
+            self.loop.call_soon_threadsafe(self._broadcast, frame)
+
+    def get_connections(self) -> list[WebSocketInfo]:
+        return [x for x in self.connections.values() if not x.is_closed]
+
+    def close(self):
+        self.is_alive = False
+        if self.loop:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+        if self.server_thread:
+            self.server_thread.join()
+            self.server_thread = None
+        self.executor.shutdown(wait=True)
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.server = self.loop.run_until_complete(
+                asyncio.start_server(self._handle_connection, self.ip_address, self.port)
+            )
+        except OSError as error:
+            self.server_errors += f'\nFailed to bind: {error}'
+            self.started.set()
+            self.loop.close()
+            return
+        self.started.set()
+
+        self.loop.run_forever()
+
+        self.server.close()
+        for item in self.connections.values():
+            if item.writer:
+                item.writer.close()
+        tasks = asyncio.all_tasks(self.loop)
+        for task in tasks:
+            task.cancel()
+        self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        self.loop.run_until_complete(self.server.wait_closed())
+        self.loop.close()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = await self._read_request(reader)
+            if request is None:
+                return
+            if request[3].get('upgrade', '').lower() == 'websocket':
+                await self._serve_websocket(reader, writer, request)
+                return
+            if not self.serve_http:
+                await self._send_http(writer, 426, None, False)
+                return
+
+            self.http_connection_count += 1
+            while request is not None and self.is_alive:
+                if not await self._serve_http(reader, writer, request):
+                    break
+                request = await asyncio.wait_for(self._read_request(reader), self.keep_alive_timeout)
+
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader: asyncio.StreamReader):
+        """Request line and lower case headers of an HTTP request, None on a closed connection."""
+        line = await reader.readline()
+        if not line:
+            return None
+        parts = line.decode('latin-1').split()
+        if len(parts) != 3:
+            return None
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            key, _, value = line.decode('latin-1').partition(':')
+            headers[key.strip().lower()] = value.strip()
+        return parts[0], parts[1], parts[2], headers
+
+    async def _serve_http(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, request):
+        """Answers one request, False when the connection has to be closed afterwards."""
+        method, path, version, headers = request
+        self.http_request_count += 1
+        connection = headers.get('connection', '').lower()
+        keep_alive = connection == 'keep-alive' if version == 'HTTP/1.0' else connection != 'close'
+
+        if headers.get('transfer-encoding'):
+            await self._send_http(writer, 501, {'error': 'Chunked requests are not supported', 'code': 'failed'}, False)
+            return False
+        length = headers.get('content-length', '') or '0'
+        if not length.isascii() or not length.isdigit():
+            await self._send_http(writer, 400, {'error': f'Invalid content length: {length}', 'code': 'failed'}, False)
+            return False
+        length = int(length)
+        if length > self.max_message_size:
+            await self._send_http(writer, 413, {'error': 'Request too large', 'code': 'failed'}, False)
+            return False
+        body = await reader.readexactly(length) if length else b''
+
+        name = path.split('?')[0].lstrip('/')
+        if method not in ['GET', 'POST']:
+            await self._send_http(writer, 405, {'error': f'Method not allowed: {method}', 'code': 'failed'}, keep_alive)
+            return keep_alive
+        if name != 'batch' and len(name.split('.')) != 2:
+            await self._send_http(writer, 404, {'error': f'Unknown endpoint: {path}', 'code': 'failed'}, keep_alive)
+            return keep_alive
+
+        try:
+            params = json.loads(body) if body else {}
+        except ValueError as error:
+            await self._send_http(writer, 400, {'error': f'Invalid json: {error}', 'code': 'failed'}, keep_alive)
+            return keep_alive
+
+        status = 200
+        try:
+            if name == 'batch':
+                assert isinstance(params, list), 'Batch takes a list of calls'
+                result = await self.loop.run_in_executor(self.executor, self._dispatch_batch, params)
+            else:
+                result = await self.loop.run_in_executor(self.executor, self.dispatch, name, params, 0)
+        except Exception as error:  # noqa
+            status = 500
+            result = {'error': f'{error}', 'code': 'failed'}
+        await self._send_http(writer, status, result, keep_alive)
+        return keep_alive
+
+    async def _send_http(self, writer: asyncio.StreamWriter, status: int, result, keep_alive: bool):
+        body = json.dumps(result).encode() if result is not None else b''
+        writer.write((
+            f'HTTP/1.1 {status} {HTTP_REASONS[status]}\r\n'
+            'Content-Type: application/json\r\n'
+            f'Content-Length: {len(body)}\r\n'
+            f'Connection: {"keep-alive" if keep_alive else "close"}\r\n'
+            '\r\n'
+        ).encode() + body)
+        await writer.drain()
+
+    def _dispatch_batch(self, calls: list):
+        """Runs the calls of a batch in order, on the worker thread in one go."""
+        results = []
+        for item in calls:
+            call_id = item.get('id') if isinstance(item, dict) else None
+            try:
+                result = self.dispatch(item['method'], item.get('params', {}), 0)
+                results.append({'id': call_id, 'result': result})
+            except Exception as error:  # noqa
+                results.append({'id': call_id, 'error': f'{error}', 'code': 'failed'})
+        return results
+
+    async def _serve_websocket(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, request):
+        info = None
+        _, path, _, headers = request
+        try:
+            await self._accept_websocket(writer, headers)
+            self.next_connection_id += 1
+            peer = writer.get_extra_info('peername')
+            info = WebSocketInfo(
+                connection_id=self.next_connection_id,
+                remote_address=f'{peer[0]}:{peer[1]}' if peer else '',
+                path=path,
+                connect_time=datetime.datetime.now(),
+                writer=writer,
+            )
+            self.connections[info.connection_id] = info
+
+            # Reading pauses while the connection has too many messages in flight
+            in_flight = asyncio.Semaphore(self.max_in_flight)
+            while self.is_alive:
+                message = await self._read_message(reader, info)
+                if message is None:
+                    break
+                info.received_count += 1
+                await in_flight.acquire()
+                asyncio.ensure_future(self._handle_message(info, message, in_flight))
+
+        finally:
+            if info:
+                info.is_closed = True
+                self.connections.pop(info.connection_id, None)
+
+    async def _accept_websocket(self, writer: asyncio.StreamWriter, headers: dict):
+        key = headers.get('sec-websocket-key', '')
+        accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode()).digest()).decode()
+        writer.write((
+            'HTTP/1.1 101 Switching Protocols\r\n'
+            'Upgrade: websocket\r\n'
+            'Connection: Upgrade\r\n'
+            f'Sec-WebSocket-Accept: {accept}\r\n'
+            '\r\n'
+        ).encode())
+        await writer.drain()
+
+    async def _read_message(self, reader: asyncio.StreamReader, info: WebSocketInfo):
+        """Next data message with fragments joined, control frames are answered here."""
+        opcode = None
+        fragments = []
+        size = 0
+        while True:
+            fin, frame_opcode, payload = await self._read_frame(reader)
+            if frame_opcode == OPCODE_PING:
+                info.writer.write(encode_frame(OPCODE_PONG, payload))
+                continue
+            if frame_opcode == OPCODE_PONG:
+                continue
+            if frame_opcode == OPCODE_CLOSE:
+                info.writer.write(encode_frame(OPCODE_CLOSE, payload[:2]))
+                await info.writer.drain()
+                return None
+            if frame_opcode != OPCODE_CONTINUATION:
+                opcode = frame_opcode
+            size += len(payload)
+            if size > self.max_message_size:
+                info.writer.write(encode_frame(OPCODE_CLOSE, struct.pack('!H', 1009)))
+                await info.writer.drain()
+                return None
+            fragments.append(payload)
+            if fin:
+                break
+        message = b''.join(fragments)
+        return message.decode() if opcode == OPCODE_TEXT else message
+
+    async def _read_frame(self, reader: asyncio.StreamReader):
+        head = await reader.readexactly(2)
+        fin = bool(head[0] & 0x80)
+        opcode = head[0] & 0x0f
+        masked = bool(head[1] & 0x80)
+        length = head[1] & 0x7f
+        if length == 126:
+            length = struct.unpack('!H', await reader.readexactly(2))[0]
+        elif length == 127:
+            length = struct.unpack('!Q', await reader.readexactly(8))[0]
+        # Clients always mask their frames
+        if not masked or length > self.max_message_size:
+            raise ConnectionError('Invalid websocket frame')
+        mask = await reader.readexactly(4)
+        payload = await reader.readexactly(length)
+        return fin, opcode, unmask_payload(payload, mask)
+
+    async def _handle_message(self, info: WebSocketInfo, message, in_flight: asyncio.Semaphore):
+        call_id = None
+        try:
+            request = json.loads(message)
+            call_id = request.get('id')
+            method_name = request['method']
+            params = request.get('params', {})
+            result = await self.loop.run_in_executor(
+                self.executor, self.dispatch, method_name, params, 0
+            )
+            response = {'id': call_id, 'result': result}
+        except Exception as error:  # noqa
+            response = {'id': call_id, 'error': f'{error}', 'code': 'failed'}
+        try:
+            await self._send(info, json.dumps(response).encode())
+        finally:
+            in_flight.release()
+
+    async def _send(self, info: WebSocketInfo, payload: bytes):
+        if info.is_closed:
+            return
+        info.writer.write(encode_frame(OPCODE_TEXT, payload))
+        info.sent_count += 1
+        try:
+            await info.writer.drain()
+        except ConnectionError:
+            info.is_closed = True
+
+    def _broadcast(self, frame: bytes):
+        for info in self.get_connections():
+            info.writer.write(frame)
+            info.sent_count += 1
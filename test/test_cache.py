@@ -0,0 +1,266 @@
+import json
+import time
+import threading
+import http.client
+from nrpc_py.common_base import rpcclass
+import nrpc_py
+
+
+@rpcclass({
+    'key': 1,
+    'value': 2,
+})
+class CacheItem:
+    key: str = ''
+    value: int = 0
+
+
+@rpcclass({
+    'Lookup': {'id': 1, 'cache_ttl': 0.5, 'cache_size': 2},
+    'Count': 2,
+    'Compute': {'id': 3, 'coalesce': True},
+})
+class CacheService:
+    def Lookup(self, request: CacheItem) -> CacheItem:
+        pass
+
+    def Count(self, request: CacheItem) -> CacheItem:
+        pass
+
+    def Compute(self, request: CacheItem) -> CacheItem:
+        pass
+
+
+class CacheServer:
+    def __init__(self):
+        self.lookups = 0
+        self.computes = 0
+        self.on_lookup = None
+
+    def Lookup(self, request: CacheItem) -> CacheItem:
+        self.lookups += 1
+        if self.on_lookup:
+            self.on_lookup()
+        return CacheItem(key=request.key, value=len(request.key) * 10)
+
+    def Count(self, request: CacheItem) -> CacheItem:
+        if request.key == 'boom':
+            raise ValueError('boom')
+        return CacheItem(key=request.key, value=self.lookups)
+
+    def Compute(self, request: CacheItem) -> CacheItem:
+        self.computes += 1
+        time.sleep(0.3)
+        if request.value < 0:
+            raise ValueError('negative')
+        return CacheItem(key=request.key, value=request.value * 2)
+
+
+class TestApplication:
+    def start(self):
+        port = 8919
+        server = CacheServer()
+        sock1 = nrpc_py.RoutingSocket(
+            type=nrpc_py.SocketType.BIND,
+            protocol=nrpc_py.ProtocolType.TCP,
+            name='test_cache_server_py',
+            types=[
+                CacheItem,
+                [CacheService, server]
+            ],
+        )
+        sock2 = nrpc_py.RoutingSocket(
+            type=nrpc_py.SocketType.CONNECT,
+            protocol=nrpc_py.ProtocolType.TCP,
+            name='test_cache_client_py',
+            types=[
+                CacheItem,
+                CacheService
+            ],
+            local_call_policy=nrpc_py.LocalCallPolicy.DISABLED,
+        )
+        sock1.bind('127.0.0.1', port)
+        sock2.connect('127.0.0.1', port)
+        client: CacheService = sock2.cast(CacheService)
+
+        assert nrpc_py.g_all_services['CacheService'].methods['Lookup'].cache_ttl == 0.5
+        assert list(sock1.response_caches.keys()) == ['CacheService.Lookup']
+
+        # Repeated requests are answered from the cache
+        count = 1000
+        start = time.time()
+        for _ in range(count):
+            resp = client.Lookup(CacheItem(key='abc'))
+            assert resp.key == 'abc' and resp.value == 30
+        print(f'CACHE {count} calls, {(time.time() - start) / count * 1e6:.1f}us per call')
+        assert server.lookups == 1
+
+        # Methods without a declaration are never cached
+        assert client.Count(CacheItem()).value == 1
+        assert client.Count(CacheItem()).value == 1
+
+        # Least recently used request is dropped
+        client.Lookup(CacheItem(key='a'))
+        client.Lookup(CacheItem(key='b'))
+        assert server.lookups == 3
+        client.Lookup(CacheItem(key='abc'))
+        assert server.lookups == 4
+
+        # Expired entries are computed again
+        client.Lookup(CacheItem(key='b'))
+        assert server.lookups == 4
+        time.sleep(0.6)
+        client.Lookup(CacheItem(key='b'))
+        assert server.lookups == 5
+
+        info = sock2.server_call(nrpc_py.RoutingMessage.GetAppInfo, {'with_caches': True})
+        print(f'CACHE {info["caches"]}')
+        assert info['caches'][0]['method_name'] == 'CacheService.Lookup'
+        assert info['caches'][0]['hits'] == count
+        assert info['caches'][0]['misses'] == 5
+
+        # Response computed while the cache was invalidated is not stored
+        server.on_lookup = sock1.response_caches['CacheService.Lookup'].clear
+        client.Lookup(CacheItem(key='stale'))
+        server.on_lookup = None
+        client.Lookup(CacheItem(key='stale'))
+        assert server.lookups == 7
+
+        # Untyped requests share the entry regardless of the key order
+        sock2.server_call('CacheService.Lookup', {'key': 'order', 'value': 1})
+        sock2.server_call('CacheService.Lookup', {'value': 1, 'key': 'order'})
+        assert server.lookups == 8
+
+        # Client cache answers without a round trip until the server invalidates it
+        sock3 = nrpc_py.RoutingSocket(
+            type=nrpc_py.SocketType.CONNECT,
+            protocol=nrpc_py.ProtocolType.TCP,
+            name='test_cache_cached_client_py',
+            types=[
+                CacheItem,
+                CacheService
+            ],
+            local_call_policy=nrpc_py.LocalCallPolicy.DISABLED,
+            client_cache_size=100,
+        )
+        sock3.connect('127.0.0.1', port)
+        assert list(sock3.client_caches.keys()) == ['CacheService.Lookup']
+        cached: CacheService = sock3.cast(CacheService)
+        resp = cached.Lookup(CacheItem(key='client'))
+        resp.value = -1
+        calls = sock1.call_count
+        start = time.time()
+        for _ in range(count):
+            resp = cached.Lookup(CacheItem(key='client'))
+            assert resp.value == 60
+        print(f'CLIENT CACHE {count} calls, {(time.time() - start) / count * 1e6:.1f}us per call')
+        assert sock1.call_count == calls
+
+        # A client failing to receive the invalidation does not hold up the others
+        send_rev = sock1.server_socket.send_rev
+        failed_id = sock2.client_socket.client_id
+        def failing_send_rev(client_id, request):
+            assert client_id != failed_id, 'Send failed'
+            send_rev(client_id, request)
+        sock1.server_socket.send_rev = failing_send_rev
+        generation = sock3.client_caches['CacheService.Lookup'].generation
+        sock1.invalidate_cache('CacheService.Lookup')
+        sock1.server_socket.send_rev = send_rev
+        start = time.time()
+        while sock3.client_caches['CacheService.Lookup'].generation == generation and time.time() - start < 2.0:
+            time.sleep(0.01)
+        assert cached.Lookup(CacheItem(key='client')).value == 60
+        assert sock1.call_count == calls + 1
+        assert sock3.client_caches['CacheService.Lookup'].hit_count == count
+        assert sock3.client_caches['CacheService.Lookup'].miss_count == 2
+        sock3.server_call('CacheService.Lookup', {'key': 'order', 'value': 2})
+        sock3.server_call('CacheService.Lookup', {'value': 2, 'key': 'order'})
+        assert sock3.client_caches['CacheService.Lookup'].hit_count == count + 1
+        sock3.close()
+
+        # Identical concurrent calls run the handler once, every caller gets the result
+        clients = []
+        for index in range(8):
+            sock = nrpc_py.RoutingSocket(
+                type=nrpc_py.SocketType.CONNECT,
+                protocol=nrpc_py.ProtocolType.TCP,
+                name=f'test_cache_client_py{index}',
+                types=[
+                    CacheItem,
+                    CacheService
+                ],
+                local_call_policy=nrpc_py.LocalCallPolicy.DISABLED,
+            )
+            sock.connect('127.0.0.1', port)
+            clients.append(sock)
+        results = []
+
+        def compute(sock, value):
+            results.append(sock.cast(CacheService).Compute(CacheItem(key='c', value=value)))
+        threads = [threading.Thread(target=compute, args=(x, 21)) for x in clients]
+        threads.append(threading.Thread(target=compute, args=(sock2, 5)))
+        start = time.time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        print(f'COALESCE {len(results)} calls, computes={server.computes}, {time.time() - start:.3f}s')
+        assert sorted(x.value for x in results) == [10] + [42] * 8
+        assert server.computes == 2
+        assert len(sock1.coalesced_calls) == 0
+        info = sock2.server_call(nrpc_py.RoutingMessage.GetAppInfo, {'with_queue': True})
+        assert info['queue']['coalesced'] == 7
+
+        # Failing handlers answer every caller with an error, the worker keeps serving
+        try:
+            client.Count(CacheItem(key='boom'), timeout=2.0)
+            assert False, 'RpcError expected'
+        except nrpc_py.RpcError as e:
+            assert 'ValueError: boom' in str(e), e
+        assert client.Count(CacheItem()).value == server.lookups
+        errors = []
+
+        def fail(sock):
+            try:
+                sock.cast(CacheService).Compute(CacheItem(key='f', value=-1), timeout=2.0)
+            except nrpc_py.RpcError as e:
+                errors.append(e)
+        threads = [threading.Thread(target=fail, args=(x,)) for x in clients[:3]]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(errors) == 3 and all('ValueError: negative' in str(x) for x in errors), errors
+        assert len(sock1.coalesced_calls) == 0
+        assert client.Compute(CacheItem(key='f', value=4)).value == 8
+
+        for sock in clients:
+            sock.close()
+        sock2.close()
+        sock1.close()
+
+        # Calls over HTTP use the same cache
+        web = nrpc_py.RoutingSocket(
+            type=nrpc_py.SocketType.BIND,
+            protocol=nrpc_py.ProtocolType.HTTP,
+            name='test_cache_http_py',
+            types=[CacheItem, [CacheService, server]],
+        )
+        web.bind('127.0.0.1', port + 9)
+        conn = http.client.HTTPConnection('127.0.0.1', port + 9)
+        lookups = server.lookups
+        for _ in range(3):
+            conn.request('POST', '/CacheService.Lookup', body=json.dumps({'key': 'web', 'value': 0}))
+            resp = conn.getresponse()
+            assert resp.status == 200 and json.loads(resp.read()) == {'key': 'web', 'value': 30}
+        assert server.lookups == lookups + 1
+        assert web.response_caches['CacheService.Lookup'].hit_count == 2
+        conn.close()
+        web.close()
+        print('ALL OK')
+
+
+if __name__ == '__main__':
+    nrpc_py.init()
+    app = TestApplication()
+    app.start()
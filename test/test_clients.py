@@ -0,0 +1,191 @@
+import time
+import datetime
+import threading
+from nrpc_py.common_base import rpcclass
+import nrpc_py
+
+
+@rpcclass({
+    'label': 1,
+})
+class ClientsItem:
+    label: str = ''
+
+
+@rpcclass({
+    'Echo': 1,
+})
+class ClientsService:
+    def Echo(self, request: ClientsItem) -> ClientsItem:
+        pass
+
+
+class ClientsServer:
+    def Echo(self, request: ClientsItem) -> ClientsItem:
+        return ClientsItem(label=request.label)
+
+
+class TestApplication:
+    def create_client(self, name, port):
+        sock = nrpc_py.RoutingSocket(
+            type=nrpc_py.SocketType.CONNECT,
+            protocol=nrpc_py.ProtocolType.TCP,
+            name=name,
+            types=[ClientsItem, [ClientsService, ClientsServer()]],
+            local_call_policy=nrpc_py.LocalCallPolicy.DISABLED,
+        )
+        sock.connect('127.0.0.1', port)
+        return sock
+
+    def wait_for(self, condition, timeout=2.0):
+        start = time.time()
+        while not condition() and time.time() - start < timeout:
+            time.sleep(0.01)
+        return condition()
+
+    def list_clients(self, server_socket, errors, stop):
+        """Lists the client tables from another thread while the server thread changes them."""
+        while not stop.is_set():
+            try:
+                server_socket.get_client_ids()
+                server_socket.get_client_full()
+            except Exception as e:
+                errors.append(e)
+
+    def check_sweep(self, port):
+        """Disconnects are swept on the monitor event, liveness checks never probe the peers."""
+        sock1 = nrpc_py.RoutingSocket(
+            type=nrpc_py.SocketType.BIND,
+            protocol=nrpc_py.ProtocolType.TCP,
+            name='test_clients_sweep_py',
+            types=[ClientsItem, ClientsService],
+            liveness_interval=60.0,
+        )
+        sock1.bind('127.0.0.1', port)
+        server_socket = sock1.server_socket
+        probe_client = server_socket._probe_client
+        probes = []
+        server_socket._probe_client = lambda client: probes.append(client.client_id) or probe_client(client)
+        sock2 = self.create_client('test_clients_sweep_client_py', port)
+        client_id = sock2.client_socket.client_id
+        assert self.wait_for(lambda: server_socket.is_client_alive(client_id))
+
+        count = len(probes)
+        start = time.time()
+        for _ in range(10000):
+            assert server_socket.is_client_alive(client_id)
+        print(f'ALIVE {(time.time() - start) * 100:.2f}us per check')
+        assert len(probes) == count
+
+        start = time.time()
+        sock2.close()
+        assert self.wait_for(lambda: client_id in server_socket.lost_clients)
+        print(f'SWEPT in {(time.time() - start) * 1000:.1f}ms')
+        assert client_id in probes[count:]
+        assert not server_socket.is_client_alive(client_id)
+        sock1.close()
+
+    def check_many(self, port, count):
+        """Lookups by id and by signature stay flat with 'count' registered clients, half of them lost."""
+        server_socket = nrpc_py.ServerSocket(
+            '127.0.0.1', port, port + 10000, 'test_clients_many_py',
+            nrpc_py.RoutingSocketOptions(type=nrpc_py.SocketType.BIND, lost_client_max_count=count))
+        for index in range(1, count + 1):
+            client = nrpc_py.common_base.ClientInfo(
+                client_id=index,
+                client_signature=f'client:{index}'.encode(),
+                client_signature_rev=f'rev:client:{index}'.encode(),
+                client_metadata={'socket_name': f'many_{index}'},
+                connect_time=datetime.datetime.now(),
+                is_validated=True,
+                is_lost=False,
+                metadata_size=100,
+            )
+            server_socket.clients[index] = client
+            server_socket.clients_by_signature[client.client_signature] = client
+        for index in range(1, count + 1, 2):
+            server_socket._set_client_lost(server_socket.clients[index])
+        assert len(server_socket.clients) == len(server_socket.lost_clients) == count // 2
+
+        start = time.time()
+        for index in range(1, count + 1):
+            client = server_socket.get_client_info(index)
+            assert client.client_id == index and client.is_lost == (index % 2 == 1)
+            assert server_socket.is_client_alive(index) == (index % 2 == 0)
+            by_signature = server_socket.clients_by_signature.get(client.client_signature)
+            assert by_signature is (None if client.is_lost else client)
+        print(f'LOOKUP {count} clients {(time.time() - start) * 1e6 / count:.2f}us per client')
+        assert server_socket.get_client_ids() == list(range(2, count + 1, 2))
+        assert [x.client_id for x in server_socket.get_client_full()] == list(range(1, count + 1))
+        server_socket.close()
+
+    def start(self):
+        port = 8926
+        sock1 = nrpc_py.RoutingSocket(
+            type=nrpc_py.SocketType.BIND,
+            protocol=nrpc_py.ProtocolType.TCP,
+            name='test_clients_server_py',
+            types=[ClientsItem, ClientsService],
+            liveness_interval=0.1,
+            lost_client_max_count=3,
+            client_history_size=4,
+        )
+        sock1.bind('127.0.0.1', port)
+        server_socket = sock1.server_socket
+        sock2 = self.create_client('test_clients_caller_py', port)
+        sock3 = self.create_client('test_clients_target_py', port)
+        target_id = sock3.client_socket.client_id
+
+        # Lost clients above the count limit are evicted oldest first
+        errors = []
+        stop = threading.Event()
+        thread = threading.Thread(target=self.list_clients, args=(server_socket, errors, stop))
+        thread.start()
+        lost_ids = []
+        for index in range(5):
+            other = self.create_client(f'test_clients_lost_py_{index}', port)
+            lost_ids.append(other.client_socket.client_id)
+            other.close()
+        assert self.wait_for(lambda: server_socket.evicted_count == 2)
+        stop.set()
+        thread.join()
+        assert not errors, errors
+        assert list(server_socket.lost_clients.keys()) == lost_ids[2:]
+        assert server_socket.lost_clients_memory == sum(x.metadata_size for x in server_socket.lost_clients.values())
+        history = sock2.server_call(nrpc_py.RoutingMessage.GetAppInfo, {'with_history': True})['client_history']
+        assert [x['client_id'] for x in history] == lost_ids[:2]
+        assert history[0]['socket_name'] == 'test_clients_lost_py_0' and history[0]['lost_time']
+
+        # Forwarding to an evicted or lost client fails, the server keeps serving
+        for client_id in [lost_ids[0], lost_ids[4]]:
+            try:
+                sock2.forward_call(client_id, 'ClientsService.Echo', {'label': 'gone'}, timeout=2.0)
+                assert False, 'RpcError expected'
+            except nrpc_py.RpcError as e:
+                assert not isinstance(e, nrpc_py.DeadlineExceeded), e
+        resp = sock2.forward_call(target_id, 'ClientsService.Echo', {'label': 'fwd'}, timeout=2.0)
+        assert resp['label'] == 'fwd', resp
+
+        # Memory limit, then age limit, the history keeps the most recent evictions only
+        server_socket.lost_client_max_memory = server_socket.lost_clients[lost_ids[4]].metadata_size
+        assert self.wait_for(lambda: server_socket.evicted_count == 4)
+        assert list(server_socket.lost_clients.keys()) == lost_ids[4:]
+        server_socket.lost_client_max_age = 0
+        assert self.wait_for(lambda: server_socket.evicted_count == 5)
+        assert not server_socket.lost_clients and server_socket.lost_clients_memory == 0
+        assert [x['client_id'] for x in server_socket.get_client_history()] == lost_ids[1:]
+        assert server_socket.get_client_ids() == [sock2.client_socket.client_id, target_id]
+
+        sock3.close()
+        sock2.close()
+        sock1.close()
+
+        self.check_sweep(port + 1)
+        self.check_many(port + 2, 20000)
+        print('ALL OK')
+
+
+if __name__ == '__main__':
+    nrpc_py.init()
+    app = TestApplication()
+    app.start()
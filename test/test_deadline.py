@@ -0,0 +1,159 @@
+import time
+import threading
+from nrpc_py.common_base import rpcclass
+import nrpc_py
+
+
+@rpcclass({
+    'delay': 1,
+    'label': 2,
+})
+class DelayRequest:
+    delay: float = 0
+    label: str = ''
+
+
+@rpcclass({
+    'Sleep': 1,
+    'Echo': 2,
+})
+class DelayService:
+    def Sleep(self, request: DelayRequest) -> DelayRequest:
+        pass
+
+    def Echo(self, request: DelayRequest) -> DelayRequest:
+        pass
+
+
+class DelayServer:
+    def __init__(self):
+        self.echo_count = 0
+
+    def Sleep(self, request: DelayRequest) -> DelayRequest:
+        time.sleep(request.delay)
+        return request
+
+    def Echo(self, request: DelayRequest) -> DelayRequest:
+        self.echo_count += 1
+        return request
+
+
+class TestApplication:
+    def start(self):
+        port = 8912
+        server = DelayServer()
+        client_server = DelayServer()
+        sock1 = nrpc_py.RoutingSocket(
+            type=nrpc_py.SocketType.BIND,
+            protocol=nrpc_py.ProtocolType.TCP,
+            format=nrpc_py.FormatType.JSON,
+            name='test_deadline_server_py',
+            types=[
+                DelayRequest,
+                [DelayService, server]
+            ],
+            work_queue_size=2,
+        )
+        sock2 = nrpc_py.RoutingSocket(
+            type=nrpc_py.SocketType.CONNECT,
+            protocol=nrpc_py.ProtocolType.TCP,
+            format=nrpc_py.FormatType.JSON,
+            name='test_deadline_client_py',
+            types=[
+                DelayRequest,
+                [DelayService, client_server]
+            ],
+            local_call_policy=nrpc_py.LocalCallPolicy.DISABLED,
+        )
+        sock1.bind('127.0.0.1', port)
+        sock2.connect('127.0.0.1', port)
+        client: DelayService = sock2.cast(DelayService)
+
+        # Slow call fails fast and frees the connection
+        start = time.time()
+        try:
+            client.Sleep(DelayRequest(delay=0.5, label='slow'), timeout=0.1)
+            assert False, 'Deadline expected'
+        except nrpc_py.DeadlineExceeded:
+            pass
+        elapsed = time.time() - start
+        print(f'DEADLINE {elapsed:.3f}s')
+        assert elapsed < 0.3
+
+        # Queued behind the slow call, expires before the server gets to it
+        try:
+            client.Echo(DelayRequest(label='queued'), timeout=0.1)
+            assert False, 'Deadline expected'
+        except nrpc_py.DeadlineExceeded:
+            pass
+
+        # Late responses of the expired calls are dropped
+        resp = client.Echo(DelayRequest(label='fresh'))
+        assert resp.label == 'fresh', resp
+        print(f'SKIPPED echo_count={server.echo_count}')
+        assert server.echo_count == 1
+
+        # Socket default applies to the cast, the call can still override it
+        client2: DelayService = sock2.cast(DelayService, timeout=0.1)
+        resp = client2.Sleep(DelayRequest(delay=0.2, label='long'), timeout=1.0)
+        assert resp.label == 'long'
+
+        # Reverse direction
+        client_id = sock1.server_socket.get_client_ids()[0]
+        rev: DelayService = sock1.cast(DelayService, client_id)
+        start = time.time()
+        try:
+            rev.Sleep(DelayRequest(delay=0.5, label='slow'), timeout=0.1)
+            assert False, 'Deadline expected'
+        except nrpc_py.DeadlineExceeded:
+            pass
+        assert time.time() - start < 0.3
+        resp = rev.Echo(DelayRequest(label='rev'))
+        assert resp.label == 'rev'
+
+        # Forwarded through the server
+        resp = sock2.forward_call(client_id, 'DelayService.Echo', {'label': 'fwd'}, timeout=2.0)
+        assert resp['label'] == 'fwd', resp
+
+        # One call running, two queued, the rest is rejected early
+        others = []
+        for index in range(4):
+            other = nrpc_py.RoutingSocket(
+                type=nrpc_py.SocketType.CONNECT,
+                name=f'test_deadline_other_py_{index}',
+                types=[DelayRequest, DelayService],
+                local_call_policy=nrpc_py.LocalCallPolicy.DISABLED,
+            )
+            other.connect('127.0.0.1', port)
+            others.append(other)
+        results = []
+
+        def call_slow(other):
+            try:
+                other.cast(DelayService).Sleep(DelayRequest(delay=0.3, label='busy'))
+                results.append('ok')
+            except nrpc_py.ServerOverloaded:
+                results.append('overloaded')
+
+        threads = [threading.Thread(target=call_slow, args=[x]) for x in others]
+        for item in threads:
+            item.start()
+            time.sleep(0.05)
+        for item in threads:
+            item.join()
+        queue = sock2.server_call(nrpc_py.RoutingMessage.GetAppInfo, {'with_queue': True})['queue']
+        print(f'OVERLOAD {sorted(results)}, {queue}')
+        assert sorted(results) == ['ok', 'ok', 'ok', 'overloaded']
+        assert queue['rejected'] == 1 and queue['expired'] == 1 and queue['queue_size'] == 2
+
+        for other in others:
+            other.close()
+        sock2.close()
+        sock1.close()
+        print('ALL OK')
+
+
+if __name__ == '__main__':
+    nrpc_py.init()
+    app = TestApplication()
+    app.start()
@@ -0,0 +1,111 @@
+import json
+import time
+import socket
+import http.client
+from nrpc_py.common_base import rpcclass
+import nrpc_py
+
+
+@rpcclass({
+    'index': 1,
+    'label': 2,
+})
+class HttpItem:
+    index: int = 0
+    label: str = ''
+
+
+@rpcclass({
+    'Echo': 1,
+})
+class HttpService:
+    def Echo(self, request: HttpItem) -> HttpItem:
+        pass
+
+
+class HttpItemServer:
+    def Echo(self, request: HttpItem) -> HttpItem:
+        request.label = request.label.upper()
+        return request
+
+
+class TestApplication:
+    def request(self, conn, method, path, body=None):
+        conn.request(method, path, body=json.dumps(body) if body is not None else None,
+                     headers={'Content-Type': 'application/json'})
+        resp = conn.getresponse()
+        return resp.status, json.loads(resp.read() or b'null')
+
+    def start(self):
+        port = 8918
+        sock1 = nrpc_py.RoutingSocket(
+            type=nrpc_py.SocketType.BIND,
+            protocol=nrpc_py.ProtocolType.HTTP,
+            name='test_http_server_py',
+            types=[
+                HttpItem,
+                [HttpService, HttpItemServer()]
+            ],
+        )
+        sock1.bind('127.0.0.1', port)
+
+        conn = http.client.HTTPConnection('127.0.0.1', port)
+        status, resp = self.request(conn, 'POST', '/HttpService.Echo', {'index': 1, 'label': 'one'})
+        assert status == 200 and resp == {'index': 1, 'label': 'ONE'}, resp
+
+        status, resp = self.request(conn, 'GET', '/RoutingMessage.GetSchema')
+        assert status == 200 and any(x['type_name'] == 'HttpItem' for x in resp['types'])
+        status, resp = self.request(conn, 'POST', '/RoutingMessage.GetAppInfo', {})
+        assert status == 200 and resp['socket_name'] == 'test_http_server_py'
+
+        # Many calls in one request
+        calls = [{'id': x, 'method': 'HttpService.Echo', 'params': {'index': x, 'label': f'b{x}'}} for x in range(100)]
+        calls.append({'id': 100, 'method': 'Unknown'})
+        status, resp = self.request(conn, 'POST', '/batch', calls)
+        assert status == 200 and len(resp) == 101
+        assert resp[5] == {'id': 5, 'result': {'index': 5, 'label': 'B5'}}
+        assert resp[100]['code'] == 'failed'
+
+        # Errors
+        status, resp = self.request(conn, 'POST', '/nothing', {})
+        assert status == 404, resp
+        conn.request('POST', '/HttpService.Echo', body='{broken')
+        resp = conn.getresponse()
+        assert resp.status == 400
+        resp.read()
+
+        # Keep-alive, all requests share one connection
+        count = 500
+        start = time.time()
+        for index in range(count):
+            status, resp = self.request(conn, 'POST', '/HttpService.Echo', {'index': index, 'label': 'k'})
+            assert status == 200 and resp['index'] == index
+        print(f'HTTP {count} calls, {(time.time() - start) / count * 1e6:.1f}us per call')
+        print(f'HTTP connections={sock1.web_server.http_connection_count}, requests={sock1.web_server.http_request_count}')
+        assert sock1.web_server.http_connection_count == 1
+
+        # Content length that is not a non-negative number is refused, the connection is closed
+        for length in ['abc', '-5', '1_0']:
+            raw = socket.create_connection(('127.0.0.1', port))
+            raw.sendall(f'POST /HttpService.Echo HTTP/1.1\r\nContent-Length: {length}\r\n\r\n{{}}'.encode())
+            reply = b''
+            while chunk := raw.recv(4096):
+                reply += chunk
+            assert reply.startswith(b'HTTP/1.1 400'), reply
+            raw.close()
+
+        # Connection: close is honoured
+        conn.request('POST', '/HttpService.Echo', body='{}', headers={'Connection': 'close'})
+        resp = conn.getresponse()
+        assert resp.status == 200 and resp.getheader('Connection') == 'close'
+        resp.read()
+        conn.close()
+
+        sock1.close()
+        print('ALL OK')
+
+
+if __name__ == '__main__':
+    nrpc_py.init()
+    app = TestApplication()
+    app.start()
@@ -0,0 +1,134 @@
+import time
+from dataclasses import field
+from nrpc_py.common_base import rpcclass
+import nrpc_py
+
+
+@rpcclass({
+    'index': 1,
+    'values': 2,
+})
+class LocalItem:
+    index: int = 0
+    values: list[int] = field(default_factory=list)
+
+
+@rpcclass({
+    'Touch': 1,
+    'Keep': 2,
+    'Fail': 3,
+})
+class LocalService:
+    def Touch(self, request: LocalItem) -> LocalItem:
+        pass
+
+    def Keep(self, request: dict) -> dict:
+        pass
+
+    def Fail(self, request: LocalItem) -> LocalItem:
+        pass
+
+
+class LocalServer:
+    def __init__(self):
+        self.last = None
+
+    def Touch(self, request: LocalItem) -> LocalItem:
+        request.values.append(request.index)
+        self.last = request
+        return request
+
+    def Keep(self, request: dict) -> dict:
+        self.last = request
+        return request
+
+    def Fail(self, request: LocalItem) -> LocalItem:
+        raise ValueError(f'failed {request.index}')
+
+
+class TestApplication:
+    def connect(self, port, name, policy):
+        sock2 = nrpc_py.RoutingSocket(
+            type=nrpc_py.SocketType.CONNECT,
+            name=name,
+            types=[LocalItem, LocalService],
+            local_call_policy=policy,
+        )
+        sock2.connect('127.0.0.1', port)
+        return sock2
+
+    def start(self):
+        port = 8915
+        server = LocalServer()
+        sock1 = nrpc_py.RoutingSocket(
+            type=nrpc_py.SocketType.BIND,
+            name='test_local_server_py',
+            types=[
+                LocalItem,
+                [LocalService, server]
+            ],
+        )
+        sock1.bind('127.0.0.1', port)
+
+        # Opt-in, by default calls go over the wire
+        assert nrpc_py.RoutingSocketOptions(type=nrpc_py.SocketType.CONNECT).local_call_policy == \
+            nrpc_py.LocalCallPolicy.DISABLED
+
+        # Copy, neither side sees changes of the other
+        sock2 = self.connect(port, 'test_local_copy_py', nrpc_py.LocalCallPolicy.COPY)
+        assert sock2.local_server is sock1
+        client: LocalService = sock2.cast(LocalService)
+        item = LocalItem(index=1, values=[])
+        item.extra = 'undeclared'
+        resp = client.Touch(item)
+        assert item.values == [] and resp.values == [1]
+        assert resp is not server.last and resp is not item
+        assert not hasattr(server.last, 'extra') and not hasattr(resp, 'extra')
+        try:
+            client.Fail(LocalItem(index=3))
+            assert False
+        except nrpc_py.RpcError as ex:
+            assert 'failed 3' in str(ex)
+        resp = client.Keep({'x': [1]})
+        assert resp == {'x': [1]} and resp is not server.last
+
+        count = 10000
+        start = time.time()
+        for index in range(count):
+            client.Touch(LocalItem(index=index))
+        elapsed = time.time() - start
+        print(f'COPY {elapsed / count * 1e6:.1f}us per call')
+
+        # Share, same objects on both sides
+        sock3 = self.connect(port, 'test_local_share_py', nrpc_py.LocalCallPolicy.SHARE)
+        client = sock3.cast(LocalService)
+        item = LocalItem(index=2, values=[])
+        resp = client.Touch(item)
+        assert resp is item and item.values == [2]
+        start = time.time()
+        for index in range(count):
+            client.Touch(LocalItem(index=index, values=[]))
+        elapsed = time.time() - start
+        print(f'SHARE {elapsed / count * 1e6:.1f}us per call')
+
+        # Disabled, every call goes over the wire
+        sock4 = self.connect(port, 'test_local_wire_py', nrpc_py.LocalCallPolicy.DISABLED)
+        assert sock4.local_server is None
+        client = sock4.cast(LocalService)
+        start = time.time()
+        for index in range(100):
+            resp = client.Touch(LocalItem(index=index, values=[]))
+            assert resp.values == [index]
+        elapsed = time.time() - start
+        print(f'WIRE {elapsed / 100 * 1e6:.1f}us per call')
+
+        for item in [sock2, sock3, sock4]:
+            item.close()
+        sock1.close()
+        print('ALL OK')
+
+
+if __name__ == '__main__':
+    nrpc_py.init()
+    app = TestApplication()
+    app.start()
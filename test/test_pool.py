@@ -0,0 +1,143 @@
+import time
+import threading
+from nrpc_py.common_base import rpcclass
+import nrpc_py
+
+
+@rpcclass({
+    'value': 1,
+    'served_by': 2,
+})
+class PoolItem:
+    value: int = 0
+    served_by: int = 0
+
+
+@rpcclass({
+    'Work': 1,
+})
+class PoolService:
+    def Work(self, request: PoolItem) -> PoolItem:
+        pass
+
+
+class PoolServer:
+    def __init__(self, port, delay):
+        self.port = port
+        self.delay = delay
+
+    def Work(self, request: PoolItem) -> PoolItem:
+        time.sleep(self.delay)
+        return PoolItem(value=request.value + 1, served_by=self.port)
+
+
+class TestApplication:
+    def create_server(self, port, delay):
+        sock = nrpc_py.RoutingSocket(
+            type=nrpc_py.SocketType.BIND,
+            protocol=nrpc_py.ProtocolType.TCP,
+            name=f'test_pool_server_py{port}',
+            types=[
+                PoolItem,
+                [PoolService, PoolServer(port, delay)]
+            ],
+            enable_publish=True,
+        )
+        sock.bind('127.0.0.1', port)
+        return sock
+
+    def create_client(self, policy):
+        return nrpc_py.RoutingSocket(
+            type=nrpc_py.SocketType.CONNECT,
+            protocol=nrpc_py.ProtocolType.TCP,
+            name='test_pool_client_py',
+            types=[
+                PoolItem,
+                PoolService
+            ],
+            local_call_policy=nrpc_py.LocalCallPolicy.DISABLED,
+            balance_policy=policy,
+        )
+
+    def start(self):
+        ports = [8920, 8921, 8922]
+        servers = [self.create_server(port, 0.02 if port == 8922 else 0.002) for port in ports]
+
+        # Concurrent callers are spread by outstanding calls
+        sock1 = self.create_client(nrpc_py.BalancePolicy.LEAST_OUTSTANDING)
+        sock1.connect_many([('127.0.0.1', x) for x in ports])
+        while not all(x.is_healthy() for x in sock1.endpoint_pool.endpoints):
+            time.sleep(0.1)
+        client: PoolService = sock1.cast(PoolService)
+
+        # Pooled socket reports the connection of a healthy endpoint
+        client_ids = [x.socket.client_id for x in sock1.endpoint_pool.endpoints]
+        assert sock1.client_id > 0 and sock1.client_id in client_ids
+        info = sock1._get_app_info({})
+        assert info['client_id'] == sock1.client_id
+        assert info['metadata']['socket_name'].startswith('test_pool_server_py')
+        schema = sock1._get_schema({})
+        assert schema['client_id'] == sock1.client_id and len(schema['servers']) == 1
+
+        # Events of every server reach the subscriber
+        events = []
+        sock1.subscribe(PoolItem, events.append)
+        time.sleep(0.5)
+        for index, server in enumerate(servers):
+            server.publish(PoolItem(value=index, served_by=ports[index]))
+        deadline = time.time() + 2
+        while len(events) < len(servers) and time.time() < deadline:
+            time.sleep(0.05)
+        assert sorted(x.served_by for x in events) == ports, events
+
+        served = {x: 0 for x in ports}
+        lock = threading.Lock()
+
+        def work(count):
+            for index in range(count):
+                resp = client.Work(PoolItem(value=index))
+                assert resp.value == index + 1
+                with lock:
+                    served[resp.served_by] += 1
+        threads = [threading.Thread(target=work, args=(50,)) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        print(f'LEAST_OUTSTANDING {served}')
+        assert sum(served.values()) == 150
+        assert all(x > 0 for x in served.values())
+
+        # Failover, the lost endpoint is ejected and calls continue on the others
+        servers[0].close()
+        time.sleep(0.5)
+        served = {x: 0 for x in ports}
+        work(20)
+        info = sock1.endpoint_pool.get_endpoint_info()
+        print(f'FAILOVER {served}, {[(x["port"], x["is_healthy"], x["ejected"]) for x in info]}')
+        assert served[8920] == 0 and sum(served.values()) == 20
+        assert not info[0]['is_healthy'] and info[0]['ejected'] == 1
+        sock1.close()
+
+        # Latency policy prefers the fast endpoint
+        sock2 = self.create_client(nrpc_py.BalancePolicy.LATENCY)
+        sock2.connect_many([('127.0.0.1', x) for x in ports[1:]])
+        while not all(x.is_healthy() for x in sock2.endpoint_pool.endpoints):
+            time.sleep(0.1)
+        client = sock2.cast(PoolService)
+        served = {x: 0 for x in ports}
+        work(50)
+        info = sock2.endpoint_pool.get_endpoint_info()
+        print(f'LATENCY {served}, {[(x["port"], round(x["latency_ms"], 1)) for x in info]}')
+        assert served[8921] > served[8922]
+        sock2.close()
+
+        for sock in servers[1:]:
+            sock.close()
+        print('ALL OK')
+
+
+if __name__ == '__main__':
+    nrpc_py.init()
+    app = TestApplication()
+    app.start()
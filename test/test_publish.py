@@ -0,0 +1,104 @@
+import time
+from nrpc_py.common_base import rpcclass
+import nrpc_py
+
+
+@rpcclass({
+    'index': 1,
+    'price': 2,
+    'symbol': 3,
+})
+class PriceEvent:
+    index: int = 0
+    price: float = 0
+    symbol: str = ''
+
+
+class TestApplication:
+    def start(self):
+        port = 8913
+        sock1 = nrpc_py.RoutingSocket(
+            type=nrpc_py.SocketType.BIND,
+            name='test_publish_server_py',
+            types=[PriceEvent],
+            enable_publish=True,
+        )
+        sock1.bind('127.0.0.1', port)
+
+        clients = []
+        received = []
+        for index in range(3):
+            sock2 = nrpc_py.RoutingSocket(
+                type=nrpc_py.SocketType.CONNECT,
+                name=f'test_publish_client_py_{index}',
+                types=[PriceEvent],
+            )
+            sock2.connect('127.0.0.1', port)
+            events = []
+            sock2.subscribe(PriceEvent, events.append)
+            clients.append(sock2)
+            received.append(events)
+
+        # Only the 'abc' topic
+        filtered = []
+        clients[0].subscribe(PriceEvent, filtered.append, topic='abc')
+
+        # A failing handler does not stop the subscriber thread or the other handlers
+        def fail(event):
+            raise ValueError('Handler failed')
+        clients[2].subscribe(PriceEvent, fail)
+
+        # Subscriptions reach the publisher asynchronously
+        time.sleep(0.5)
+
+        start = time.time()
+        for index in range(1000):
+            sock1.publish(PriceEvent(index=index, price=index / 10, symbol='xyz'))
+        sock1.publish(PriceEvent(index=-1, symbol='abc'), topic='abc')
+        print(f'PUBLISH 1001 events, {time.time() - start:.3f}s')
+
+        deadline = time.time() + 5
+        while time.time() < deadline and any(len(x) < 1001 for x in received):
+            time.sleep(0.05)
+        for events in received:
+            assert len(events) == 1001, len(events)
+            assert [x.index for x in events[:1000]] == list(range(1000))
+            assert isinstance(events[0], PriceEvent) and events[10].price == 1.0
+        assert len(filtered) == 1 and filtered[0].symbol == 'abc', filtered
+
+        # Unsubscribed clients stop receiving
+        clients[1].unsubscribe(PriceEvent)
+        time.sleep(0.2)
+        sock1.publish(PriceEvent(index=1001))
+        time.sleep(0.2)
+        assert len(received[0]) == 1002 and len(received[1]) == 1001
+
+        for sock2 in clients:
+            sock2.close()
+        sock1.close()
+
+        # Sockets that do not publish leave the broadcast port alone
+        sock3 = nrpc_py.RoutingSocket(
+            type=nrpc_py.SocketType.BIND,
+            name='test_publish_none_py',
+            types=[PriceEvent],
+        )
+        sock3.bind('127.0.0.1', port)
+        assert sock3.publisher is None
+        other = nrpc_py.PublishSocket('127.0.0.1', port + 20000)
+        other.bind()
+        other.close()
+        is_refused = False
+        try:
+            sock3.publish(PriceEvent(index=1))
+        except AssertionError as e:
+            is_refused = 'Publishing is not enabled' in str(e)
+        assert is_refused
+        sock3.close()
+        print('ALL OK')
+
+
+if __name__ == '__main__':
+    nrpc_py.init()
+    app = TestApplication()
+    app.start()
@@ -0,0 +1,181 @@
+import time
+import socket
+import threading
+from nrpc_py.common_base import rpcclass
+import nrpc_py
+
+
+@rpcclass({
+    'value': 1,
+})
+class ResumeItem:
+    value: int = 0
+
+
+@rpcclass({
+    'Next': 1,
+})
+class ResumeService:
+    def Next(self, request: ResumeItem) -> ResumeItem:
+        pass
+
+
+class ResumeServer:
+    def __init__(self):
+        self.count = 0
+
+    def Next(self, request: ResumeItem) -> ResumeItem:
+        self.count += 1
+        return ResumeItem(value=request.value + 1)
+
+
+class TcpProxy:
+    """Forwards local ports to the server, blip() drops every connection like a network failure."""
+    def __init__(self, listen_port, target_port):
+        self.target_port = target_port
+        self.is_alive = True
+        self.pairs = []
+        self.lock = threading.Lock()
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(('127.0.0.1', listen_port))
+        self.listener.listen()
+        self.listener.settimeout(0.1)
+        self.thread = threading.Thread(target=self.accept_thread)
+        self.thread.start()
+
+    def accept_thread(self):
+        while self.is_alive:
+            try:
+                conn, _ = self.listener.accept()
+            except socket.timeout:
+                continue
+            upstream = socket.create_connection(('127.0.0.1', self.target_port))
+            with self.lock:
+                self.pairs.append((conn, upstream))
+            threading.Thread(target=self.pump, args=(conn, upstream), daemon=True).start()
+            threading.Thread(target=self.pump, args=(upstream, conn), daemon=True).start()
+
+    def pump(self, source, target):
+        try:
+            while True:
+                data = source.recv(65536)
+                if not data:
+                    break
+                target.sendall(data)
+        except OSError:
+            pass
+        for item in [source, target]:
+            try:
+                item.close()
+            except OSError:
+                pass
+
+    def blip(self):
+        with self.lock:
+            pairs, self.pairs = self.pairs, []
+        for pair in pairs:
+            for item in pair:
+                try:
+                    item.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+    def close(self):
+        self.is_alive = False
+        self.thread.join()
+        self.blip()
+        self.listener.close()
+
+
+class TestApplication:
+    def start(self):
+        port = 8923
+        proxy_port = 8924
+        proxies = [TcpProxy(proxy_port, port), TcpProxy(proxy_port + 10000, port + 10000)]
+        server = ResumeServer()
+        sock1 = nrpc_py.RoutingSocket(
+            type=nrpc_py.SocketType.BIND,
+            protocol=nrpc_py.ProtocolType.TCP,
+            name='test_reconnect_server_py',
+            types=[
+                ResumeItem,
+                [ResumeService, server]
+            ],
+            liveness_interval=0.1,
+        )
+        sock2 = nrpc_py.RoutingSocket(
+            type=nrpc_py.SocketType.CONNECT,
+            protocol=nrpc_py.ProtocolType.TCP,
+            name='test_reconnect_client_py',
+            types=[
+                ResumeItem,
+                ResumeService
+            ],
+            local_call_policy=nrpc_py.LocalCallPolicy.DISABLED,
+            reconnect_timeout=5.0,
+        )
+        sock1.bind('127.0.0.1', port)
+        sock2.connect('127.0.0.1', proxy_port)
+        client: ResumeService = sock2.cast(ResumeService)
+        client_id = sock2.client_socket.client_id
+        assert client.Next(ResumeItem(value=1)).value == 2
+
+        # Calls after a blip resume the same session, no new handshake or schema sync
+        for attempt in range(3):
+            for proxy in proxies:
+                proxy.blip()
+            start = time.time()
+            assert client.Next(ResumeItem(value=attempt)).value == attempt + 1
+            print(f'RESUMED {attempt} in {(time.time() - start) * 1000:.1f}ms')
+            assert sock2.client_socket.client_id == client_id
+            # The call may also have gone through before the disconnect was reported
+            while sock2.client_socket.resumed_count < attempt + 1 and time.time() - start < 2:
+                time.sleep(0.01)
+            assert sock2.client_socket.resumed_count == attempt + 1
+        assert sock1.server_socket.resumed_count == 3
+        assert sock1.server_socket.is_client_alive(client_id)
+        assert len(sock1.server_socket.clients) == 1
+
+        # Response already queued when the drop is noticed, the call is not run again
+        client_socket = sock2.client_socket
+        count = server.count
+        with client_socket.request_lock:
+            client_socket.send_call(['ResumeService.Next', {'value': 10}])
+            time.sleep(0.2)
+            client_socket.needs_resume = True
+            resp = client_socket.recv_norm()
+        assert resp[0].startswith(b'response:') and b'11' in resp[1]
+        assert client.Next(ResumeItem(value=20)).value == 21
+        time.sleep(0.2)
+        assert server.count == count + 2
+        assert client_socket.resumed_count == 4
+
+        # Idle clients resume on their own, reverse calls reach them again
+        for proxy in proxies:
+            proxy.blip()
+        time.sleep(0.5)
+        assert sock2.client_socket.resumed_count == 5
+        info = sock1.client_call(client_id, nrpc_py.RoutingMessage.GetAppInfo, {})
+        assert info['client_id'] == client_id
+
+        # Server gone for longer than the timeout, the client gives up
+        for proxy in proxies:
+            proxy.close()
+        start = time.time()
+        try:
+            client.Next(ResumeItem(value=1))
+            assert False
+        except nrpc_py.ConnectionLost:
+            print(f'LOST after {time.time() - start:.1f}s')
+        assert sock2.client_socket.is_lost
+
+        sock2.close()
+        sock1.close()
+        print('ALL OK')
+
+
+if __name__ == '__main__':
+    nrpc_py.init()
+    app = TestApplication()
+    app.start()
@@ -0,0 +1,88 @@
+import os
+import sys
+import time
+import tempfile
+import importlib
+import nrpc_py
+
+
+class TestApplication:
+    def write_models(self, folder, module_name, count):
+        """Model package with 'count' types and a service for every ten of them."""
+        lines = ['from nrpc_py import rpcclass', '']
+        for index in range(count):
+            lines += [
+                '',
+                f'@rpcclass({{"name": 1, "size": 2, "ratio": 3, "tags": 4}})',
+                f'class {module_name}Type{index}:',
+                '    name: str = ""',
+                '    size: int = 0',
+                '    ratio: float = 0.0',
+                '    tags: list[str] = None',
+                '',
+            ]
+            if index % 10 == 9:
+                lines += [
+                    '',
+                    f'@rpcclass({{"Get": 1, "Put": 2}})',
+                    f'class {module_name}Service{index}:',
+                    f'    def Get(self, request: {module_name}Type{index}) -> {module_name}Type{index}:',
+                    '        pass',
+                    '',
+                    f'    def Put(self, request: {module_name}Type{index}) -> {module_name}Type{index - 1}:',
+                    '        pass',
+                    '',
+                ]
+        with open(os.path.join(folder, f'{module_name}.py'), 'w') as file:
+            file.write('\n'.join(lines))
+
+    def start(self):
+        count = 1500
+        folder = tempfile.mkdtemp()
+        sys.path.insert(0, folder)
+        self.write_models(folder, 'LazyModels', count)
+        self.write_models(folder, 'MoreModels', count)
+        # Compiled once, the benchmark measures the import and not the compiler
+        importlib.invalidate_caches()
+        importlib.import_module('compileall').compile_dir(folder, quiet=1)
+
+        start = time.time()
+        importlib.import_module('LazyModels')
+        import_time = time.time() - start
+        pending = [x for x in nrpc_py.common_base.g_pending_classes.keys() if x.startswith('LazyModels')]
+        assert len(pending) == count + count // 10
+        start = time.time()
+        for type_name in pending:
+            nrpc_py.common_base.register_pending(type_name)
+        register_time = time.time() - start
+        print(f'IMPORT {count} types in {import_time * 1000:.1f}ms, registration deferred {register_time * 1000:.1f}ms')
+        models = importlib.import_module('MoreModels')
+
+        # Nothing is registered until the first lookup
+        assert 'MoreModelsType5' in nrpc_py.common_base.g_pending_classes
+        assert 'LazyModelsType5' not in nrpc_py.common_base.g_pending_classes
+        item = nrpc_py.construct_item('MoreModelsType5', {'name': 'five', 'size': 5, 'ratio': 0.5, 'tags': ['a']})
+        assert isinstance(item, models.MoreModelsType5) and item.tags == ['a']
+        assert 'MoreModelsType5' not in nrpc_py.common_base.g_pending_classes
+
+        # A socket registers the service and the types its methods use
+        sock = nrpc_py.RoutingSocket(
+            type=nrpc_py.SocketType.CONNECT,
+            protocol=nrpc_py.ProtocolType.TCP,
+            name='test_register_py',
+            types=[models.MoreModelsType8, models.MoreModelsType9, models.MoreModelsService9],
+        )
+        assert sock.known_services['MoreModelsService9'].methods['Put'].response_type == 'MoreModelsType8'
+        assert 'MoreModelsType100' in nrpc_py.common_base.g_pending_classes
+        sock.close()
+
+        # Listing the registry registers everything
+        assert len(nrpc_py.g_all_types) > 2 * count
+        assert not nrpc_py.common_base.g_pending_classes
+        print('ALL OK')
+
+
+if __name__ == '__main__':
+    nrpc_py.init()
+    app = TestApplication()
+    app.start()
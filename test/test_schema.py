@@ -0,0 +1,228 @@
+import time
+from nrpc_py.common_base import rpcclass
+import nrpc_py
+
+
+@rpcclass({
+    'name': 1,
+    'size': 2,
+})
+class SchemaItem:
+    name: str = ''
+    size: int = 0
+
+
+@rpcclass({
+    'tags': 1,
+})
+class SchemaExtra:
+    tags: str = ''
+
+
+@rpcclass({
+    'Describe': 1,
+})
+class SchemaService:
+    def Describe(self, request: SchemaItem) -> SchemaItem:
+        pass
+
+
+class SchemaServer:
+    def Describe(self, request: SchemaItem) -> SchemaItem:
+        return SchemaItem(name=request.name, size=len(request.name))
+
+
+class TestApplication:
+    def bench_schema(self, count):
+        """Reconciles a schema of 'count' types and services against one that has half of the fields and methods."""
+        sock = self.create_client('test_schema_bench_py', [])
+        schema = {'types': [], 'fields': [], 'services': [], 'methods': []}
+        for index in range(count):
+            type_name = f'BenchType{index}'
+            service_name = f'BenchService{index}'
+            fields = {}
+            methods = {}
+            schema['types'].append({'type_name': type_name})
+            schema['services'].append({'service_name': service_name})
+            for id_value in range(1, 11):
+                field_name = f'field{id_value}'
+                method_name = f'Method{id_value}'
+                schema['fields'].append({
+                    'type_name': type_name, 'field_name': field_name, 'field_type': 'int', 'id_value': id_value})
+                schema['methods'].append({
+                    'service_name': service_name, 'method_name': method_name, 'id_value': id_value,
+                    'request_type': type_name, 'response_type': type_name})
+                if id_value % 2:
+                    fields[field_name] = nrpc_py.common_base.FieldInfo(field_name, 'int', id_value, -1, -1, True)
+                    methods[method_name] = nrpc_py.common_base.MethodInfo(
+                        method_name, type_name, type_name, id_value, True)
+            sock.known_types[type_name] = nrpc_py.common_base.ClassInfo(type_name, fields, -1, True, dict)
+            sock.known_services[service_name] = nrpc_py.common_base.ServiceInfo(service_name, methods, True, None)
+
+        start = time.time()
+        sock._find_missing_methods(schema)
+        added1 = sock._find_new_fields(schema, True)
+        added2 = sock._find_new_methods(schema, True)
+        elapsed = time.time() - start
+        assert len(added1) == count * 5 and len(added2) == count * 5
+        assert sock.known_types['BenchType0'].fields['field2'].field_type == 'int'
+        sock.close()
+        return elapsed
+
+    def create_client(self, name, types):
+        return nrpc_py.RoutingSocket(
+            type=nrpc_py.SocketType.CONNECT,
+            protocol=nrpc_py.ProtocolType.TCP,
+            name=name,
+            types=types,
+            local_call_policy=nrpc_py.LocalCallPolicy.DISABLED,
+        )
+
+    def start(self):
+        port = 8925
+        sock1 = nrpc_py.RoutingSocket(
+            type=nrpc_py.SocketType.BIND,
+            protocol=nrpc_py.ProtocolType.TCP,
+            name='test_schema_server_py',
+            types=[
+                SchemaItem,
+                SchemaExtra,
+                [SchemaService, SchemaServer()]
+            ],
+        )
+        sock1.bind('127.0.0.1', port)
+        server_hash = sock1.server_socket.metadata['schema_hash']
+        assert server_hash == sock1._get_schema({})['schema_hash']
+
+        # Same schema, the sync round trips are skipped
+        sock2 = self.create_client('test_schema_same_py', [SchemaItem, SchemaExtra, SchemaService])
+        start = time.time()
+        sock2.connect('127.0.0.1', port)
+        print(f'SAME connected in {(time.time() - start) * 1000:.1f}ms, syncs={sock2.sync_count}')
+        assert sock2._get_schema_hash() == server_hash
+        assert sock2.sync_count == 0
+        assert sock2.cast(SchemaService).Describe(SchemaItem(name='four')).size == 4
+
+        # Different schema, full sync
+        sock3 = self.create_client('test_schema_other_py', [SchemaItem, SchemaService])
+        start = time.time()
+        sock3.connect('127.0.0.1', port)
+        print(f'OTHER connected in {(time.time() - start) * 1000:.1f}ms, syncs={sock3.sync_count}')
+        assert sock3._get_schema_hash() != server_hash
+        assert sock3.sync_count == 2
+        assert sock3.cast(SchemaService).Describe(SchemaItem(name='three')).size == 5
+
+        # Hash ignores declaration order
+        sock4 = self.create_client('test_schema_order_py', [SchemaService, SchemaExtra, SchemaItem])
+        assert sock4._get_schema_hash() == server_hash
+
+        # Repeated requests are answered from the snapshot until the client set changes
+        info1 = sock2.server_call(nrpc_py.RoutingMessage.GetAppInfo, {'with_clients': True})
+        hits = sock1.snapshot_cache.hit_count
+        info2 = sock2.server_call(nrpc_py.RoutingMessage.GetAppInfo, {'with_clients': True})
+        assert info1 == info2 and len(info1['clients']) == 2
+        assert sock1.snapshot_cache.hit_count == hits + 1
+        sock4.connect('127.0.0.1', port)
+        info3 = sock2.server_call(nrpc_py.RoutingMessage.GetAppInfo, {'with_clients': True})
+        assert len(info3['clients']) == 3
+        assert sock1.snapshot_cache.hit_count == hits + 1
+        sock1.server_socket.add_metadata({'region': 'north'})
+        info4 = sock2.server_call(nrpc_py.RoutingMessage.GetAppInfo, {'with_clients': True})
+        assert info4['metadata']['region'] == 'north'
+
+        # Filtered and paged schema
+        schema = sock2.server_call(nrpc_py.RoutingMessage.GetSchema, {'filter': 'Schema', 'limit': 1})
+        assert schema['total_types'] == 2 and len(schema['types']) == 1
+        assert schema['total_services'] == 1 and len(schema['services']) == 1
+        assert all(x['type_name'] == schema['types'][0]['type_name'] for x in schema['fields'])
+        # Types and services are paged on their own
+        schema2 = sock2.server_call(nrpc_py.RoutingMessage.GetSchema, {'filter': 'Schema', 'limit': 1, 'type_offset': 1})
+        assert len(schema2['types']) == 1 and schema2['types'][0]['type_name'] != schema['types'][0]['type_name']
+        assert len(schema2['services']) == 1
+        schema2 = sock2.server_call(nrpc_py.RoutingMessage.GetSchema, {'filter': 'Schema', 'service_offset': 1})
+        assert len(schema2['types']) == 2 and not schema2['services'] and not schema2['methods']
+        for req in [{'type_offset': -1}, {'service_offset': 'x'}, {'limit': 1.5}, {'limit': True}]:
+            try:
+                sock2.server_call(nrpc_py.RoutingMessage.GetSchema, req)
+                assert False, 'RpcError expected'
+            except nrpc_py.RpcError:
+                pass
+        schema = sock2.server_call(nrpc_py.RoutingMessage.GetSchema, {'filter': 'Extra', 'sections': ['fields']})
+        assert schema['total_types'] == 1 and not schema['types'] and not schema['clients']
+        assert [x['field_name'] for x in schema['fields']] == ['tags']
+
+        # Dispatch table is ready before the first call, failed methods keep their empty response
+        dispatch = sock1.dispatch_table['SchemaService.Describe']
+        assert dispatch.handler.__self__ is sock1.known_servers['SchemaService'].instance
+        assert sock1._incoming_call('SchemaService.Describe', {'name': 'five', 'size': 0}) == {'name': 'five', 'size': 4}
+        assert sock1._incoming_call('SchemaService.Missing', {}) == {}
+        assert 'SchemaService.Missing' not in sock1.dispatch_table
+        start = time.time()
+        for _ in range(10000):
+            sock1._incoming_call('SchemaService.Describe', {'name': 'five', 'size': 0})
+        print(f'DISPATCH {(time.time() - start) * 100:.2f}us per call')
+
+        # Sync that only records a method error takes the method out of the dispatch table
+        sock5 = nrpc_py.RoutingSocket(
+            type=nrpc_py.SocketType.BIND,
+            protocol=nrpc_py.ProtocolType.TCP,
+            name='test_schema_mismatch_py',
+            types=[SchemaItem, [SchemaService, SchemaServer()]],
+        )
+        schema = sock5._get_schema(None)
+        for item in schema['methods']:
+            if item['method_name'] == 'Describe':
+                item['id_value'] = 7
+        before = sock5._dispatch(nrpc_py.RoutingMessage.GetSchema, {})
+        sock5._set_schema(schema)
+        after = sock5._dispatch(nrpc_py.RoutingMessage.GetSchema, {})
+        assert not any(x['method_errors'] for x in before['methods'])
+        assert any(x['method_errors'] for x in after['methods'] if x['method_name'] == 'Describe')
+        assert sock5.known_services['SchemaService'].methods['Describe'].method_errors
+        assert sock5._incoming_call('SchemaService.Describe', {'name': 'abc', 'size': 0}) == {'name': '', 'size': 0}
+        sock5.close()
+
+        # Stub class is generated once, stubs of different sockets keep their own socket
+        stub2 = sock2.cast(SchemaService)
+        stub3 = sock3.cast(SchemaService)
+        assert type(stub2) is type(sock2.cast(SchemaService))
+        assert type(stub2).__name__ == 'SchemaServiceClient'
+        sock3.close()
+        assert stub2.Describe(SchemaItem(name='two')).size == 3
+        assert stub3.socket is sock3
+
+        # Stub calls resolve the method once, a schema change resolves it again
+        call_info = sock2.call_table['SchemaService.Describe']
+        assert call_info.method_info is sock2.known_services['SchemaService'].methods['Describe']
+        assert call_info.request_info is sock2.known_types['SchemaItem']
+        assert stub2.Describe(SchemaItem(name='two')).size == 3
+        assert sock2.call_table['SchemaService.Describe'] is call_info
+        sock2.schema_version += 1
+        assert stub2.Describe(SchemaItem(name='two')).size == 3
+        assert sock2.call_table['SchemaService.Describe'] is not call_info
+        start = time.time()
+        for _ in range(1000):
+            stub2.Describe(SchemaItem(name='two'))
+        print(f'STUB {(time.time() - start) * 1000:.2f}us per call')
+        start = time.time()
+        for _ in range(10000):
+            sock2.cast(SchemaService)
+        print(f'CAST {(time.time() - start) * 100:.2f}us per cast')
+
+        sock4.close()
+        sock2.close()
+        sock1.close()
+
+        # Reconciliation grows linearly with the schema size
+        small = self.bench_schema(500)
+        large = self.bench_schema(2000)
+        print(f'BENCH 500 types {small * 1000:.1f}ms, 2000 types {large * 1000:.1f}ms')
+        assert large < 1.0
+        assert large < small * 10
+        print('ALL OK')
+
+
+if __name__ == '__main__':
+    nrpc_py.init()
+    app = TestApplication()
+    app.start()
@@ -0,0 +1,104 @@
+import os
+import sys
+import json
+import tempfile
+import subprocess
+import nrpc_py
+
+WORKER = '''
+import sys
+import time
+import json
+import nrpc_py
+from nrpc_py.schema_cache import load_schema
+import CacheModels
+
+start = time.time()
+loaded = load_schema(sys.argv[1])
+load_time = time.time() - start
+item = nrpc_py.construct_item('CacheModelsType7', {'name': 'seven', 'size': 7})
+service = nrpc_py.g_all_services['CacheModelsService9'].methods['Get']
+start = time.time()
+nrpc_py.register_all()
+register_time = time.time() - start
+print(json.dumps({
+    'loaded': loaded,
+    'size': item.size,
+    'size_id': nrpc_py.g_all_types['CacheModelsType7'].fields['size'].id_value,
+    'response_type': service.response_type,
+    'load_ms': load_time * 1000,
+    'register_ms': register_time * 1000,
+}))
+'''
+
+
+class TestApplication:
+    def write_models(self, folder, count, size_id):
+        lines = ['from nrpc_py import rpcclass', '']
+        for index in range(count):
+            lines += [
+                '',
+                f'@rpcclass({{"name": 1, "size": {size_id if index == 7 else 2}}})',
+                f'class CacheModelsType{index}:',
+                '    name: str = ""',
+                '    size: int = 0',
+                '',
+            ]
+            if index % 10 == 9:
+                lines += [
+                    '',
+                    f'@rpcclass({{"Get": 1}})',
+                    f'class CacheModelsService{index}:',
+                    f'    def Get(self, request: CacheModelsType{index}) -> CacheModelsType{index - 1}:',
+                    '        pass',
+                    '',
+                ]
+        with open(os.path.join(folder, 'CacheModels.py'), 'w') as file:
+            file.write('\n'.join(lines))
+
+    def run(self, folder, *args):
+        env = {**os.environ, 'PYTHONPATH': os.pathsep.join([folder, *sys.path])}
+        res = subprocess.run([sys.executable, *args], cwd=folder, env=env, capture_output=True, text=True, timeout=30)
+        assert res.returncode == 0, res.stderr
+        return res.stdout.strip().splitlines()[-1]
+
+    def start(self):
+        count = 500
+        total = count + count // 10
+        folder = tempfile.mkdtemp()
+        cache = os.path.join(folder, 'cache')
+        os.mkdir(cache)
+        with open(os.path.join(folder, 'worker.py'), 'w') as file:
+            file.write(WORKER)
+        self.write_models(folder, count, 2)
+
+        # Export with the command line tool
+        print(self.run(folder, '-m', 'nrpc_py.schema_cache', 'modules=CacheModels', f'cache={cache}'))
+        files = os.listdir(cache)
+        assert len(files) == 1 and files[0].startswith('nrpc_schema_')
+        schema = json.load(open(os.path.join(cache, files[0])))
+        assert len(schema['types']) == count and len(schema['services']) == count // 10
+
+        # Workers load the schema instead of registering it
+        res = json.loads(self.run(folder, 'worker.py', cache))
+        print(f'CACHED {res}')
+        assert res['loaded'] == total
+        assert res['size'] == 7 and res['size_id'] == 2
+        assert res['response_type'] == 'CacheModelsType8'
+        res = json.loads(self.run(folder, 'worker.py', os.path.join(folder, 'missing')))
+        print(f'UNCACHED {res}')
+        assert res['loaded'] == 0 and res['size_id'] == 2
+
+        # Changed declaration, the folder has no file for it and the old file skips that class
+        self.write_models(folder, count, 3)
+        res = json.loads(self.run(folder, 'worker.py', cache))
+        assert res['loaded'] == 0 and res['size_id'] == 3
+        res = json.loads(self.run(folder, 'worker.py', os.path.join(cache, files[0])))
+        assert res['loaded'] == total - 1 and res['size_id'] == 3
+        print('ALL OK')
+
+
+if __name__ == '__main__':
+    nrpc_py.init()
+    app = TestApplication()
+    app.start()
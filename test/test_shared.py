@@ -0,0 +1,127 @@
+import os
+import time
+import glob
+from dataclasses import field
+from nrpc_py.common_base import rpcclass
+from multiprocessing import shared_memory
+from nrpc_py.shared_buffer import SharedBufferPool, get_missing_reply
+import nrpc_py
+
+
+@rpcclass({
+    'name': 1,
+    'values': 2,
+})
+class BlobInfo:
+    name: str = ''
+    values: list[int] = field(default_factory=list)
+
+
+@rpcclass({
+    'Echo': 1,
+})
+class BlobService:
+    def Echo(self, request: BlobInfo) -> BlobInfo:
+        pass
+
+
+class BlobServer:
+    def Echo(self, request: BlobInfo) -> BlobInfo:
+        return request
+
+
+def get_segments():
+    return glob.glob(f'/dev/shm/nrpc{os.getpid()}_*')
+
+
+class TestApplication:
+    def start(self):
+        port = 8916
+        sock1 = nrpc_py.RoutingSocket(
+            type=nrpc_py.SocketType.BIND,
+            name='test_shared_server_py',
+            types=[
+                BlobInfo,
+                [BlobService, BlobServer()]
+            ],
+            shared_memory_threshold=64 * 1024,
+        )
+        sock2 = nrpc_py.RoutingSocket(
+            type=nrpc_py.SocketType.CONNECT,
+            name='test_shared_client_py',
+            types=[
+                BlobInfo,
+                [BlobService, BlobServer()]
+            ],
+            local_call_policy=nrpc_py.LocalCallPolicy.DISABLED,
+            shared_memory_threshold=64 * 1024,
+        )
+        sock1.bind('127.0.0.1', port)
+        sock2.connect('127.0.0.1', port)
+        client: BlobService = sock2.cast(BlobService)
+
+        # Small payloads stay in the frames
+        resp = client.Echo(BlobInfo(name='small', values=[1, 2, 3]))
+        assert resp.values == [1, 2, 3]
+        assert sock2.client_socket.shared_buffers.sent_count == 0
+
+        values = list(range(1000000))
+        start = time.time()
+        resp = client.Echo(BlobInfo(name='large', values=values))
+        print(f'SHARED {len(values)} values, {time.time() - start:.3f}s')
+        assert resp.name == 'large' and resp.values == values
+        assert sock2.client_socket.shared_buffers.sent_count == 1
+        assert sock1.server_socket.shared_buffers.sent_count == 1
+        assert sock2.client_socket.shared_buffers.received_count == 1
+
+        # Reverse direction
+        client_id = sock1.server_socket.get_client_ids()[0]
+        resp = sock1.cast(BlobService, client_id).Echo(BlobInfo(name='rev', values=values))
+        assert resp.values == values
+        assert sock1.server_socket.shared_buffers.received_count == 2
+
+        # Received segments are unlinked by the receiver
+        if os.path.isdir('/dev/shm'):
+            assert not get_segments(), get_segments()
+
+        # Segments nobody received are unlinked once they expire
+        pool = SharedBufferPool(16, ttl=0.1)
+        frames = pool.put(b'Lost.Message', b'x' * 100)
+        assert frames[1] == b'{}'
+        if os.path.isdir('/dev/shm'):
+            assert len(get_segments()) == 1
+        time.sleep(0.2)
+        pool.cleanup()
+        if os.path.isdir('/dev/shm'):
+            assert not get_segments(), get_segments()
+        assert pool.load([b'', frames[0], frames[1]], pool.prefix) is None
+
+        # Only segments of the sender on this host are read and unlinked
+        other = shared_memory.SharedMemory(name=f'nrpc_other_{os.getpid()}', create=True, size=16)
+        frames = pool.put(b'Foreign.Message', b'x' * 100)
+        assert pool.load([b'', b'Foreign.Message;shm=' + other.name.encode() + b':16', b'{}'], pool.prefix) is None
+        assert pool.load([b'', frames[0], frames[1]], None) is None
+        assert pool.load([b'', frames[0], frames[1]], pool.prefix)[2] == b'x' * 100
+        shared_memory.SharedMemory(name=other.name).close()
+        other.close()
+        other.unlink()
+
+        # Calls and responses whose segment is missing are answered with an error
+        assert get_missing_reply(b'response:BlobService.Echo;id=3;shm=nrpc1_a_1:9')[0] == b'error:BlobService.Echo;id=3'
+        assert get_missing_reply(b'BlobService.Echo;id=4;shm=nrpc1_a_1:9')[0] == b'error:BlobService.Echo;id=4'
+        client_socket = sock2.client_socket
+        with client_socket.request_lock:
+            client_socket.send_call([f'BlobService.Echo;shm={pool.prefix}999999:10', {}])
+            resp = client_socket.recv_norm(0, time.time() + 2.0)
+        assert resp and resp[0] == b'error:BlobService.Echo' and b'not available' in resp[1], resp
+        assert client.Echo(BlobInfo(name='after')).name == 'after'
+
+        sock2.close()
+        sock1.close()
+        print('ALL OK')
+
+
+if __name__ == '__main__':
+    nrpc_py.init()
+    app = TestApplication()
+    app.start()
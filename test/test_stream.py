@@ -0,0 +1,210 @@
+import time
+import threading
+from typing import Iterator
+from nrpc_py.common_base import rpcclass
+import nrpc_py
+
+
+@rpcclass({
+    'start': 1,
+    'count': 2,
+})
+class RangeRequest:
+    start: int = 0
+    count: int = 0
+
+
+@rpcclass({
+    'index': 1,
+    'label': 2,
+})
+class RangeItem:
+    index: int = 0
+    label: str = ''
+
+
+@rpcclass({
+    'Range': 1,
+    'Echo': 2,
+    'Upload': 3,
+    'Chat': 4,
+})
+class RangeService:
+    def Range(self, request: RangeRequest) -> Iterator[RangeItem]:
+        pass
+
+    def Echo(self, request: RangeItem) -> RangeItem:
+        pass
+
+    def Upload(self, request: Iterator[RangeItem]) -> RangeRequest:
+        pass
+
+    def Chat(self, request: Iterator[RangeItem]) -> Iterator[RangeItem]:
+        pass
+
+
+class RangeServer:
+    def __init__(self):
+        self.produced = 0
+        self.delay = 0
+
+    def Range(self, request: RangeRequest) -> Iterator[RangeItem]:
+        for index in range(request.start, request.start + request.count):
+            self.produced += 1
+            time.sleep(self.delay)
+            yield RangeItem(index=index, label=f'item={index}')
+
+    def Echo(self, request: RangeItem) -> RangeItem:
+        return request
+
+    def Upload(self, request: Iterator[RangeItem]) -> RangeRequest:
+        result = RangeRequest(start=-1, count=0)
+        for item in request:
+            assert item.index == result.count, f'Out of order: {item.index}'
+            if result.start < 0:
+                result.start = item.index
+            result.count += 1
+        return result
+
+    def Chat(self, request: Iterator[RangeItem]) -> Iterator[RangeItem]:
+        for item in request:
+            yield RangeItem(index=item.index * 2, label=item.label.upper())
+
+
+class TestApplication:
+    def start(self):
+        port = 8911
+        server = RangeServer()
+        sock1 = nrpc_py.RoutingSocket(
+            type=nrpc_py.SocketType.BIND,
+            protocol=nrpc_py.ProtocolType.TCP,
+            format=nrpc_py.FormatType.JSON,
+            name='test_stream_server_py',
+            types=[
+                RangeRequest,
+                RangeItem,
+                [RangeService, server]
+            ],
+        )
+        sock2 = nrpc_py.RoutingSocket(
+            type=nrpc_py.SocketType.CONNECT,
+            protocol=nrpc_py.ProtocolType.TCP,
+            format=nrpc_py.FormatType.JSON,
+            name='test_stream_client_py',
+            types=[
+                RangeRequest,
+                RangeItem,
+                RangeService
+            ],
+        )
+        sock1.bind('127.0.0.1', port)
+        sock2.connect('127.0.0.1', port)
+        client: RangeService = sock2.cast(RangeService)
+
+        start = time.time()
+        total = 0
+        for item in client.Range(RangeRequest(start=10, count=5000)):
+            assert item.index == 10 + total, f'Out of order: {item.index}'
+            assert item.label == f'item={item.index}'
+            total += 1
+        print(f'STREAM {total} items, {time.time() - start:.3f}s')
+        assert total == 5000
+
+        # Abandoned stream only produces what the window allows
+        server.produced = 0
+        for item in sock2.server_stream('RangeService.Range', RangeRequest(start=0, count=100000), credit=8):
+            if item.index == 3:
+                break
+        time.sleep(0.2)
+        print(f'CANCEL produced={server.produced}')
+        assert server.produced <= 8
+        assert len(sock1.streams) == 0
+
+        # Call response read while reading a stream is kept for the call
+        client_socket = sock2.client_socket
+        items = sock2.server_stream('RangeService.Range', RangeRequest(start=0, count=100), credit=8)
+        assert next(items).index == 0
+        with client_socket.request_lock:
+            client_socket.send_call(['RangeService.Echo', {'index': 7, 'label': 'queued'}])
+        time.sleep(0.2)
+        assert [x.index for x in items] == list(range(1, 100))
+        with client_socket.request_lock:
+            resp = client_socket.recv_norm(0, time.time() + 1.0)
+        assert resp and resp[0].startswith(b'response:') and b'queued' in resp[1], resp
+
+        # Client stream, the generator is consumed lazily as the server grants credit
+        start = time.time()
+        resp = client.Upload(RangeItem(index=x, label='up') for x in range(5000))
+        print(f'UPLOAD {resp}, {time.time() - start:.3f}s')
+        assert resp.start == 0 and resp.count == 5000
+
+        # Streams above the limit are refused, finished ones give their slot back
+        assert sock1.stream_count == 0
+        sock1.options.max_streams = 0
+        try:
+            client.Upload(RangeItem(index=x, label='up') for x in range(10))
+            assert False, 'RpcError expected'
+        except nrpc_py.RpcError as e:
+            assert 'Too many streams' in str(e), e
+        sock1.options.max_streams = 1
+        assert client.Upload(RangeItem(index=x, label='up') for x in range(10)).count == 10
+        assert sock1.stream_count == 0
+
+        # Bidirectional stream
+        total = 0
+        for item in client.Chat(RangeItem(index=x, label=f'msg{x}') for x in range(1000)):
+            assert item.index == total * 2 and item.label == f'MSG{total}'
+            total += 1
+        print(f'CHAT {total} items')
+        assert total == 1000
+
+        # Unary calls still work next to streams
+        resp = client.Echo(RangeItem(index=1, label='one'))
+        assert resp.label == 'one'
+
+        # Slow generator runs on its stream thread, other clients are still served
+        sock3 = nrpc_py.RoutingSocket(
+            type=nrpc_py.SocketType.CONNECT,
+            name='test_stream_other_py',
+            types=[RangeRequest, RangeItem, RangeService],
+        )
+        sock3.connect('127.0.0.1', port)
+        server.delay = 0.3
+        items = []
+        thread = threading.Thread(target=lambda: items.extend(client.Range(RangeRequest(start=0, count=3))))
+        thread.start()
+        time.sleep(0.1)
+        start = time.time()
+        assert sock3.cast(RangeService).Echo(RangeItem(label='fast')).label == 'fast'
+        print(f'ECHO during slow stream {(time.time() - start) * 1000:.1f}ms')
+        assert time.time() - start < 0.2 and not items
+        thread.join()
+        assert [x.index for x in items] == [0, 1, 2]
+        server.delay = 0
+
+        # Malformed stream messages are refused without stopping the server
+        client_socket = sock3.client_socket
+        with client_socket.request_lock:
+            client_socket.send_norm([nrpc_py.ServerMessage.StreamOpen, b'not json'])
+            client_socket.send_norm([nrpc_py.ServerMessage.StreamOpen, {'stream_id': 1}])
+            stream_id = client_socket.open_stream()
+            client_socket.send_norm([
+                nrpc_py.ServerMessage.StreamOpen,
+                {'stream_id': stream_id, 'method_name': 'NoDot', 'method_params': {}, 'credit': 1}
+            ])
+            resp = client_socket.recv_stream(stream_id)
+            client_socket.close_stream(stream_id)
+        assert resp[0] == nrpc_py.ServerMessage.StreamEnd and 'Unknown service' in resp[1]['error'], resp
+        assert sock3.cast(RangeService).Echo(RangeItem(label='after')).label == 'after'
+        assert sock1.stream_count == 0
+        sock3.close()
+
+        sock2.close()
+        sock1.close()
+        print('ALL OK')
+
+
+if __name__ == '__main__':
+    nrpc_py.init()
+    app = TestApplication()
+    app.start()
@@ -0,0 +1,86 @@
+import time
+from nrpc_py.common_base import rpcclass
+import nrpc_py
+
+
+@rpcclass({
+    'index': 1,
+    'label': 2,
+})
+class PingRequest:
+    index: int = 0
+    label: str = ''
+
+
+@rpcclass({
+    'Ping': 1,
+})
+class PingService:
+    def Ping(self, request: PingRequest) -> PingRequest:
+        pass
+
+
+class PingServer:
+    def Ping(self, request: PingRequest) -> PingRequest:
+        return request
+
+
+class TestApplication:
+    def run(self, protocol, port):
+        sock1 = nrpc_py.RoutingSocket(
+            type=nrpc_py.SocketType.BIND,
+            protocol=protocol,
+            name=f'test_transport_server_py_{protocol.name}',
+            types=[
+                PingRequest,
+                [PingService, PingServer()]
+            ],
+            enable_publish=True,
+        )
+        sock2 = nrpc_py.RoutingSocket(
+            type=nrpc_py.SocketType.CONNECT,
+            protocol=protocol,
+            name=f'test_transport_client_py_{protocol.name}',
+            types=[
+                PingRequest,
+                [PingService, PingServer()]
+            ],
+            local_call_policy=nrpc_py.LocalCallPolicy.DISABLED,
+        )
+        sock1.bind('127.0.0.1', port)
+        sock2.connect('127.0.0.1', port)
+        client: PingService = sock2.cast(PingService)
+
+        count = 500
+        start = time.time()
+        for index in range(count):
+            resp = client.Ping(PingRequest(index=index, label=protocol.name))
+            assert resp.index == index and resp.label == protocol.name
+        elapsed = time.time() - start
+        print(f'{protocol.name} {count} calls, {elapsed / count * 1e6:.1f}us per call')
+
+        # Reverse direction and published events use the same transport
+        events = []
+        sock2.subscribe(PingRequest, events.append)
+        time.sleep(0.3)
+        client_id = sock1.server_socket.get_client_ids()[0]
+        resp = sock1.cast(PingService, client_id).Ping(PingRequest(index=-1))
+        assert resp.index == -1
+        sock1.publish(PingRequest(index=-2))
+        time.sleep(0.2)
+        assert len(events) == 1 and events[0].index == -2
+
+        sock2.close()
+        sock1.close()
+
+    def start(self):
+        self.run(nrpc_py.ProtocolType.TCP, 8914)
+        self.run(nrpc_py.ProtocolType.IPC, 8914)
+        self.run(nrpc_py.ProtocolType.INPROC, 8914)
+        print('ALL OK')
+
+
+if __name__ == '__main__':
+    nrpc_py.init()
+    app = TestApplication()
+    app.start()
@@ -0,0 +1,183 @@
+import os
+import json
+import time
+import base64
+import socket
+import struct
+import threading
+from nrpc_py.common_base import rpcclass
+import nrpc_py
+
+
+@rpcclass({
+    'index': 1,
+    'label': 2,
+})
+class WebItem:
+    index: int = 0
+    label: str = ''
+
+
+@rpcclass({
+    'Echo': 1,
+})
+class WebService:
+    def Echo(self, request: WebItem) -> WebItem:
+        pass
+
+
+class WebItemServer:
+    def Echo(self, request: WebItem) -> WebItem:
+        request.label = request.label.upper()
+        return request
+
+
+class WebClient:
+    """Minimal RFC 6455 client, frames sent by clients are masked."""
+    def __init__(self, port):
+        self.sock = socket.create_connection(('127.0.0.1', port))
+        key = base64.b64encode(os.urandom(16)).decode()
+        self.sock.sendall((
+            'GET /rpc HTTP/1.1\r\n'
+            f'Host: 127.0.0.1:{port}\r\n'
+            'Upgrade: websocket\r\n'
+            'Connection: Upgrade\r\n'
+            f'Sec-WebSocket-Key: {key}\r\n'
+            'Sec-WebSocket-Version: 13\r\n'
+            '\r\n'
+        ).encode())
+        response = b''
+        while b'\r\n\r\n' not in response:
+            response += self.sock.recv(1)
+        assert response.startswith(b'HTTP/1.1 101'), response
+        self.next_id = 0
+
+    def send_frame(self, opcode, payload, fin=True):
+        mask = os.urandom(4)
+        head = bytes([(0x80 if fin else 0) | opcode])
+        if len(payload) < 126:
+            head += bytes([0x80 | len(payload)])
+        elif len(payload) < 65536:
+            head += bytes([0x80 | 126]) + struct.pack('!H', len(payload))
+        else:
+            head += bytes([0x80 | 127]) + struct.pack('!Q', len(payload))
+        masked = bytes(x ^ mask[i % 4] for i, x in enumerate(payload))
+        self.sock.sendall(head + mask + masked)
+
+    def recv_exact(self, size):
+        data = b''
+        while len(data) < size:
+            part = self.sock.recv(size - len(data))
+            assert part
+            data += part
+        return data
+
+    def recv_frame(self):
+        head = self.recv_exact(2)
+        length = head[1] & 0x7f
+        if length == 126:
+            length = struct.unpack('!H', self.recv_exact(2))[0]
+        elif length == 127:
+            length = struct.unpack('!Q', self.recv_exact(8))[0]
+        return head[0] & 0x0f, self.recv_exact(length)
+
+    def call(self, method, params):
+        self.next_id += 1
+        self.send_frame(0x1, json.dumps({'id': self.next_id, 'method': method, 'params': params}).encode())
+        while True:
+            opcode, payload = self.recv_frame()
+            message = json.loads(payload)
+            if message.get('id') == self.next_id:
+                return message
+
+    def close(self):
+        self.send_frame(0x8, struct.pack('!H', 1000))
+        opcode, _ = self.recv_frame()
+        assert opcode == 0x8
+        self.sock.close()
+
+
+class TestApplication:
+    def start(self):
+        port = 8917
+        sock1 = nrpc_py.RoutingSocket(
+            type=nrpc_py.SocketType.BIND,
+            protocol=nrpc_py.ProtocolType.WS,
+            name='test_web_server_py',
+            types=[
+                WebItem,
+                [WebService, WebItemServer()]
+            ],
+        )
+        sock1.bind('127.0.0.1', port)
+
+        client = WebClient(port)
+        resp = client.call('WebService.Echo', {'index': 1, 'label': 'one'})
+        assert resp['result'] == {'index': 1, 'label': 'ONE'}, resp
+
+        # Schema messages are served like over ZMQ
+        resp = client.call(nrpc_py.RoutingMessage.GetSchema, {})
+        assert any(x['type_name'] == 'WebItem' for x in resp['result']['types'])
+        resp = client.call(nrpc_py.RoutingMessage.GetAppInfo, {})
+        assert resp['result']['client_count'] == 1, resp
+
+        # Fragmented message with a ping in between, and a large message
+        text = json.dumps({'id': 100, 'method': 'WebService.Echo', 'params': {'index': 2, 'label': 'frag'}}).encode()
+        client.send_frame(0x1, text[:10], fin=False)
+        client.send_frame(0x9, b'hello')
+        client.send_frame(0x0, text[10:])
+        assert client.recv_frame() == (0xA, b'hello')
+        assert json.loads(client.recv_frame()[1])['result']['label'] == 'FRAG'
+        resp = client.call('WebService.Echo', {'index': 3, 'label': 'x' * 100000})
+        assert len(resp['result']['label']) == 100000
+
+        # Failures are reported to the caller
+        resp = client.call('Unknown', {})
+        assert resp['code'] == 'failed', resp
+
+        # Many connections on one event loop
+        errors = []
+
+        def run_client(index):
+            try:
+                other = WebClient(port)
+                for step in range(20):
+                    resp = other.call('WebService.Echo', {'index': step, 'label': f'c{index}'})
+                    assert resp['result'] == {'index': step, 'label': f'C{index}'}
+                other.close()
+            except Exception as error:  # noqa
+                errors.append(error)
+
+        start = time.time()
+        threads = [threading.Thread(target=run_client, args=[x]) for x in range(50)]
+        for item in threads:
+            item.start()
+        for item in threads:
+            item.join()
+        print(f'WS 50 connections x 20 calls, {time.time() - start:.3f}s')
+        assert not errors, errors
+
+        # Pipelined messages above the in-flight limit wait for earlier responses, none are dropped
+        sock1.web_server.max_in_flight = 2
+        other = WebClient(port)
+        for index in range(20):
+            text = json.dumps({'id': index, 'method': 'WebService.Echo', 'params': {'index': index}})
+            other.send_frame(0x1, text.encode())
+        ids = sorted(json.loads(other.recv_frame()[1])['id'] for _ in range(20))
+        assert ids == list(range(20)), ids
+        other.close()
+
+        # Published events reach every connection
+        sock1.publish(WebItem(index=7, label='event'))
+        opcode, payload = client.recv_frame()
+        assert json.loads(payload) == {'event': 'WebItem', 'data': {'index': 7, 'label': 'event'}}
+
+        client.close()
+        sock1.close()
+        print('ALL OK')
+
+
+if __name__ == '__main__':
+    nrpc_py.init()
+    app = TestApplication()
+    app.start()